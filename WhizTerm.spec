@@ -20,7 +20,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=datas,
-    hiddenimports=['customtkinter', 'tkinter'],
+    hiddenimports=['customtkinter', 'tkinter', 'whizterm_client', 'whizterm_core', 'whizterm_gui'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,497 @@
+"""
+Banc d'essai des performances de WhizTerm
+
+Démarre un faux serveur Ollama local (/api/generate, /api/chat, /api/embed et /api/tags) dont la latence,
+le débit de tokens et le mode de streaming sont configurables, puis mesure :
+- process-command de bout en bout (et la latence du premier token) ;
+- extract_commands sur de grandes réponses ;
+- find_cask_name avec un faux `brew` ;
+- la recherche dans le cache sémantique (embeddings du faux serveur) ;
+- le routage entre un grand modèle lent et un petit modèle rapide, avec et sans budget de latence ;
+- le débit de OutputRedirector (si l'interface graphique est disponible) ;
+- le démarrage à froid de la ligne de commande.
+
+Les résultats sont écrits en JSON pour être comparés d'un commit à l'autre :
+
+    python benchmark.py --output avant.json
+    python benchmark.py --output apres.json --compare avant.json
+"""
+import contextlib
+import hashlib
+import io
+import json
+import math
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional
+
+import typer
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_RESPONSE = "Pour lister les fichiers du dossier courant :\n```\necho whizterm-bench\n```\n"
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # En-têtes et corps sont écrits séparément : sans TCP_NODELAY, l'ACK retardé ajoute ~40 ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data: dict):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self.send_json({"models": [{"name": name} for name in self.server.models]})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path == "/api/embed":
+            texts = request["input"] if isinstance(request["input"], list) else [request["input"]]
+            self.send_json({"model": request["model"], "embeddings": [fake_embedding(text) for text in texts]})
+            return
+        if self.path not in ("/api/generate", "/api/chat"):
+            self.send_error(404)
+            return
+        chat = self.path == "/api/chat"
+        server = self.server
+        server.request_count += 1
+        time.sleep(server.model_latency.get(request.get("model"), server.latency))
+        tokens = server.tokens()
+        stats = {"done": True, "eval_count": len(tokens), "eval_duration": int(server.token_delay * len(tokens) * 1e9)}
+
+        if not (request.get("stream") and server.stream):
+            time.sleep(server.token_delay * len(tokens))
+            text = "".join(tokens)
+            self.send_json({"message": {"role": "assistant", "content": text}, **stats} if chat else {"response": text, **stats})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for token in tokens:
+                if server.token_delay:
+                    time.sleep(server.token_delay)
+                chunk = {"message": {"role": "assistant", "content": token}} if chat else {"response": token}
+                self.send_chunk(json.dumps({**chunk, "done": False}).encode("utf-8") + b"\n")
+            self.send_chunk(json.dumps(stats).encode("utf-8") + b"\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Requête annulée par le client (repli sur un autre modèle)
+            self.close_connection = True
+
+def fake_embedding(text: str, size: int = 768) -> List[float]:
+    """Embedding déterministe : sac de mots et de trigrammes projetés par hachage"""
+    vector = [0.0] * size
+    words = re.findall(r"\w+", text.lower())
+    features = words + [word[i:i + 3] for word in words for i in range(max(1, len(word) - 2))]
+    for feature in features:
+        digest = hashlib.md5(feature.encode("utf-8")).digest()
+        vector[int.from_bytes(digest[:4], "little") % size] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """
+    Faux serveur Ollama
+    latency : délai avant le premier token (s) ; tokens_per_second : débit de génération
+    (0 pour aucune attente) ; stream : False pour répondre d'un bloc même en streaming ;
+    model_latency : délai propre à certains modèles.
+    """
+    daemon_threads = True
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        tokens_per_second: float = 200.0,
+        chunk_size: int = 4,
+        stream: bool = True,
+        response: str = DEFAULT_RESPONSE,
+        models: Optional[List[str]] = None,
+        model_latency: Optional[dict] = None
+    ):
+        super().__init__(("127.0.0.1", 0), FakeOllamaHandler)
+        self.latency = latency
+        self.token_delay = 1.0 / tokens_per_second if tokens_per_second > 0 else 0.0
+        self.chunk_size = chunk_size
+        self.stream = stream
+        self.response = response
+        self.models = models or ["mistral:latest"]
+        self.model_latency = model_latency or {}
+        self.request_count = 0
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def tokens(self) -> List[str]:
+        return [self.response[i:i + self.chunk_size] for i in range(0, len(self.response), self.chunk_size)]
+
+    def start(self) -> "FakeOllamaServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def summarize(samples: List[float], **extra) -> dict:
+    """Statistiques d'une série de mesures (secondes)"""
+    ordered = sorted(samples)
+    return {
+        "unit": "s",
+        "runs": len(samples),
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))],
+        "mean": statistics.fmean(ordered),
+        **extra
+    }
+
+def measure(fn: Callable[[], None], runs: int, warmup: int = 1) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def write_fake_brew(directory: str, casks: int) -> str:
+    """Crée un catalogue synthétique et un faux `brew` (info --json=v2 et search)"""
+    os.makedirs(directory, exist_ok=True)
+    names = ["google-chrome", "visual-studio-code", "telegram", "firefox", "spotify", "slack", "iterm2", "docker"]
+    names += [f"bench-app-{i:05d}" for i in range(casks)]
+    catalog = {
+        "formulae": [{"name": f"bench-tool-{i:05d}", "full_name": f"bench-tool-{i:05d}", "aliases": [], "desc": "Outil de test"} for i in range(casks)],
+        "casks": [{"token": token, "name": [token.replace("-", " ").title()], "desc": f"Application {token}"} for token in names]
+    }
+    catalog_path = os.path.join(directory, "catalog.json")
+    with open(catalog_path, "w", encoding="utf-8") as f:
+        json.dump(catalog, f)
+    with open(os.path.join(directory, "casks.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(names) + "\n")
+
+    brew = os.path.join(directory, "brew")
+    with open(brew, "w", encoding="utf-8") as f:
+        f.write(
+            "#!/bin/sh\n"
+            f'DIR="{directory}"\n'
+            'case "$1" in\n'
+            '  info) cat "$DIR/catalog.json" ;;\n'
+            '  search) [ "$2" = "--desc" ] && shift; echo "==> Casks"; grep -i -- "$2" "$DIR/casks.txt" | sed "s|^|homebrew/cask/|" ;;\n'
+            '  *) exit 1 ;;\n'
+            'esac\n'
+        )
+    os.chmod(brew, 0o755)
+    return brew
+
+def large_response(size: int) -> str:
+    """Réponse d'IA synthétique d'environ size caractères, avec texte, blocs de code et backticks"""
+    block = (
+        "Voici comment procéder, étape par étape, avec `ls` pour vérifier le résultat.\n"
+        "```\nbrew install --cask google-chrome\n```\n"
+        "Ensuite, ouvrez l'application depuis le dossier Applications.\n"
+    )
+    return block * max(1, size // len(block))
+
+class FakeTextWidget:
+    """Zone de texte factice (interface de customtkinter utilisée par OutputRedirector)"""
+    def __init__(self):
+        self.chunks = []
+
+    def after(self, ms, callback):
+        pass
+
+    def configure(self, **kwargs):
+        pass
+
+    def insert(self, index, text):
+        self.chunks.append(text)
+
+    def delete(self, start, end):
+        pass
+
+    def see(self, index):
+        pass
+
+def bench_process_command(whizterm, server: FakeOllamaServer, runs: int) -> dict:
+    results = {}
+    command = typer.main.get_command(whizterm.app)
+    for stream in (True, False):
+        args = ["process-command", "lister les fichiers", "--no-cache", "--no-intent", "--no-history", "--stream" if stream else "--no-stream"]
+        def run_once():
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                command.main(args=args, prog_name="whizterm", standalone_mode=False)
+            if "Erreur" in output.getvalue():
+                raise RuntimeError(output.getvalue())
+        results[f"process_command[{'stream' if stream else 'no-stream'}]"] = summarize(measure(run_once, runs))
+
+    ttft = []
+    def generate_once():
+        result = whizterm.generate_response(whizterm.CLI_SYSTEM_PROMPT, "lister les fichiers", "mistral", on_token=lambda token: None, use_cache=False)
+        ttft.append(result["ttft"] or result["total"])
+    results["generate_response[stream]"] = summarize(measure(generate_once, runs), ttft_median=statistics.median(ttft[1:] or ttft))
+    return results
+
+def bench_semantic_cache(whizterm, runs: int, entries: int) -> dict:
+    cache = whizterm.SemanticCache(model="bench-embed", max_entries=entries)
+    namespace = cache.namespace("mistral", whizterm.CLI_SYSTEM_PROMPT)
+    # Remplissage direct : store() compare chaque nouvelle réponse à toutes les autres
+    texts = [f"installer l'application numéro {index}" for index in range(entries)]
+    for index, vector in enumerate(whizterm.get_ollama_client().embed(texts, cache.model)):
+        cache.entries.append({"namespace": namespace, "intent": "install", "targets": [], "text": texts[index], "response": f"```\nbrew install --cask app-{index}\n```", "created": time.time(), "used": time.time(), "hits": 0})
+        cache.vectors.append(vector)
+    counter = iter(range(10 ** 9))
+
+    # Recherche complète : embedding de la demande (aller-retour HTTP) puis similarité
+    def lookup():
+        cache.lookup(namespace, f"installe l'application numéro {next(counter) % entries}")
+    # Similarité seule, sur la matrice des vecteurs
+    vector = cache.embed("installe l'application numéro 7")
+    def best():
+        with cache._lock:
+            cache._best(namespace, "install", set(), vector)
+    backend = cache.stats()["backend"]
+    return {
+        f"semantic_lookup[{entries}]": summarize(measure(lookup, runs), backend=backend),
+        f"semantic_similarity[{entries}]": summarize(measure(best, runs), backend=backend)
+    }
+
+def bench_routing(whizterm, server: FakeOllamaServer, runs: int) -> dict:
+    """Demande complexe : grand modèle lent (0.5 s avant le premier token), petit modèle rapide en repli"""
+    server.models = server.models + ["bench-small:latest", "bench-large:latest"]
+    server.model_latency.update({"bench-small": server.latency, "bench-large": server.latency + 0.5})
+    text = "écris un script qui parcourt tous les fichiers du dossier et affiche leur taille triée"
+    results = {}
+    for label, budget in (("sans budget", 0.0), ("budget 0.2 s", 0.2)):
+        router = whizterm.ModelRouter(["bench-small", "bench-large"], budget=budget)
+        whizterm._model_router = router
+        def generate_once():
+            whizterm.generate_response(whizterm.CLI_SYSTEM_PROMPT, text, on_token=lambda token: None, use_cache=False)
+        samples = measure(generate_once, runs)
+        results[f"routing[{label}]"] = summarize(samples, served=dict(router.served), hedged=router.hedged)
+    whizterm._model_router = None
+    return results
+
+def bench_extract_commands(whizterm, runs: int) -> dict:
+    results = {}
+    for size in (10_000, 1_000_000):
+        text = large_response(size)
+        label = f"{size // 1000} Ko" if size < 1_000_000 else f"{size // 1_000_000} Mo"
+        results[f"extract_commands[{label}]"] = summarize(
+            measure(lambda: whizterm.extract_commands(text), runs),
+            chars=len(text)
+        )
+    return results
+
+def bench_find_cask_name(whizterm, directory: str, runs: int, casks: int) -> dict:
+    write_fake_brew(directory, casks)
+    os.environ["PATH"] = directory + os.pathsep + os.environ.get("PATH", "")
+    queries = ["chrome", "visual studio code", "telegarm", "bench-app-04242"]
+
+    # Construction de l'index à partir de `brew info --json=v2 --eval-all`
+    index = whizterm.BrewIndex(path=os.path.join(directory, "brew_index.json.gz"), max_age=float("inf"))
+    build = summarize(measure(index.build, max(1, runs // 4), warmup=0), entries=len(index.entries))
+    whizterm._brew_index = index
+
+    def lookup():
+        for query in queries:
+            whizterm.find_cask_name(query)
+    def brew_search():
+        for query in queries:
+            whizterm.find_cask_name_with_brew_search(query)
+    return {
+        "brew_index.build": build,
+        "find_cask_name[index]": summarize(measure(lookup, runs), queries=len(queries)),
+        "find_cask_name[brew search]": summarize(measure(brew_search, max(1, runs // 4)), queries=len(queries))
+    }
+
+def bench_output_redirector(runs: int, lines: int, writers: int) -> dict:
+    try:
+        from whizterm_gui import OutputRedirector
+    except Exception as e:
+        return {"output_redirector": {"skipped": f"interface graphique indisponible: {e}"}}
+
+    line = "x" * 78 + "\n"
+    stats = []
+    def run_once():
+        redirector = OutputRedirector(FakeTextWidget())
+        done = threading.Event()
+        def writer():
+            for _ in range(lines // writers):
+                redirector.write(line)
+        threads = [threading.Thread(target=writer) for _ in range(writers)]
+        for thread in threads:
+            thread.start()
+        # Le thread principal joue le rôle de la boucle Tk : une trame toutes les frame_ms
+        while not done.is_set():
+            if not any(thread.is_alive() for thread in threads):
+                done.set()
+            redirector._flush_frame()
+            time.sleep(redirector.frame_ms / 1000)
+        stats.append(redirector.stats())
+    samples = measure(run_once, runs, warmup=0)
+    return {
+        "output_redirector": summarize(
+            samples,
+            lines=lines,
+            writers=writers,
+            lines_per_second=lines / statistics.median(samples),
+            flushes=statistics.median(s["flushes"] for s in stats),
+            dropped_chars=statistics.median(s["dropped_chars"] for s in stats)
+        )
+    }
+
+def bench_cold_start(runs: int, env: dict) -> dict:
+    env = dict(env, WHIZTERM_NO_DAEMON="1")
+    def help_once():
+        subprocess.run([sys.executable, os.path.join(ROOT, "whizterm.py"), "--help"], env=env, capture_output=True, check=True)
+    def list_models_once():
+        subprocess.run([sys.executable, os.path.join(ROOT, "whizterm.py"), "list-models"], env=env, capture_output=True, check=True)
+    return {
+        "cold_start[--help]": summarize(measure(help_once, runs)),
+        "cold_start[list-models]": summarize(measure(list_models_once, runs))
+    }
+
+def git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+        return result.stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """Compare les médianes à une exécution de référence ; retourne les régressions"""
+    regressions = []
+    sys.stderr.write(f"\nComparaison avec {baseline['meta'].get('commit') or 'la référence'} :\n")
+    for name, current in results["benchmarks"].items():
+        previous = baseline["benchmarks"].get(name)
+        if not previous or "median" not in current or "median" not in previous:
+            continue
+        ratio = current["median"] / previous["median"] if previous["median"] else float("inf")
+        marker = ""
+        if ratio > 1 + threshold:
+            marker = "  RÉGRESSION"
+            regressions.append(name)
+        sys.stderr.write(f"  {name:<32} {previous['median'] * 1000:10.2f} ms -> {current['median'] * 1000:10.2f} ms  ({ratio:5.2f}x){marker}\n")
+    return regressions
+
+def main(
+    output: str = typer.Option("-", "--output", "-o", help="Fichier de résultats JSON, - pour la sortie standard"),
+    compare_with: Optional[str] = typer.Option(None, "--compare", "-c", help="Résultats de référence à comparer"),
+    threshold: float = typer.Option(0.2, "--threshold", help="Ralentissement relatif toléré avant de signaler une régression"),
+    runs: int = typer.Option(10, "--runs", "-n", help="Nombre de mesures par banc"),
+    only: List[str] = typer.Option([], "--only", help="Bancs à exécuter (process, extract, cask, semantic, routing, output, startup)"),
+    latency: float = typer.Option(0.05, "--latency", help="Délai du faux serveur avant le premier token, en secondes"),
+    token_rate: float = typer.Option(200.0, "--token-rate", help="Débit de tokens du faux serveur (0 pour aucune attente)"),
+    chunk_size: int = typer.Option(4, "--chunk-size", help="Nombre de caractères par token"),
+    stream: bool = typer.Option(True, "--stream/--no-stream", help="Le faux serveur répond en streaming"),
+    casks: int = typer.Option(5000, "--casks", help="Taille du catalogue Homebrew synthétique"),
+    semantic_entries: int = typer.Option(2048, "--semantic-entries", help="Nombre de réponses validées dans le cache sémantique"),
+    lines: int = typer.Option(200_000, "--lines", help="Nombre de lignes écrites dans OutputRedirector"),
+    writers: int = typer.Option(4, "--writers", help="Nombre de threads écrivant dans OutputRedirector")
+):
+    """
+    Mesure les performances de WhizTerm avec un faux serveur Ollama
+    """
+    selected = set(only) or {"process", "extract", "cask", "semantic", "routing", "output", "startup"}
+    server = FakeOllamaServer(latency=latency, tokens_per_second=token_rate, chunk_size=chunk_size, stream=stream).start()
+    workdir = tempfile.mkdtemp(prefix="whizterm-bench-")
+
+    # Environnement isolé : données dans un répertoire temporaire, faux serveur Ollama
+    os.environ.update({
+        "OLLAMA_HOST": server.url,
+        "WHIZTERM_HOME": workdir,
+        "WHIZTERM_CACHE_FILE": "",
+        "WHIZTERM_SEMANTIC_FILE": "",
+        "WHIZTERM_NO_DAEMON": "1",
+        "HOMEBREW_PREFIX": workdir,
+        "HOMEBREW_CACHE": workdir
+    })
+    sys.path.insert(0, ROOT)
+    import whizterm_core as whizterm
+
+    benchmarks = {}
+    try:
+        if "process" in selected:
+            benchmarks.update(bench_process_command(whizterm, server, runs))
+        if "extract" in selected:
+            benchmarks.update(bench_extract_commands(whizterm, runs))
+        if "cask" in selected:
+            benchmarks.update(bench_find_cask_name(whizterm, os.path.join(workdir, "brew"), runs, casks))
+        if "semantic" in selected:
+            benchmarks.update(bench_semantic_cache(whizterm, runs, semantic_entries))
+        if "routing" in selected:
+            benchmarks.update(bench_routing(whizterm, server, runs))
+        if "output" in selected:
+            benchmarks.update(bench_output_redirector(max(1, runs // 4), lines, writers))
+        if "startup" in selected:
+            benchmarks.update(bench_cold_start(runs, dict(os.environ)))
+    finally:
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "server": {"latency": latency, "token_rate": token_rate, "chunk_size": chunk_size, "stream": stream}
+        },
+        "benchmarks": benchmarks
+    }
+
+    for name, result in benchmarks.items():
+        if "median" in result:
+            sys.stderr.write(f"{name:<32} médiane {result['median'] * 1000:10.2f} ms  p95 {result['p95'] * 1000:10.2f} ms\n")
+        else:
+            sys.stderr.write(f"{name:<32} ignoré ({result.get('skipped')})\n")
+
+    data = json.dumps(results, indent=2, ensure_ascii=False)
+    if output == "-":
+        sys.stdout.write(data + "\n")
+    else:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(data + "\n")
+
+    if compare_with:
+        with open(compare_with, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), threshold)
+        if regressions:
+            sys.stderr.write(f"{len(regressions)} régression(s) au-delà de {threshold:.0%}\n")
+            raise typer.Exit(1)
+
+if __name__ == "__main__":
+    typer.run(main)
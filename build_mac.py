@@ -58,6 +58,9 @@ def create_mac_app():
         '--hidden-import=rich',
         '--hidden-import=requests',
         '--hidden-import=python-dotenv',
+        '--hidden-import=whizterm_client',
+        '--hidden-import=whizterm_core',
+        '--hidden-import=whizterm_gui',
     ])
     
     # Ajouter les fichiers de données
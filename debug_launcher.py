@@ -22,13 +22,13 @@ try:
         log_file.write(f"Arguments: {sys.argv}\n")
 
     # Ici, importez et lancez votre application principale
-    from whizterm import app
+    from whizterm_core import app
     
     # Si l'application utilise typer
     if __name__ == "__main__":
         if len(sys.argv) <= 1:
             # Mode interactif
-            from whizterm import interactive_mode
+            from whizterm_core import interactive_mode
             interactive_mode()
         else:
             # Mode commande
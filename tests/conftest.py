@@ -0,0 +1,55 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import whizterm_core  # noqa: E402
+
+# Catalogue Homebrew minimal (format `brew info --json=v2`)
+CATALOG = {
+    "formulae": [
+        {"name": "node", "full_name": "node", "aliases": ["nodejs"], "desc": "Platform built on V8 to build network applications"},
+        {"name": "wget", "full_name": "wget", "aliases": [], "desc": "Internet file retriever"},
+        {"name": "docker", "full_name": "docker", "aliases": [], "desc": "Pack, ship and run any application as a container"},
+    ],
+    "casks": [
+        {"token": "google-chrome", "name": ["Google Chrome"], "desc": "Web browser"},
+        {"token": "firefox", "name": ["Mozilla Firefox"], "desc": "Web browser"},
+        {"token": "docker", "name": ["Docker Desktop"], "desc": "App to build and share containerised applications"},
+        {"token": "visual-studio-code", "name": ["Microsoft Visual Studio Code", "VS Code"], "desc": "Open-source code editor"},
+    ],
+}
+
+
+@pytest.fixture(autouse=True)
+def whizterm_home(tmp_path, monkeypatch):
+    """Répertoire de données temporaire, sans démon ni caches partagés d'un test à l'autre"""
+    home = tmp_path / "home"
+    home.mkdir()
+    monkeypatch.setenv("WHIZTERM_HOME", str(home))
+    monkeypatch.setenv("WHIZTERM_NO_DAEMON", "1")
+    monkeypatch.setenv("WHIZTERM_TRACE_FILE", "")
+    monkeypatch.setenv("WHIZTERM_APP_DIRS", str(tmp_path / "no-apps"))
+    monkeypatch.setenv("HOMEBREW_PREFIX", str(tmp_path / "no-homebrew"))
+    for name in ("_brew_index", "_app_index", "_intent_router", "_metrics"):
+        monkeypatch.setattr(whizterm_core, name, None)
+    return home
+
+
+@pytest.fixture
+def catalog_path(tmp_path):
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps(CATALOG), encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def brew_index(tmp_path, catalog_path, monkeypatch):
+    """Index Homebrew construit à partir du catalogue de test et utilisé par le routage des intentions"""
+    index = whizterm_core.BrewIndex(path=str(tmp_path / "brew_index.json.gz"), catalog_path=catalog_path)
+    index.build()
+    monkeypatch.setattr(whizterm_core, "_brew_index", index)
+    return index
@@ -0,0 +1,81 @@
+from whizterm_core import CommandHistory, ResponseCache, SemanticCache
+
+
+def test_response_cache_key_includes_history():
+    first = ResponseCache.make_key("mistral", "système", "et firefox aussi", [{"role": "user", "content": "installe chrome"}])
+    second = ResponseCache.make_key("mistral", "système", "et firefox aussi", [{"role": "user", "content": "installe slack"}])
+    assert first != second
+    assert ResponseCache.make_key("mistral", "système", "Installe  Chrome") == ResponseCache.make_key("mistral", "système", "installe chrome")
+
+
+def test_response_cache_lru_and_persistence(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = ResponseCache(max_entries=2, path=path)
+    for key in ("a", "b", "c"):
+        cache.put(key, f"réponse {key}")
+    assert cache.get("a") is None
+    assert cache.get("c") == "réponse c"
+    assert cache.stats()["evictions"] == 1
+
+    reloaded = ResponseCache(max_entries=2, path=path)
+    assert reloaded.get("b") == "réponse b"
+
+
+def test_response_cache_ttl():
+    cache = ResponseCache(ttl=60)
+    cache.put("clé", "réponse")
+    created, response = cache._entries["clé"]
+    cache._entries["clé"] = (created - 120, response)
+    assert cache.get("clé") is None
+
+
+def semantic_cache(monkeypatch) -> SemanticCache:
+    """Cache sémantique dont toutes les demandes ont le même embedding"""
+    cache = SemanticCache(threshold=0.9)
+    monkeypatch.setattr(cache, "embed", lambda text: [1.0, 0.0])
+    return cache
+
+
+def test_semantic_cache_requires_same_targets(monkeypatch):
+    cache = semantic_cache(monkeypatch)
+    namespace = cache.namespace("mistral", "système")
+    cache.store(namespace, "supprime le dossier build", "```\nrm -r build\n```")
+    assert cache.entries[0]["targets"] == ["build"]
+    assert cache.lookup(namespace, "supprime le dossier src") is None
+    assert cache.lookup(namespace, "supprime donc le dossier build")["response"] == "```\nrm -r build\n```"
+    assert cache.lookup(cache.namespace("llama3", "système"), "supprime le dossier build") is None
+
+
+def test_semantic_cache_requires_same_intent(monkeypatch):
+    cache = semantic_cache(monkeypatch)
+    namespace = cache.namespace("mistral", "système")
+    cache.store(namespace, "installe slack", "```\nbrew install --cask slack\n```")
+    assert cache.lookup(namespace, "désinstalle slack") is None
+    assert cache.lookup(namespace, "installer slack") is not None
+
+
+def test_semantic_cache_without_embeddings(monkeypatch):
+    cache = SemanticCache()
+    monkeypatch.setattr(cache, "embed", lambda text: None)
+    namespace = cache.namespace("mistral", "système")
+    cache.store(namespace, "installe slack", "```\nbrew install --cask slack\n```")
+    assert cache.entries == []
+    assert cache.lookup(namespace, "installe slack") is None
+
+
+def test_command_history_resolve_and_search(tmp_path):
+    history = CommandHistory(path=str(tmp_path / "history.sqlite3"))
+    try:
+        history.record("Installe Chrome", ["brew install --cask google-chrome"], "ai", exit_code=0)
+        history.record("supprime le dossier build", ["rm -r build"], "ai", exit_code=1)
+        history.record("installe firefox", ["brew install --cask firefox"], "ai", exit_code=None)
+        assert history.resolve("installe chrome") == ["brew install --cask google-chrome"]
+        # Dernière exécution en échec ou non exécutée : pas de réutilisation
+        assert history.resolve("supprime le dossier build") is None
+        assert history.resolve("installe firefox") is None
+        assert history.search("installe") == ["installe firefox", "Installe Chrome"]
+        assert history.search("dossier") == ["supprime le dossier build"]
+        assert history.complete("inst") == "installe firefox"
+    finally:
+        history.close()
+
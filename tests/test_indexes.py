@@ -0,0 +1,102 @@
+import os
+
+import whizterm_core
+from whizterm_core import BrewIndex, FileIndex, InstalledAppIndex, IntentRouter
+
+
+def test_brew_index_build_and_search(brew_index):
+    assert brew_index.loaded
+    assert brew_index.search("google-chrome")[0]["token"] == "google-chrome"
+    # Un mot du token suffit ("chrome" -> google-chrome), un nom aussi
+    assert brew_index.search("chrome", kind="cask")[0]["token"] == "google-chrome"
+    assert brew_index.search("vs code")[0]["token"] == "visual-studio-code"
+    # Faute de frappe
+    assert brew_index.search("firefx", kind="cask")[0]["token"] == "firefox"
+    # Description, en dernier recours
+    assert brew_index.search("retriever")[0]["token"] == "wget"
+    assert brew_index.search("introuvable-xyz") == []
+
+
+def test_brew_index_lookup_is_exact(brew_index):
+    assert [entry["token"] for entry in brew_index.lookup("Google Chrome")] == ["google-chrome"]
+    assert [entry["token"] for entry in brew_index.lookup("nodejs")] == ["node"]
+    assert {entry["type"] for entry in brew_index.lookup("docker")} == {"cask", "formula"}
+    assert brew_index.lookup("chrome") == []
+
+
+def test_brew_index_persistence(brew_index):
+    loaded = BrewIndex(path=brew_index.path)
+    assert loaded.load()
+    assert loaded.built_at == brew_index.built_at
+    assert loaded.lookup("firefox")[0]["type"] == "cask"
+    assert not loaded.is_stale()
+
+
+def test_brew_index_refresh_backoff(tmp_path):
+    index = BrewIndex(path=str(tmp_path / "index.json.gz"), catalog_path=str(tmp_path / "absent.json"))
+    index.refresh_in_background()
+    index._refresh_thread.join()
+    assert not index.loaded
+    thread = index._refresh_thread
+    # Échec récent : pas de nouvel essai avant RETRY_DELAY
+    index.refresh_in_background()
+    assert index._refresh_thread is thread
+
+
+def test_intent_router_requires_confirmed_target(brew_index):
+    router = IntentRouter()
+    assert router.route("installe google chrome").commands == ["brew install --cask google-chrome"]
+    assert router.route("installer wget").commands == ["brew install wget"]
+    # Cask et formule du même nom : ambigu, laissé au modèle
+    assert router.route("installe docker") is None
+    # Cible absente de l'index
+    assert router.route("installe chrome") is None
+
+
+def test_installed_app_index(tmp_path):
+    root = tmp_path / "Applications"
+    (root / "Google Chrome.app").mkdir(parents=True)
+    (root / ".hidden.app").mkdir()
+    (root / "notes.txt").write_text("")
+    index = InstalledAppIndex([str(root), str(tmp_path / "absent")])
+    assert [app["name"] for app in index.search("google chrome")] == ["Google Chrome"]
+    assert index.search("hidden") == []
+    assert index.path_of("Google Chrome") == str(root / "Google Chrome.app")
+
+    # Le répertoire a changé : l'index est reconstruit
+    (root / "Slack.app").mkdir()
+    os.utime(root, ns=(1, os.stat(root).st_mtime_ns + 1))
+    assert index.search("slak")[0]["name"] == "Slack"
+
+
+def test_find_installed_app_is_exact(tmp_path, monkeypatch):
+    root = tmp_path / "Applications"
+    (root / "Visual Studio Code.app").mkdir(parents=True)
+    monkeypatch.setattr(whizterm_core, "_app_index", InstalledAppIndex([str(root)]))
+    assert whizterm_core.find_installed_app("visual-studio-code") == "Visual Studio Code"
+    assert whizterm_core.find_installed_app("visual studio") is None
+
+
+def test_file_index_incremental(tmp_path):
+    root = tmp_path / "projet"
+    (root / "src").mkdir(parents=True)
+    (root / "src" / "rapport_final.txt").write_text("")
+    (root / "notes.md").write_text("")
+    (root / "node_modules" / "rapport").mkdir(parents=True)
+    index = FileIndex(str(root), str(tmp_path / "index.sqlite3"))
+    try:
+        assert index.refresh()["changed"] > 0
+        assert list(index.search("rapport")) == [str(root / "src" / "rapport_final.txt")]
+        assert list(index.search("*.md")) == [str(root / "notes.md")]
+        assert list(index.search("rapport", file_type="d")) == []
+
+        # Rien n'a changé : aucun répertoire relu
+        assert index.refresh()["changed"] == 0
+
+        (root / "src" / "rapport_final.txt").unlink()
+        (root / "src" / "autre_rapport.txt").write_text("")
+        os.utime(root / "src", ns=(1, os.stat(root / "src").st_mtime_ns + 1))
+        assert index.refresh()["changed"] == 1
+        assert list(index.search("rapport")) == [str(root / "src" / "autre_rapport.txt")]
+    finally:
+        index.close()
@@ -0,0 +1,33 @@
+import os
+
+from whizterm_core import command_resources, plan_commands
+
+
+def test_independent_file_commands_run_in_parallel(tmp_path):
+    commands = ["mkdir build", "mkdir dist", "touch notes.txt"]
+    assert plan_commands(commands, str(tmp_path)) == [set(), set(), set()]
+
+
+def test_same_path_is_ordered(tmp_path):
+    commands = ["mkdir build", "touch build/log.txt", "rm -r dist"]
+    assert plan_commands(commands, str(tmp_path)) == [set(), {0}, set()]
+
+
+def test_package_managers_are_barriers(tmp_path):
+    commands = ["brew install node", "npm install -g yarn", "pip install requests", "mkdir build"]
+    assert plan_commands(commands, str(tmp_path)) == [set(), {0}, {0, 1}, {0, 1, 2}]
+
+
+def test_unknown_and_stateful_commands_are_barriers(tmp_path):
+    # Chaque commande attend les barrières qui la précèdent (et, par elles, les autres commandes)
+    commands = ["mkdir a", "./configure", "mkdir b", "cd b", "mkdir c"]
+    assert plan_commands(commands, str(tmp_path)) == [set(), {0}, {1}, {0, 1, 2}, {1, 3}]
+
+
+def test_command_resources(tmp_path):
+    cwd = str(tmp_path)
+    assert command_resources("ls", cwd) == {("path", cwd)}
+    assert command_resources("cp a.txt b/", cwd) == {("path", os.path.join(cwd, "a.txt")), ("path", os.path.join(cwd, "b"))}
+    assert command_resources("echo ok > out.log", cwd) == {("path", os.path.join(cwd, "out.log"))}
+    assert command_resources("ls | xargs rm", cwd) is None
+    assert command_resources("echo 'non fermé", cwd) is None
@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pytest
+
+from whizterm_core import CancelToken, OperationCancelled, ShellSession
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="pseudo-terminal POSIX requis")
+
+
+@pytest.fixture
+def shell(tmp_path):
+    session = ShellSession(shell="/bin/sh", cwd=str(tmp_path))
+    yield session
+    session.close()
+
+
+def test_state_persists_between_commands(shell, tmp_path):
+    (tmp_path / "sub").mkdir()
+    assert shell.run("export WHIZTERM_TEST=persistant; cd sub").success
+    result = shell.run('echo "$WHIZTERM_TEST"; pwd')
+    assert result.stdout.split() == ["persistant", str(tmp_path / "sub")]
+    assert shell.cwd == str(tmp_path / "sub")
+
+
+def test_exit_code_and_streamed_output(shell):
+    chunks = []
+    result = shell.run("echo sortie; echo erreur >&2; exit_code() { return 3; }; exit_code", on_output=lambda line, stream: chunks.append(line))
+    assert result.returncode == 3
+    assert "sortie" in "".join(chunks) and "erreur" in result.stdout
+    # Le shell n'a pas été relancé : la fonction définie existe toujours
+    assert shell.run("exit_code").returncode == 3
+    assert shell.restarts == 0
+
+
+def test_commands_run_on_a_terminal(shell):
+    assert shell.run("test -t 0 && test -t 1").success
+
+
+def test_timeout_interrupts_command(shell):
+    result = shell.run("sleep 10", timeout=0.5)
+    assert result.timed_out and not result.success
+    assert shell.run("echo encore").stdout.strip() == "encore"
+
+
+def test_cancel(shell):
+    cancel = CancelToken()
+    cancel.cancel()
+    with pytest.raises(OperationCancelled):
+        shell.run("sleep 10", cancel=cancel)
+    assert shell.run("echo ok").success
+
+
+def test_restart_after_exit(shell):
+    shell.run("exit 0")
+    assert shell.run("echo relancé").stdout.strip() == "relancé"
+    assert os.path.isdir(shell.cwd)
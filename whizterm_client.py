@@ -0,0 +1,162 @@
+"""
+Client léger de WhizTerm : configuration, imports différés et transmission des commandes au démon
+Importé avant typer et le reste de whizterm_core : lorsque le démon est démarré,
+une commande lui est transmise sans charger ces modules.
+"""
+import time
+
+# Mesure du temps de démarrage (--startup-profile)
+_startup_start = time.perf_counter()
+
+import os
+import sys
+import importlib
+import threading
+import json
+import base64
+import socket
+from collections import OrderedDict
+from typing import Optional, List
+
+_startup_timings = OrderedDict()
+_startup_timings["stdlib"] = time.perf_counter() - _startup_start
+
+def lazy_import(name: str):
+    """
+    Importe un module à sa première utilisation
+    La durée de chaque import est enregistrée pour --startup-profile
+    """
+    module = sys.modules.get(name)
+    if module is None:
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        _startup_timings[name] = time.perf_counter() - start
+    elif getattr(getattr(module, "__spec__", None), "_initializing", False):
+        # Import en cours dans un autre thread : attendre qu'il soit terminé
+        module = importlib.import_module(name)
+    return module
+
+def print(*args, **kwargs):
+    """Affichage avec rich (importé à la première utilisation)"""
+    lazy_import("rich.console")
+    lazy_import("rich").print(*args, **kwargs)
+
+def escape(text: str) -> str:
+    """Échappe le balisage rich d'un texte"""
+    return lazy_import("rich.markup").escape(text)
+
+def get_base_path():
+    if getattr(sys, 'frozen', False):
+        return sys._MEIPASS
+    else:
+        return os.path.dirname(os.path.abspath(__file__))
+
+def debug_enabled() -> bool:
+    """Les messages de débogage ne sont affichés qu'avec --debug ou WHIZTERM_DEBUG=1"""
+    return os.getenv("WHIZTERM_DEBUG", "").lower() in ("1", "true", "yes")
+
+def debug(message: str):
+    if debug_enabled():
+        sys.stderr.write(f"[DEBUG] {message}\n")
+
+_config_loaded = False
+_config_lock = threading.Lock()
+
+def load_config():
+    """Charge le fichier .env une seule fois, à la première utilisation de la configuration"""
+    global _config_loaded
+    if _config_loaded:
+        return
+    with _config_lock:
+        if _config_loaded:
+            return
+        start = time.perf_counter()
+        base_path = get_base_path()
+        dotenv_path = os.path.join(base_path, '.env')
+
+        debug(f"Répertoire de travail actuel (CWD): {os.getcwd()}")
+        debug(f"Chemin de base détecté: {base_path}")
+        debug(f"Tentative de chargement de .env depuis: {dotenv_path}")
+
+        # Charger .env depuis le chemin correct
+        if os.path.exists(dotenv_path):
+            lazy_import("dotenv").load_dotenv(dotenv_path=dotenv_path)
+            debug("Fichier .env chargé.")
+        else:
+            debug("Fichier .env non trouvé au chemin attendu.")
+        _startup_timings["config"] = time.perf_counter() - start
+        _config_loaded = True
+
+# Contexte de la requête en cours (répertoire, environnement et entrée du client lorsque la commande vient du démon)
+_request_context = threading.local()
+
+def request_env() -> Optional[dict]:
+    """Environnement du client du démon pour la requête en cours, None hors du démon"""
+    return getattr(_request_context, "env", None)
+
+def config(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Retourne un paramètre de configuration (environnement ou .env, celui du client dans le démon)"""
+    load_config()
+    env = request_env()
+    return env.get(name, default) if env is not None else os.getenv(name, default)
+
+# Commandes transmises au démon `whizterm serve` lorsqu'il est en cours d'exécution
+DAEMON_COMMANDS = {"process-command", "search-files", "list-models"}
+# Options interactives (questions posées dans le terminal) : la commande s'exécute alors dans le processus courant
+INTERACTIVE_OPTIONS = {"--confirm"}
+
+def daemon_socket_path() -> str:
+    """Chemin du socket Unix du démon (WHIZTERM_SOCKET)"""
+    home = config("WHIZTERM_HOME", os.path.join(os.path.expanduser("~"), ".whizterm"))
+    return config("WHIZTERM_SOCKET", os.path.join(home, "whizterm.sock"))
+
+def forward_to_daemon(argv: List[str]) -> Optional[int]:
+    """
+    Client léger : transmet la commande au démon et relaie sa sortie
+    Retourne le code de sortie, ou None si le démon n'est pas disponible
+    (la commande est alors exécutée dans le processus courant).
+    """
+    if not argv or argv[0] not in DAEMON_COMMANDS or INTERACTIVE_OPTIONS.intersection(argv) or config("WHIZTERM_NO_DAEMON"):
+        return None
+    path = daemon_socket_path()
+    if not os.path.exists(path):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except OSError:
+        client.close()
+        return None
+
+    # L'environnement (.env compris, chargé par config) et l'entrée standard du client
+    # sont transmis au démon : les commandes s'y exécutent comme dans le processus courant
+    try:
+        stdin = sys.stdin.fileno()
+    except (AttributeError, OSError, ValueError):
+        stdin = None
+    request = {"argv": argv, "cwd": os.getcwd(), "env": dict(os.environ), "stdin": stdin is not None}
+    with client, client.makefile("rb") as responses:
+        client.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        if stdin is not None:
+            threading.Thread(target=_send_stdin, args=(client, stdin), daemon=True).start()
+        for line in responses:
+            message = json.loads(line)
+            if message["type"] == "exit":
+                return message["code"]
+            stream = sys.stderr if message["type"] == "stderr" else sys.stdout
+            stream.write(message["data"])
+            stream.flush()
+    # Connexion interrompue par le démon
+    return 1
+
+def _send_stdin(client, fd: int):
+    # Transmet l'entrée standard au démon par blocs encodés en base64 ; un bloc vide signale la fin
+    try:
+        while True:
+            data = os.read(fd, 65536)
+            message = {"type": "stdin", "data": base64.b64encode(data).decode("ascii")}
+            client.sendall(json.dumps(message).encode("utf-8") + b"\n")
+            if not data:
+                return
+    except OSError:
+        pass
@@ -0,0 +1,4322 @@
+import time
+
+_stdlib_start = time.perf_counter()
+
+import os
+import subprocess
+import shlex
+import re
+import sys
+import threading 
+import io
+import json
+import hashlib
+import unicodedata
+import math
+import operator
+import tempfile
+import queue
+import signal
+import selectors
+import codecs
+import gzip
+import bisect
+import difflib
+import shutil
+import fnmatch
+import contextlib
+import socket
+import base64
+from collections import OrderedDict, deque
+from typing import Optional, List, Callable
+
+from whizterm_client import (
+    DAEMON_COMMANDS,
+    _request_context,
+    _startup_timings,
+    config,
+    daemon_socket_path,
+    debug,
+    escape,
+    lazy_import,
+    print,
+    request_env,
+)
+
+_startup_timings["stdlib"] += time.perf_counter() - _stdlib_start
+
+_typer_start = time.perf_counter()
+import typer
+_startup_timings["typer"] = time.perf_counter() - _typer_start
+
+app = typer.Typer()
+
+def whizterm_home() -> str:
+    """Répertoire des données persistantes de WhizTerm (cache, index, historique)"""
+    return config("WHIZTERM_HOME", os.path.join(os.path.expanduser("~"), ".whizterm"))
+
+def request_cwd() -> str:
+    """Répertoire courant de la requête en cours"""
+    return getattr(_request_context, "cwd", None) or os.getcwd()
+
+# Attributs de _request_context propagés aux threads de travail
+REQUEST_CONTEXT_FIELDS = ("cwd", "env", "stdin")
+
+def current_request_context() -> tuple:
+    """
+    Contexte de la requête du thread courant : répertoire, environnement, entrée et flux
+    de sortie du client du démon. À rattacher aux threads de travail avec attach_request_context.
+    """
+    streams = tuple(
+        getattr(stream.local, "stream", None) if isinstance(stream, ThreadLocalStream) else None
+        for stream in (sys.stdout, sys.stderr)
+    )
+    return tuple(getattr(_request_context, field, None) for field in REQUEST_CONTEXT_FIELDS), streams
+
+@contextlib.contextmanager
+def attach_request_context(context: tuple):
+    """Exécute le bloc dans le contexte d'une requête capturé dans un autre thread"""
+    values, streams = context
+    previous = current_request_context()[0]
+    previous_streams = []
+    for field, value in zip(REQUEST_CONTEXT_FIELDS, values):
+        setattr(_request_context, field, value)
+    for stream, target in zip((sys.stdout, sys.stderr), streams):
+        if isinstance(stream, ThreadLocalStream):
+            previous_streams.append((stream, getattr(stream.local, "stream", None)))
+            stream.local.stream = target
+    try:
+        yield
+    finally:
+        for field, value in zip(REQUEST_CONTEXT_FIELDS, previous):
+            setattr(_request_context, field, value)
+        for stream, target in previous_streams:
+            stream.local.stream = target
+
+class OperationCancelled(Exception):
+    """Levée lorsqu'une opération en cours est annulée par l'utilisateur"""
+
+class CancelToken:
+    """
+    Jeton d'annulation partagé entre l'interface et une tâche en arrière-plan
+    Les callbacks enregistrés (fermeture d'une connexion, arrêt d'un processus)
+    sont appelés au moment de l'annulation.
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def register(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Enregistre un callback d'annulation et retourne la fonction pour le retirer"""
+        with self._lock:
+            already_cancelled = self._event.is_set()
+            if not already_cancelled:
+                self._callbacks.append(callback)
+        if already_cancelled:
+            callback()
+
+        def unregister():
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+        return unregister
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise OperationCancelled()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Attend l'annulation au plus timeout secondes ; retourne True si la tâche a été annulée"""
+        return self._event.wait(timeout)
+
+class Metrics:
+    """
+    Mesure de la durée de chaque étape d'une requête (spans)
+    Chaque span est agrégé en mémoire (histogrammes par étape, tokens Ollama), écrit dans
+    un fichier de traces JSONL (WHIZTERM_TRACE_FILE) et exportable au format texte Prometheus.
+    Les spans ouverts dans un même thread forment une trace : à la fermeture du span racine,
+    les écouteurs reçoivent la trace complète (barre d'état de l'interface graphique).
+    Les spans à écrire sont mis en attente sous le verrou et écrits à la fermeture du span racine,
+    hors de ce verrou : l'écriture sur disque ne bloque pas les spans des autres threads.
+    """
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, trace_path: Optional[str] = None, max_trace_bytes: int = 5 * 1024 * 1024):
+        self.trace_path = trace_path
+        self.max_trace_bytes = max_trace_bytes
+        self.stages = {}  # étape -> {"count", "sum", "max", "errors", "buckets"}
+        self.ttft = self._new_histogram()
+        self.tokens = {"prompt": 0, "eval": 0}
+        self.token_seconds = {"prompt": 0.0, "eval": 0.0}
+        self.last_tokens_per_second = None
+        self.listeners = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._trace_file = None
+        self._pending_traces = []  # lignes JSONL pas encore écrites
+        self._write_lock = threading.Lock()
+
+    def _new_histogram(self) -> dict:
+        return {"count": 0, "sum": 0.0, "max": 0.0, "errors": 0, "buckets": [0] * len(self.BUCKETS)}
+
+    @staticmethod
+    def _observe(histogram: dict, value: float, buckets: tuple):
+        histogram["count"] += 1
+        histogram["sum"] += value
+        histogram["max"] = max(histogram["max"], value)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                histogram["buckets"][i] += 1
+
+    def current(self) -> Optional[dict]:
+        """Span ouvert dans le thread courant (à transmettre aux threads de travail)"""
+        return getattr(self._local, "current", None)
+
+    @contextlib.contextmanager
+    def attach(self, span: Optional[dict]):
+        """Rattache les spans du thread courant à un span ouvert dans un autre thread"""
+        previous = getattr(self._local, "current", None)
+        self._local.current = span
+        try:
+            yield
+        finally:
+            self._local.current = previous
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attrs):
+        """
+        Mesure la durée du bloc ; les attributs peuvent être complétés via l'objet retourné
+        (ex: with metrics.span("llm", model=model) as attrs: attrs["eval_count"] = 42)
+        """
+        parent = getattr(self._local, "current", None)
+        record = {
+            "trace_id": parent["trace_id"] if parent else os.urandom(8).hex(),
+            "span_id": os.urandom(4).hex(),
+            "parent_id": parent["span_id"] if parent else None,
+            "name": name,
+            "start": time.time(),
+            "attrs": attrs
+        }
+        if parent is None:
+            record["children"] = []
+        record["root"] = parent["root"] if parent else record
+        self._local.current = record
+        start = time.perf_counter()
+        try:
+            yield attrs
+        except BaseException as e:
+            record["error"] = type(e).__name__
+            raise
+        finally:
+            record["duration"] = time.perf_counter() - start
+            self._local.current = parent
+            root = record.pop("root")
+            if parent is not None:
+                root["children"].append(record)
+            self.record(record)
+            if parent is None:
+                self.flush_traces()
+                for listener in list(self.listeners):
+                    try:
+                        listener(record)
+                    except Exception:
+                        pass
+
+    def record(self, span: dict, write: bool = True):
+        """Agrège un span terminé et l'écrit dans le fichier de traces"""
+        attrs = span.get("attrs") or {}
+        with self._lock:
+            stage = self.stages.setdefault(span["name"], self._new_histogram())
+            self._observe(stage, span["duration"], self.BUCKETS)
+            if span.get("error"):
+                stage["errors"] += 1
+            if attrs.get("ttft") is not None:
+                self._observe(self.ttft, attrs["ttft"], self.BUCKETS)
+            for kind in ("prompt", "eval"):
+                self.tokens[kind] += attrs.get(f"{kind}_eval_count" if kind == "prompt" else "eval_count") or 0
+                self.token_seconds[kind] += attrs.get(f"{kind}_eval_duration" if kind == "prompt" else "eval_duration") or 0.0
+            if attrs.get("tokens_per_second"):
+                self.last_tokens_per_second = attrs["tokens_per_second"]
+            if write and self.trace_path:
+                self._pending_traces.append({key: value for key, value in span.items() if key != "children"})
+
+    def flush_traces(self):
+        """Écrit les spans en attente dans le fichier de traces (hors du verrou des métriques)"""
+        with self._write_lock:
+            with self._lock:
+                spans, self._pending_traces = self._pending_traces, []
+            if spans and self.trace_path:
+                self._write_traces(spans)
+
+    def _write_traces(self, spans: List[dict]):
+        # Appelé avec _write_lock
+        try:
+            if self._trace_file is None:
+                os.makedirs(os.path.dirname(self.trace_path) or ".", exist_ok=True)
+                self._trace_file = open(self.trace_path, "a", encoding="utf-8")
+            self._trace_file.write("".join(json.dumps(line, ensure_ascii=False, default=str) + "\n" for line in spans))
+            self._trace_file.flush()
+            # Rotation : l'ancien fichier est conservé sous le suffixe .1
+            if self._trace_file.tell() > self.max_trace_bytes:
+                self._trace_file.close()
+                self._trace_file = None
+                os.replace(self.trace_path, self.trace_path + ".1")
+        except OSError as e:
+            debug(f"Écriture des traces impossible: {str(e)}")
+            self.trace_path = None
+
+    def load_traces(self, path: str) -> int:
+        """Agrège les spans d'un fichier de traces JSONL ; retourne le nombre de spans lus"""
+        count = 0
+        for candidate in (path + ".1", path):
+            if not os.path.exists(candidate):
+                continue
+            with open(candidate, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        span = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.record(span, write=False)
+                    count += 1
+        return count
+
+    def prometheus_text(self) -> str:
+        """Instantané des métriques au format texte Prometheus"""
+        lines = []
+        def histogram(metric: str, help_text: str, histograms: dict):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} histogram")
+            for labels, data in histograms.items():
+                prefix = f"{labels}," if labels else ""
+                for bound, count in zip(self.BUCKETS, data["buckets"]):
+                    lines.append(f'{metric}_bucket{{{prefix}le="{bound}"}} {count}')
+                lines.append(f'{metric}_bucket{{{prefix}le="+Inf"}} {data["count"]}')
+                suffix = f"{{{labels}}}" if labels else ""
+                lines.append(f"{metric}_sum{suffix} {data['sum']:.6f}")
+                lines.append(f"{metric}_count{suffix} {data['count']}")
+
+        with self._lock:
+            histogram(
+                "whizterm_stage_duration_seconds", "Durée des étapes de traitement",
+                {f'stage="{name}"': data for name, data in sorted(self.stages.items())}
+            )
+            lines.append("# HELP whizterm_stage_errors_total Étapes terminées par une erreur")
+            lines.append("# TYPE whizterm_stage_errors_total counter")
+            for name, data in sorted(self.stages.items()):
+                lines.append(f'whizterm_stage_errors_total{{stage="{name}"}} {data["errors"]}')
+            if self.ttft["count"]:
+                histogram("whizterm_llm_time_to_first_token_seconds", "Temps jusqu'au premier token", {"": self.ttft})
+            lines.append("# HELP whizterm_llm_tokens_total Tokens traités par Ollama")
+            lines.append("# TYPE whizterm_llm_tokens_total counter")
+            for kind in ("prompt", "eval"):
+                lines.append(f'whizterm_llm_tokens_total{{kind="{kind}"}} {self.tokens[kind]}')
+            lines.append("# HELP whizterm_llm_eval_seconds_total Temps de traitement des tokens rapporté par Ollama")
+            lines.append("# TYPE whizterm_llm_eval_seconds_total counter")
+            for kind in ("prompt", "eval"):
+                lines.append(f'whizterm_llm_eval_seconds_total{{kind="{kind}"}} {self.token_seconds[kind]:.6f}')
+            if self.last_tokens_per_second is not None:
+                lines.append("# HELP whizterm_llm_tokens_per_second Débit de génération de la dernière réponse")
+                lines.append("# TYPE whizterm_llm_tokens_per_second gauge")
+                lines.append(f"whizterm_llm_tokens_per_second {self.last_tokens_per_second:.2f}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict:
+        """Résumé par étape : nombre, durée moyenne et maximale, erreurs"""
+        with self._lock:
+            stages = {
+                name: {
+                    "count": data["count"],
+                    "mean": data["sum"] / data["count"] if data["count"] else 0.0,
+                    "max": data["max"],
+                    "errors": data["errors"]
+                }
+                for name, data in self.stages.items()
+            }
+            eval_seconds = self.token_seconds["eval"]
+            return {
+                "stages": stages,
+                "tokens": dict(self.tokens),
+                "tokens_per_second": self.tokens["eval"] / eval_seconds if eval_seconds else None
+            }
+
+def generation_metrics(result: dict) -> dict:
+    """Attributs de span d'une génération : ttft et statistiques d'Ollama (durées en secondes)"""
+    stats = result.get("stats") or {}
+    eval_count = stats.get("eval_count")
+    eval_duration = (stats.get("eval_duration") or 0) / 1e9
+    attrs = {
+        "ttft": result.get("ttft"),
+        "eval_count": eval_count,
+        "eval_duration": eval_duration,
+        "prompt_eval_count": stats.get("prompt_eval_count"),
+        "prompt_eval_duration": (stats.get("prompt_eval_duration") or 0) / 1e9
+    }
+    if eval_count and eval_duration:
+        attrs["tokens_per_second"] = eval_count / eval_duration
+    return attrs
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+def get_metrics() -> Metrics:
+    """Retourne le collecteur de métriques partagé (créé au premier appel)"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = Metrics(
+                trace_path=config("WHIZTERM_TRACE_FILE", os.path.join(whizterm_home(), "traces.jsonl")) or None,
+                max_trace_bytes=int(config("WHIZTERM_TRACE_MAX_BYTES", str(5 * 1024 * 1024)))
+            )
+        return _metrics
+
+OLLAMA_CONNECTION_ERROR = "Erreur: Impossible de se connecter à Ollama. Assurez-vous qu'Ollama est en cours d'exécution."
+
+class ModelNotFoundError(Exception):
+    """Levée lorsque le modèle demandé n'est pas installé dans Ollama"""
+    def __init__(self, model: str, available: List[str]):
+        self.model = model
+        self.available = available
+        listing = ", ".join(available) if available else "aucun"
+        super().__init__(f"modèle « {model} » introuvable (disponibles: {listing}). Installez-le avec : ollama pull {model}")
+
+class OllamaClient:
+    """
+    Client HTTP partagé par tous les appels à Ollama
+    Les connexions sont réutilisées (pool keep-alive), les timeouts sont bornés
+    et le modèle reste chargé entre deux requêtes grâce à keep_alive.
+    La configuration est lue dans l'environnement (.env) :
+    OLLAMA_HOST, OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT, OLLAMA_KEEP_ALIVE,
+    WHIZTERM_MODELS_TTL et WHIZTERM_MODELS_FILE pour le cache de la liste des modèles
+    """
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        keep_alive: Optional[str] = None,
+        pool_size: int = 10
+    ):
+        base_url = base_url or config("OLLAMA_HOST", "http://localhost:11434")
+        if "://" not in base_url:
+            base_url = f"http://{base_url}"
+        self.base_url = base_url.rstrip('/')
+        self.connect_timeout = connect_timeout if connect_timeout is not None else float(config("OLLAMA_CONNECT_TIMEOUT", "3"))
+        self.read_timeout = read_timeout if read_timeout is not None else float(config("OLLAMA_READ_TIMEOUT", "120"))
+        self.keep_alive = keep_alive or config("OLLAMA_KEEP_ALIVE", "30m")
+        pool_size = int(config("OLLAMA_POOL_SIZE", str(pool_size)))
+        self.catalog_ttl = float(config("WHIZTERM_MODELS_TTL", "60"))
+        self.catalog_path = config("WHIZTERM_MODELS_FILE", os.path.join(whizterm_home(), "models.json")) or None
+        self._catalog = None  # (date, modèles)
+        self._catalog_lock = threading.Lock()
+        self._warming = set()
+
+        requests = lazy_import("requests")
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @property
+    def timeout(self):
+        return (self.connect_timeout, self.read_timeout)
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def generate(
+        self,
+        prompt: str,
+        model: str = "mistral",
+        on_token: Optional[Callable[[str], None]] = None,
+        cancel: Optional[CancelToken] = None
+    ) -> dict:
+        """
+        Appelle /api/generate
+        Si on_token est fourni, la réponse est lue en streaming (NDJSON) et chaque fragment
+        est transmis dès sa réception. Le jeton cancel permet d'interrompre la lecture du flux.
+        Retourne la réponse complète, le temps jusqu'au premier token (ttft) et la durée totale en secondes
+        """
+        data = {"model": model, "prompt": prompt, "stream": on_token is not None, "keep_alive": self.keep_alive}
+        with get_metrics().span("llm", model=model, endpoint="generate", stream=on_token is not None) as attrs:
+            result = self._post("/api/generate", data, on_token, cancel)
+            attrs.update(generation_metrics(result))
+            return result
+
+    def chat(
+        self,
+        messages: List[dict],
+        model: str = "mistral",
+        on_token: Optional[Callable[[str], None]] = None,
+        cancel: Optional[CancelToken] = None
+    ) -> dict:
+        """
+        Appelle /api/chat avec l'historique de la conversation
+        Le préfixe commun (prompt système, tours précédents) reste dans le cache du modèle
+        entre deux requêtes : seuls les nouveaux messages sont évalués.
+        Même format de retour que generate.
+        """
+        data = {"model": model, "messages": messages, "stream": on_token is not None, "keep_alive": self.keep_alive}
+        with get_metrics().span("llm", model=model, endpoint="chat", stream=on_token is not None, messages=len(messages)) as attrs:
+            result = self._post("/api/chat", data, on_token, cancel)
+            attrs.update(generation_metrics(result))
+            return result
+
+    @staticmethod
+    def _content(chunk: dict) -> str:
+        """Texte d'une réponse ou d'un fragment (/api/generate ou /api/chat)"""
+        if "message" in chunk:
+            return chunk["message"].get("content", "")
+        return chunk.get("response", "")
+
+    @staticmethod
+    def _abort(response):
+        """
+        Interrompt la lecture d'une réponse en streaming depuis un autre thread
+        Fermer la réponse attendrait la fin de la lecture en cours (jusqu'au prochain fragment) :
+        la socket est coupée directement, ce qui débloque aussitôt le thread lecteur.
+        """
+        connection = getattr(response.raw, "_connection", None)
+        sock = getattr(connection, "sock", None)
+        if sock is None:
+            response.close()
+            return
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _post(
+        self,
+        path: str,
+        data: dict,
+        on_token: Optional[Callable[[str], None]],
+        cancel: Optional[CancelToken]
+    ) -> dict:
+        start = time.perf_counter()
+        if on_token is None:
+            response = self.session.post(self.url(path), json=data, timeout=self.timeout)
+            response.raise_for_status()
+            stats = response.json()
+            total = time.perf_counter() - start
+            return {"response": self._content(stats), "ttft": total, "total": total, "stats": stats}
+
+        ttft = None
+        parts = []
+        stats = {}
+        with self.session.post(self.url(path), json=data, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            # Couper la connexion à l'annulation débloque la lecture en cours
+            unregister = cancel.register(lambda: self._abort(response)) if cancel else None
+            try:
+                for line in response.iter_lines():
+                    if cancel:
+                        cancel.raise_if_cancelled()
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if "error" in chunk:
+                        raise RuntimeError(chunk["error"])
+                    token = self._content(chunk)
+                    if token:
+                        if ttft is None:
+                            ttft = time.perf_counter() - start
+                        parts.append(token)
+                        on_token(token)
+                    if chunk.get("done"):
+                        # Le dernier fragment contient les statistiques de génération
+                        stats = chunk
+                        break
+            except Exception:
+                if cancel:
+                    cancel.raise_if_cancelled()
+                raise
+            finally:
+                if unregister:
+                    unregister()
+        if cancel:
+            cancel.raise_if_cancelled()
+
+        return {
+            "response": "".join(parts),
+            "ttft": ttft,
+            "total": time.perf_counter() - start,
+            "stats": stats
+        }
+
+    def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        """
+        Calcule les embeddings des textes (/api/embed, un vecteur par texte)
+        Les versions d'Ollama sans /api/embed passent par /api/embeddings, un texte à la fois.
+        """
+        with get_metrics().span("embed", model=model, texts=len(texts)):
+            response = self.session.post(
+                self.url("/api/embed"),
+                json={"model": model, "input": texts, "keep_alive": self.keep_alive},
+                timeout=self.timeout
+            )
+            if response.status_code != 404 or "model" in response.text.lower():
+                response.raise_for_status()
+                return response.json()["embeddings"]
+            vectors = []
+            for text in texts:
+                response = self.session.post(
+                    self.url("/api/embeddings"),
+                    json={"model": model, "prompt": text, "keep_alive": self.keep_alive},
+                    timeout=self.timeout
+                )
+                response.raise_for_status()
+                vectors.append(response.json()["embedding"])
+            return vectors
+
+    def warm_up(self, model: str = "mistral"):
+        """Charge le modèle en mémoire (requête sans prompt) pour accélérer la première réponse"""
+        response = self.session.post(
+            self.url("/api/generate"),
+            json={"model": model, "keep_alive": self.keep_alive},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+
+    def warm_up_in_background(self, model: str = "mistral"):
+        """Précharge le modèle dans un thread, une seule fois par modèle et par processus"""
+        with self._catalog_lock:
+            if model in self._warming:
+                return
+            self._warming.add(model)
+
+        def run():
+            start = time.perf_counter()
+            try:
+                self.check_model(model)
+                self.warm_up(model)
+                debug(f"Modèle {model} préchargé en {time.perf_counter() - start:.2f} s")
+            except Exception as e:
+                debug(f"Préchargement du modèle {model} impossible: {str(e)}")
+                with self._catalog_lock:
+                    self._warming.discard(model)
+        threading.Thread(target=run, name="whizterm-warm-up", daemon=True).start()
+
+    def list_models(self, max_age: Optional[float] = None) -> List[dict]:
+        """
+        Retourne les modèles disponibles (/api/tags)
+        La liste est gardée en cache (en mémoire et sur disque) pendant max_age secondes
+        (WHIZTERM_MODELS_TTL par défaut, 0 pour forcer l'interrogation d'Ollama).
+        """
+        max_age = self.catalog_ttl if max_age is None else max_age
+        with self._catalog_lock:
+            if self._catalog is None:
+                self._catalog = self._load_catalog()
+            if self._catalog and time.time() - self._catalog[0] <= max_age:
+                return self._catalog[1]
+
+        response = self.session.get(self.url("/api/tags"), timeout=self.timeout)
+        response.raise_for_status()
+        models = response.json()["models"]
+        with self._catalog_lock:
+            self._catalog = (time.time(), models)
+        self._save_catalog(models)
+        return models
+
+    def _load_catalog(self) -> Optional[tuple]:
+        if not self.catalog_path or not os.path.exists(self.catalog_path):
+            return None
+        try:
+            with open(self.catalog_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("host") == self.base_url:
+                return (data["fetched_at"], data["models"])
+        except (OSError, ValueError, KeyError) as e:
+            debug(f"Cache des modèles illisible: {str(e)}")
+        return None
+
+    def _save_catalog(self, models: List[dict]):
+        if not self.catalog_path:
+            return
+        try:
+            directory = os.path.dirname(self.catalog_path) or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"host": self.base_url, "fetched_at": time.time(), "models": models}, f)
+            os.replace(tmp_path, self.catalog_path)
+        except OSError as e:
+            debug(f"Enregistrement du cache des modèles impossible: {str(e)}")
+
+    def check_model(self, model: str):
+        """
+        Vérifie que le modèle est installé avant d'envoyer un prompt (ModelNotFoundError sinon)
+        La liste en cache est rafraîchie une fois avant de conclure ; si Ollama ne répond pas,
+        la vérification est laissée à la requête elle-même.
+        """
+        def names(models: List[dict]) -> set:
+            found = set()
+            for entry in models:
+                found.add(entry["name"])
+                if entry["name"].endswith(":latest"):
+                    found.add(entry["name"][:-len(":latest")])
+            return found
+
+        try:
+            if model in names(self.list_models()):
+                return
+            models = self.list_models(max_age=0)
+        except Exception:
+            return
+        if model not in names(models):
+            raise ModelNotFoundError(model, sorted(entry["name"] for entry in models))
+
+_ollama_client = None
+_ollama_client_lock = threading.Lock()
+
+def get_ollama_client() -> OllamaClient:
+    """Retourne le client Ollama partagé (créé au premier appel)"""
+    global _ollama_client
+    with _ollama_client_lock:
+        if _ollama_client is None:
+            _ollama_client = OllamaClient()
+        return _ollama_client
+
+def normalize_prompt(text: str) -> str:
+    """Normalise une requête utilisateur (casse, espaces, ponctuation finale) pour le cache"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text.rstrip(' .!?')
+
+class ResponseCache:
+    """
+    Cache des réponses de l'IA pour les requêtes identiques
+    La clé combine le modèle, le prompt système et la requête normalisée.
+    Les entrées sont conservées en mémoire (LRU) et, si path est défini, sur disque.
+    Configuration : WHIZTERM_CACHE_SIZE (entrées), WHIZTERM_CACHE_MAX_BYTES,
+    WHIZTERM_CACHE_TTL (secondes), WHIZTERM_CACHE_FILE (vide pour désactiver la persistance)
+    """
+    def __init__(
+        self,
+        max_entries: int = 512,
+        max_bytes: int = 4 * 1024 * 1024,
+        ttl: float = 7 * 24 * 3600,
+        path: Optional[str] = None
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # clé -> (horodatage, réponse)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, user_text: str, history: Optional[List[dict]] = None) -> str:
+        """Clé d'une requête ; dans une conversation, l'historique envoyé au modèle en fait partie"""
+        parts = [model, system_prompt, normalize_prompt(user_text)]
+        if history:
+            parts.append(json.dumps(history, ensure_ascii=False, sort_keys=True))
+        return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            created, response = entry
+            if self.ttl and time.time() - created > self.ttl:
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return response
+
+    def put(self, key: str, response: str):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time(), response)
+            self._bytes += len(response.encode("utf-8"))
+            self._evict()
+            self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._save()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+    def _remove(self, key: str):
+        _, response = self._entries.pop(key)
+        self._bytes -= len(response.encode("utf-8"))
+
+    def _evict(self):
+        # Supprimer les entrées les moins récemment utilisées au-delà des limites
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            now = time.time()
+            for key, created, response in data.get("entries", []):
+                if self.ttl and now - created > self.ttl:
+                    continue
+                self._entries[key] = (created, response)
+                self._bytes += len(response.encode("utf-8"))
+            self._evict()
+        except Exception as e:
+            print(f"Erreur lors du chargement du cache: {str(e)}")
+            self._entries.clear()
+            self._bytes = 0
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            data = {"entries": [[key, created, response] for key, (created, response) in self._entries.items()]}
+            # Écriture atomique pour ne jamais laisser un fichier à moitié écrit
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Erreur lors de l'enregistrement du cache: {str(e)}")
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache() -> ResponseCache:
+    """Retourne le cache de réponses partagé (créé au premier appel)"""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(
+                max_entries=int(config("WHIZTERM_CACHE_SIZE", "512")),
+                max_bytes=int(config("WHIZTERM_CACHE_MAX_BYTES", str(4 * 1024 * 1024))),
+                ttl=float(config("WHIZTERM_CACHE_TTL", str(7 * 24 * 3600))),
+                path=config("WHIZTERM_CACHE_FILE", os.path.join(whizterm_home(), "response_cache.json")) or None
+            )
+        return _response_cache
+
+def optional_import(name: str):
+    """Importe un module facultatif ; retourne None s'il n'est pas installé"""
+    try:
+        return lazy_import(name)
+    except ImportError:
+        return None
+
+class SemanticCache:
+    """
+    Cache sémantique des réponses validées
+    Une demande formulée autrement (« installe chrome », « installer google chrome ») réutilise la réponse
+    d'une demande déjà exécutée avec succès si la similarité cosinus de leurs embeddings
+    (calculés par Ollama) atteint threshold et si IntentRouter leur reconnaît la même intention :
+    « désinstalle chrome », très proche, ne reçoit jamais la réponse d'« installe chrome ».
+    Les mots de la demande d'origine repris dans ses commandes (ses cibles : « build » dans
+    « supprime le dossier build » -> rm -r build) doivent aussi figurer dans la nouvelle demande :
+    « supprime le dossier src » ne reçoit jamais la réponse de « supprime le dossier build ».
+    Seules les réponses dont les commandes ont réussi sont enregistrées (store). Les vecteurs normalisés forment une matrice NumPy si NumPy est
+    installé (une multiplication matrice-vecteur par recherche), une liste sinon.
+    Configuration : WHIZTERM_SEMANTIC_CACHE (0 pour désactiver), WHIZTERM_EMBED_MODEL,
+    WHIZTERM_SEMANTIC_THRESHOLD, WHIZTERM_SEMANTIC_SIZE (entrées), WHIZTERM_SEMANTIC_TTL (secondes),
+    WHIZTERM_SEMANTIC_FILE (vide pour désactiver la persistance)
+    """
+    # Au-delà de cette similarité, une nouvelle réponse remplace l'entrée existante
+    DUPLICATE_SIMILARITY = 0.99
+    # Délai avant un nouvel essai quand le modèle d'embeddings ne répond pas
+    RETRY_DELAY = 60
+
+    def __init__(
+        self,
+        model: str = "nomic-embed-text",
+        threshold: float = 0.9,
+        max_entries: int = 2048,
+        ttl: float = 30 * 24 * 3600,
+        path: Optional[str] = None
+    ):
+        self.model = model
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.numpy = optional_import("numpy")
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.evictions = 0
+        self.entries = []  # {"namespace", "intent", "targets", "text", "response", "created", "used", "hits"}
+        self.vectors = []  # vecteurs normalisés, même ordre que entries
+        self._matrix = None  # matrice NumPy reconstruite après chaque modification
+        self._embeddings = OrderedDict()  # texte normalisé -> vecteur (derniers embeddings calculés)
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def namespace(model: str, system_prompt: str) -> str:
+        """Les réponses ne sont réutilisées que pour le même modèle et le même prompt système"""
+        return hashlib.sha256(f"{model}\x00{system_prompt}".encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def intent_of(text: str) -> Optional[str]:
+        """Intention de la demande selon les motifs d'IntentRouter (install, uninstall...), None sinon"""
+        matched = get_intent_router().match(text)
+        return matched[0] if matched else None
+
+    @staticmethod
+    def words_of(text: str) -> set:
+        """Mots (lettres et chiffres) d'une demande ou d'une commande, en minuscules"""
+        return {word for word in re.findall(r"\w+", normalize_prompt(text)) if len(word) > 1}
+
+    @classmethod
+    def targets_of(cls, text: str, response: str) -> List[str]:
+        """Mots de la demande repris dans les commandes de la réponse (paquets, fichiers, dossiers...)"""
+        commands = cls.words_of(" ".join(extract_commands(response)))
+        return sorted(cls.words_of(text) & commands)
+
+    def embed(self, text: str) -> Optional[list]:
+        """Vecteur normalisé de la demande, None si le modèle d'embeddings est indisponible"""
+        key = normalize_prompt(text)
+        with self._lock:
+            vector = self._embeddings.get(key)
+            if vector is not None:
+                self._embeddings.move_to_end(key)
+                return vector
+            if time.time() < self._retry_at:
+                return None
+        try:
+            vector = get_ollama_client().embed([key], self.model)[0]
+        except Exception as e:
+            debug(f"Embeddings indisponibles ({self.model}): {str(e)}")
+            with self._lock:
+                self.errors += 1
+                self._retry_at = time.time() + self.RETRY_DELAY
+            return None
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        vector = [value / norm for value in vector]
+        with self._lock:
+            self._embeddings[key] = vector
+            if len(self._embeddings) > 256:
+                self._embeddings.popitem(last=False)
+        return vector
+
+    def _best(self, namespace: str, intent: Optional[str], words: set, vector: list) -> tuple:
+        # Appelé avec le verrou : indice et similarité de l'entrée la plus proche de même intention
+        # dont toutes les cibles figurent dans la demande
+        candidates = [
+            index for index, entry in enumerate(self.entries)
+            if entry["namespace"] == namespace and entry["intent"] == intent and words.issuperset(entry["targets"])
+        ]
+        if not candidates or len(vector) != len(self.vectors[0]):
+            return None, 0.0
+        if self.numpy is not None:
+            if self._matrix is None:
+                self._matrix = self.numpy.array(self.vectors, dtype=self.numpy.float32)
+            similarities = (self._matrix @ self.numpy.array(vector, dtype=self.numpy.float32))[candidates]
+            best = int(similarities.argmax())
+            return candidates[best], float(similarities[best])
+        best, similarity = None, -1.0
+        for index in candidates:
+            value = sum(map(operator.mul, self.vectors[index], vector))
+            if value > similarity:
+                best, similarity = index, value
+        return best, similarity
+
+    def lookup(self, namespace: str, text: str) -> Optional[dict]:
+        """
+        Réponse validée la plus proche de la demande si sa similarité atteint le seuil
+        Retourne {"response", "similarity", "text"} ou None.
+        """
+        with get_metrics().span("semantic") as attrs:
+            vector = self.embed(text)
+            intent, words = self.intent_of(text), self.words_of(text)
+            with self._lock:
+                index, similarity = self._best(namespace, intent, words, vector) if vector is not None else (None, 0.0)
+                attrs["similarity"] = round(similarity, 4)
+                if index is not None and self.ttl and time.time() - self.entries[index]["created"] > self.ttl:
+                    self._remove(index)
+                    index = None
+                if index is None or similarity < self.threshold:
+                    self.misses += 1
+                    attrs["hit"] = False
+                    return None
+                entry = self.entries[index]
+                entry["used"] = time.time()
+                entry["hits"] += 1
+                self.hits += 1
+                attrs["hit"] = True
+                return {"response": entry["response"], "similarity": similarity, "text": entry["text"]}
+
+    def store(self, namespace: str, text: str, response: str):
+        """Enregistre la réponse validée d'une demande (remplace une entrée quasi identique)"""
+        vector = self.embed(text)
+        if vector is None:
+            return
+        intent, targets = self.intent_of(text), self.targets_of(text, response)
+        now = time.time()
+        with self._lock:
+            index, similarity = self._best(namespace, intent, self.words_of(text), vector)
+            if index is not None and similarity >= self.threshold and self.entries[index]["response"] == response:
+                # Demande déjà couverte par cette réponse
+                self.entries[index]["used"] = now
+            elif index is not None and similarity >= self.DUPLICATE_SIMILARITY:
+                self.entries[index].update(text=text, targets=targets, response=response, created=now, used=now)
+            else:
+                if self.vectors and len(vector) != len(self.vectors[0]):
+                    # Nouveau modèle d'embeddings : les anciens vecteurs ne sont plus comparables
+                    self.entries, self.vectors = [], []
+                self.entries.append({
+                    "namespace": namespace, "intent": intent, "targets": targets, "text": text, "response": response,
+                    "created": now, "used": now, "hits": 0
+                })
+                self.vectors.append(vector)
+                self._matrix = None
+                while len(self.entries) > self.max_entries:
+                    self._remove(min(range(len(self.entries)), key=lambda i: self.entries[i]["used"]))
+                    self.evictions += 1
+            self._save()
+
+    def _remove(self, index: int):
+        del self.entries[index]
+        del self.vectors[index]
+        self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self.entries, self.vectors = [], []
+            self._matrix = None
+            self.hits = self.misses = self.errors = self.evictions = 0
+            self._save()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+                "backend": "numpy" if self.numpy is not None else "python"
+            }
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        array, base64 = lazy_import("array"), lazy_import("base64")
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("model") != self.model:
+                return
+            for entry in data["entries"]:
+                # Vecteurs en float32 encodés en base64 : lisibles avec ou sans NumPy
+                vector = array.array("f")
+                vector.frombytes(base64.b64decode(entry.pop("vector")))
+                if "intent" not in entry:
+                    # Entrée enregistrée avant la comparaison des intentions
+                    entry["intent"] = self.intent_of(entry["text"])
+                if "targets" not in entry:
+                    entry["targets"] = self.targets_of(entry["text"], entry["response"])
+                self.entries.append(entry)
+                self.vectors.append(vector.tolist())
+        except (OSError, ValueError, KeyError) as e:
+            debug(f"Cache sémantique illisible: {str(e)}")
+            self.entries, self.vectors = [], []
+
+    def _save(self):
+        # Appelé avec le verrou ; écriture atomique (fichier temporaire puis remplacement)
+        if not self.path:
+            return
+        array, base64 = lazy_import("array"), lazy_import("base64")
+        try:
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            entries = [
+                dict(entry, vector=base64.b64encode(array.array("f", vector).tobytes()).decode("ascii"))
+                for entry, vector in zip(self.entries, self.vectors)
+            ]
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"model": self.model, "entries": entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            debug(f"Enregistrement du cache sémantique impossible: {str(e)}")
+
+_semantic_cache = None
+_semantic_cache_lock = threading.Lock()
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Retourne le cache sémantique partagé, None s'il est désactivé (WHIZTERM_SEMANTIC_CACHE=0)"""
+    global _semantic_cache
+    if config("WHIZTERM_SEMANTIC_CACHE", "1") == "0":
+        return None
+    with _semantic_cache_lock:
+        if _semantic_cache is None:
+            _semantic_cache = SemanticCache(
+                model=config("WHIZTERM_EMBED_MODEL", "nomic-embed-text"),
+                threshold=float(config("WHIZTERM_SEMANTIC_THRESHOLD", "0.9")),
+                max_entries=int(config("WHIZTERM_SEMANTIC_SIZE", "2048")),
+                ttl=float(config("WHIZTERM_SEMANTIC_TTL", str(30 * 24 * 3600))),
+                path=config("WHIZTERM_SEMANTIC_FILE", os.path.join(whizterm_home(), "semantic_cache.json")) or None
+            )
+        return _semantic_cache
+
+def remember_validated_response(system_prompt: str, model: str, user_text: str, response: str):
+    """Enregistre dans le cache sémantique une réponse dont les commandes ont réussi"""
+    semantic = get_semantic_cache()
+    if semantic is not None:
+        semantic.store(SemanticCache.namespace(model, system_prompt), user_text, response)
+
+def estimate_tokens(text: str) -> int:
+    """Estimation grossière du nombre de tokens d'un texte (environ 4 caractères par token)"""
+    return len(text) // 4 + 1
+
+class ChatSession:
+    """
+    Conversation avec le modèle via /api/chat
+    Le prompt système est envoyé en premier message, à l'identique d'une requête à l'autre,
+    pour qu'Ollama réutilise son évaluation ; l'historique des tours précédents est conservé
+    dans la limite de max_tokens (les tours les plus anciens sont retirés en premier).
+    Avec path, l'historique est enregistré pour être repris par un autre processus.
+    """
+    def __init__(self, system_prompt: str, model: str = "mistral", max_tokens: int = 2048, path: Optional[str] = None):
+        self.system_prompt = system_prompt
+        self.model = model
+        self.max_tokens = max_tokens
+        self.path = path
+        self.history = []  # [{"role": "user"|"assistant", "content": ...}]
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("system_prompt") == self.system_prompt:
+                self.history = data.get("history", [])
+                self.trim()
+        except (OSError, ValueError) as e:
+            debug(f"Session illisible ({self.path}): {str(e)}")
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"system_prompt": self.system_prompt, "model": self.model, "history": self.history}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            debug(f"Enregistrement de la session impossible: {str(e)}")
+
+    def clear(self):
+        with self._lock:
+            self.history = []
+            self.save()
+
+    def history_tokens(self) -> int:
+        return sum(estimate_tokens(message["content"]) for message in self.history)
+
+    def trim(self):
+        """Retire les tours les plus anciens tant que l'historique dépasse le budget de tokens"""
+        while self.history and self.history_tokens() > self.max_tokens:
+            # Retirer un tour complet (question et réponse)
+            del self.history[:2]
+
+    def messages(self, user_text: str) -> List[dict]:
+        return [{"role": "system", "content": self.system_prompt}] + self.history + [{"role": "user", "content": user_text}]
+
+    def record(self, user_text: str, response: str):
+        """Ajoute un tour à l'historique"""
+        with self._lock:
+            self.history.append({"role": "user", "content": user_text})
+            self.history.append({"role": "assistant", "content": response})
+            self.trim()
+            self.save()
+
+    def ask(
+        self,
+        user_text: str,
+        on_token: Optional[Callable[[str], None]] = None,
+        cancel: Optional[CancelToken] = None,
+        model: Optional[str] = None,
+        route: Optional["ModelRoute"] = None
+    ) -> dict:
+        """Envoie un message dans la conversation et enregistre la réponse (route : modèle choisi par le routeur)"""
+        with self._lock:
+            messages = self.messages(user_text)
+        if route is not None:
+            result = get_model_router().chat(messages, route, on_token, cancel)
+        else:
+            result = get_ollama_client().chat(messages, model or self.model, on_token, cancel)
+        if result["response"].strip():
+            self.record(user_text, result["response"])
+        return result
+
+_chat_sessions = {}
+_chat_sessions_lock = threading.Lock()
+
+def get_chat_session(name: str, system_prompt: str, model: str = "mistral") -> ChatSession:
+    """
+    Retourne la session nommée (enregistrée dans WHIZTERM_HOME/sessions)
+    Les sessions restent en mémoire pour les requêtes suivantes du même processus (démon).
+    """
+    key = (name, system_prompt)
+    with _chat_sessions_lock:
+        session = _chat_sessions.get(key)
+        if session is None:
+            safe_name = re.sub(r"[^\w.-]", "_", name)
+            session = ChatSession(
+                system_prompt,
+                model,
+                max_tokens=int(config("WHIZTERM_HISTORY_TOKENS", "2048")),
+                path=os.path.join(whizterm_home(), "sessions", f"{safe_name}.json")
+            )
+            _chat_sessions[key] = session
+        return session
+
+class ModelRoute:
+    """Modèle retenu pour une requête, modèle de repli plus léger et raison du choix"""
+    def __init__(self, model: str, fallback: Optional[str], reason: str):
+        self.model = model
+        self.fallback = fallback
+        self.reason = reason
+
+class ModelRouter:
+    """
+    Choix du modèle de chaque requête parmi des niveaux, du plus léger au plus capable
+    Une demande courte et simple va vers un modèle léger, une demande longue ou composée
+    vers le plus capable ; un modèle dont le temps jusqu'au premier token (p95 récent)
+    dépasse le budget de latence cède la place au niveau inférieur.
+    Si le premier token n'arrive pas dans le budget (ou en cas d'erreur), la même requête
+    part vers le modèle de repli et la première réponse l'emporte (requête couverte).
+    Les latences observées sont enregistrées dans stats_path pour les processus suivants.
+    Configuration : WHIZTERM_MODELS, WHIZTERM_LATENCY_BUDGET, WHIZTERM_ROUTE_WORDS
+    """
+    SAMPLES = 50  # latences conservées par modèle
+    HORIZON = 600.0  # âge maximal (s) d'une latence prise en compte
+
+    def __init__(self, tiers: List[str], budget: float = 5.0, complex_words: int = 20, stats_path: Optional[str] = None):
+        self.tiers = tiers
+        self.budget = budget
+        self.complex_words = max(1, complex_words)
+        self.stats_path = stats_path
+        self.samples = {}  # modèle -> deque de (horodatage, ttft)
+        self.served = {}  # modèle -> nombre de requêtes servies (depuis la création de stats_path)
+        self.hedged = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def default_model(self) -> str:
+        return self.tiers[-1]
+
+    def route(self, text: str, model: Optional[str] = None) -> ModelRoute:
+        """Choisit le modèle d'une demande (model impose le modèle, sans repli)"""
+        if model:
+            return ModelRoute(model, None, "imposé")
+        if len(self.tiers) == 1:
+            return ModelRoute(self.tiers[0], None, "unique")
+
+        complexity = min(1.0, len(text.split()) / self.complex_words)
+        if IntentRouter.COMPOUND.search(text):
+            complexity, reason = 1.0, "composée"
+        elif get_intent_router().classify(text):
+            complexity, reason = complexity / 2, "intention"
+        else:
+            reason = "longueur"
+        index = round(complexity * (len(self.tiers) - 1))
+        # Un modèle lent ces dernières minutes cède la place au niveau inférieur
+        while index > 0 and self.is_slow(self.tiers[index]) and not self.is_slow(self.tiers[index - 1]):
+            index, reason = index - 1, "latence"
+        fallback = self.tiers[index - 1] if index > 0 and self.budget > 0 else None
+        return ModelRoute(self.tiers[index], fallback, reason)
+
+    def percentile(self, model: str, fraction: float = 0.95) -> Optional[float]:
+        """Temps jusqu'au premier token récent du modèle (p95 par défaut), None sans mesure"""
+        horizon = time.time() - self.HORIZON
+        with self._lock:
+            values = sorted(ttft for at, ttft in self.samples.get(model, ()) if at >= horizon)
+        if not values:
+            return None
+        return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+    def is_slow(self, model: str) -> bool:
+        p95 = self.percentile(model)
+        return self.budget > 0 and p95 is not None and p95 > self.budget
+
+    def observe(self, model: str, ttft: float):
+        with self._lock:
+            self.samples.setdefault(model, deque(maxlen=self.SAMPLES)).append((time.time(), ttft))
+        self._save()
+
+    def chat(
+        self,
+        messages: List[dict],
+        route: ModelRoute,
+        on_token: Optional[Callable[[str], None]] = None,
+        cancel: Optional[CancelToken] = None
+    ) -> dict:
+        """
+        Appelle /api/chat avec le modèle de la route (repli éventuel sur route.fallback)
+        Même format de retour que OllamaClient.chat, avec le modèle qui a servi (model)
+        et hedged=True si le modèle de repli a été sollicité.
+        """
+        with get_metrics().span("route", model=route.model, fallback=route.fallback, reason=route.reason) as attrs:
+            if route.fallback:
+                result = self._hedged_chat(messages, route, on_token, cancel)
+            else:
+                result = self._call(route.model, messages, on_token, cancel)
+                result["model"], result["hedged"] = route.model, False
+            attrs.update(served=result["model"], hedged=result["hedged"])
+        with self._lock:
+            self.served[result["model"]] = self.served.get(result["model"], 0) + 1
+            self.hedged += result["hedged"]
+        self._save()
+        return result
+
+    def _call(self, model: str, messages: List[dict], on_token, cancel) -> dict:
+        client = get_ollama_client()
+        client.check_model(model)
+        result = client.chat(messages, model, on_token, cancel)
+        if result["ttft"] is not None:
+            self.observe(model, result["ttft"])
+        return result
+
+    def _hedged_chat(self, messages: List[dict], route: ModelRoute, on_token, cancel) -> dict:
+        """
+        Lance route.model, puis route.fallback si aucun token n'est arrivé dans le budget
+        Les fragments du premier modèle qui répond sont transmis, l'autre requête est annulée.
+        """
+        started = time.perf_counter()
+        events = queue.SimpleQueue()  # (modèle, "token" | "done" | "error")
+        parent_span = get_metrics().current()
+        attempts = {}
+        winner = []
+        lock = threading.Lock()
+
+        def launch(model: str):
+            attempt = {
+                "cancel": CancelToken(), "done": threading.Event(), "result": None, "error": None,
+                "first": False, "start": time.perf_counter()
+            }
+            attempts[model] = attempt
+
+            def forward(token: str):
+                with lock:
+                    if not winner:
+                        winner.append(model)
+                    won = winner[0] == model
+                if not won:
+                    attempt["cancel"].cancel()
+                    return
+                if not attempt["first"]:
+                    attempt["first"] = True
+                    events.put((model, "token"))
+                if on_token:
+                    on_token(token)
+
+            def run():
+                try:
+                    with get_metrics().attach(parent_span):
+                        attempt["result"] = self._call(model, messages, forward, attempt["cancel"])
+                except BaseException as e:
+                    attempt["error"] = e
+                    # Une requête abandonnée faute de premier token compte comme lente
+                    if isinstance(e, OperationCancelled) and not attempt["first"] and not (cancel and cancel.cancelled):
+                        self.observe(model, time.perf_counter() - attempt["start"])
+                attempt["done"].set()
+                events.put((model, "done" if attempt["error"] is None else "error"))
+            threading.Thread(target=run, name=f"whizterm-route-{model}", daemon=True).start()
+
+        def cancel_all():
+            for attempt in list(attempts.values()):
+                attempt["cancel"].cancel()
+
+        launch(route.model)
+        unregister = cancel.register(cancel_all) if cancel else None
+        try:
+            deadline = time.perf_counter() + self.budget
+            while not winner:
+                hedging = route.fallback in attempts
+                try:
+                    model, event = events.get(timeout=None if hedging else max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    debug(f"Pas de premier token de {route.model} en {self.budget:.1f} s : requête couverte par {route.fallback}")
+                    launch(route.fallback)
+                    continue
+                if event == "done":
+                    # Réponse vide : aucun fragment n'a désigné de gagnant
+                    with lock:
+                        if not winner:
+                            winner.append(model)
+                elif event == "error":
+                    if cancel:
+                        cancel.raise_if_cancelled()
+                    if not hedging:
+                        debug(f"Échec de {model} ({str(attempts[model]['error'])}) : repli sur {route.fallback}")
+                        launch(route.fallback)
+                    elif all(attempt["done"].is_set() for attempt in attempts.values()):
+                        raise attempts[route.model]["error"]
+            # La requête perdante est annulée dès son prochain fragment
+            for model, attempt in attempts.items():
+                if model != winner[0]:
+                    attempt["cancel"].cancel()
+            attempt = attempts[winner[0]]
+            attempt["done"].wait()
+            if attempt["error"] is not None:
+                if cancel:
+                    cancel.raise_if_cancelled()
+                raise attempt["error"]
+        finally:
+            if unregister:
+                unregister()
+            cancel_all()
+        # Durées vues par l'utilisateur, depuis le lancement de la première requête
+        result = attempt["result"]
+        if result["ttft"] is not None:
+            result["ttft"] += attempt["start"] - started
+        result["total"] = time.perf_counter() - started
+        result["model"] = winner[0]
+        result["hedged"] = route.fallback in attempts
+        return result
+
+    def stats(self) -> dict:
+        """Latences récentes (p50/p95 du premier token) et requêtes servies par modèle"""
+        models = {}
+        for model in dict.fromkeys(self.tiers + list(self.samples) + list(self.served)):
+            models[model] = {
+                "p50": self.percentile(model, 0.5),
+                "p95": self.percentile(model),
+                "served": self.served.get(model, 0)
+            }
+        return {"tiers": self.tiers, "budget": self.budget, "hedged": self.hedged, "models": models}
+
+    def _load(self):
+        if not self.stats_path or not os.path.exists(self.stats_path):
+            return
+        try:
+            with open(self.stats_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for model, samples in data.get("samples", {}).items():
+                self.samples[model] = deque((tuple(sample) for sample in samples), maxlen=self.SAMPLES)
+            self.served = data.get("served", {})
+            self.hedged = data.get("hedged", 0)
+        except Exception:
+            pass
+
+    def _save(self):
+        if not self.stats_path:
+            return
+        with self._lock:
+            data = {
+                "samples": {model: list(samples) for model, samples in self.samples.items()},
+                "served": self.served,
+                "hedged": self.hedged
+            }
+        try:
+            directory = os.path.dirname(self.stats_path) or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.stats_path)
+        except OSError as e:
+            debug(f"Enregistrement des latences impossible: {str(e)}")
+
+_model_router = None
+_model_router_lock = threading.Lock()
+
+def get_model_router() -> ModelRouter:
+    """
+    Retourne le routeur de modèles partagé
+    WHIZTERM_MODELS liste les modèles du plus léger au plus capable (mistral seul par défaut)
+    """
+    global _model_router
+    with _model_router_lock:
+        if _model_router is None:
+            tiers = [name.strip() for name in config("WHIZTERM_MODELS", "mistral").split(",") if name.strip()]
+            _model_router = ModelRouter(
+                tiers or ["mistral"],
+                budget=float(config("WHIZTERM_LATENCY_BUDGET", "5")),
+                complex_words=int(config("WHIZTERM_ROUTE_WORDS", "20")),
+                stats_path=os.path.join(whizterm_home(), "routing.json")
+            )
+        return _model_router
+
+class CommandHistory:
+    """
+    Historique persistant des demandes (SQLite) : texte saisi, commandes retenues,
+    code de sortie et durée de chaque exécution
+    Les demandes distinctes sont indexées par texte normalisé (recherche par préfixe)
+    et par trigrammes (recherche par sous-chaîne) pour rester rapides sur 100 000 entrées :
+    le trigramme le plus rare de la requête limite les demandes à vérifier ; une requête
+    fréquente parcourt les demandes les plus récentes et s'arrête aux premières trouvées.
+    Configuration : WHIZTERM_HISTORY_FILE (vide pour un historique en mémoire),
+    WHIZTERM_HISTORY_SIZE (nombre maximal d'exécutions conservées)
+    """
+    def __init__(self, path: Optional[str] = None, max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max_entries
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = lazy_import("sqlite3").connect(path or ":memory:", check_same_thread=False)
+        self._lock = threading.Lock()
+        if path:
+            # Une demande = une transaction : WAL évite d'attendre une synchronisation complète du disque
+            self.db.execute("PRAGMA journal_mode = WAL")
+            self.db.execute("PRAGMA synchronous = NORMAL")
+        with self._lock, self.db:
+            self.db.executescript("""
+                CREATE TABLE IF NOT EXISTS inputs (id INTEGER PRIMARY KEY, text TEXT UNIQUE, norm TEXT, last_used REAL, uses INTEGER);
+                CREATE INDEX IF NOT EXISTS inputs_norm ON inputs (norm);
+                CREATE INDEX IF NOT EXISTS inputs_last_used ON inputs (last_used);
+                CREATE TABLE IF NOT EXISTS runs (
+                    id INTEGER PRIMARY KEY, input_id INTEGER, created_at REAL, commands TEXT,
+                    source TEXT, exit_code INTEGER, duration REAL, cwd TEXT
+                );
+                CREATE INDEX IF NOT EXISTS runs_input ON runs (input_id, id);
+                CREATE TABLE IF NOT EXISTS input_trigrams (tri TEXT, input_id INTEGER);
+                CREATE INDEX IF NOT EXISTS input_trigrams_tri ON input_trigrams (tri, input_id);
+                CREATE INDEX IF NOT EXISTS input_trigrams_input ON input_trigrams (input_id);
+                CREATE TABLE IF NOT EXISTS trigram_counts (tri TEXT PRIMARY KEY, n INTEGER) WITHOUT ROWID;
+            """)
+            # Historique créé avant le comptage des trigrammes
+            if self.db.execute("SELECT 1 FROM trigram_counts LIMIT 1").fetchone() is None:
+                self.db.execute("INSERT INTO trigram_counts (tri, n) SELECT tri, COUNT(*) FROM input_trigrams GROUP BY tri")
+
+    def record(
+        self,
+        text: str,
+        commands: List[str],
+        source: str,
+        exit_code: Optional[int] = None,
+        duration: float = 0.0,
+        cwd: Optional[str] = None
+    ) -> int:
+        """
+        Enregistre une exécution ; exit_code vaut None si les commandes n'ont pas été exécutées
+        Retourne l'identifiant de l'exécution.
+        """
+        text = text.strip()
+        now = time.time()
+        with self._lock, self.db:
+            row = self.db.execute("SELECT id FROM inputs WHERE text = ?", (text,)).fetchone()
+            if row:
+                input_id = row[0]
+                self.db.execute("UPDATE inputs SET last_used = ?, uses = uses + 1 WHERE id = ?", (now, input_id))
+            else:
+                norm = normalize_prompt(text)
+                input_id = self.db.execute(
+                    "INSERT INTO inputs (text, norm, last_used, uses) VALUES (?, ?, ?, 1)", (text, norm, now)
+                ).lastrowid
+                input_trigrams = trigrams(norm)
+                self.db.executemany(
+                    "INSERT INTO input_trigrams (tri, input_id) VALUES (?, ?)",
+                    [(tri, input_id) for tri in input_trigrams]
+                )
+                self.db.executemany(
+                    "INSERT INTO trigram_counts (tri, n) VALUES (?, 1) ON CONFLICT (tri) DO UPDATE SET n = n + 1",
+                    [(tri,) for tri in input_trigrams]
+                )
+            run_id = self.db.execute(
+                "INSERT INTO runs (input_id, created_at, commands, source, exit_code, duration, cwd) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (input_id, now, json.dumps(commands, ensure_ascii=False), source, exit_code, duration, cwd)
+            ).lastrowid
+            if run_id % 1000 == 0:
+                self._prune()
+        return run_id
+
+    def _prune(self):
+        # Appelé avec le verrou : supprime les exécutions les plus anciennes au-delà de max_entries
+        self.db.execute("DELETE FROM runs WHERE id <= (SELECT MAX(id) FROM runs) - ?", (self.max_entries,))
+        orphans = "SELECT id FROM inputs WHERE id NOT IN (SELECT input_id FROM runs)"
+        self.db.executemany("UPDATE trigram_counts SET n = n - ? WHERE tri = ?", [
+            (count, tri) for tri, count in
+            self.db.execute(f"SELECT tri, COUNT(*) FROM input_trigrams WHERE input_id IN ({orphans}) GROUP BY tri")
+        ])
+        self.db.execute(f"DELETE FROM input_trigrams WHERE input_id IN ({orphans})")
+        self.db.execute(f"DELETE FROM inputs WHERE id IN ({orphans})")
+
+    def resolve(self, text: str) -> Optional[List[str]]:
+        """
+        Commandes de la dernière exécution de cette demande si elle a réussi
+        (une résolution qui a échoué la dernière fois n'est pas réutilisée)
+        """
+        with self._lock:
+            row = self.db.execute("""
+                SELECT runs.commands, runs.exit_code FROM inputs
+                JOIN runs ON runs.input_id = inputs.id
+                WHERE inputs.norm = ? ORDER BY runs.id DESC LIMIT 1
+            """, (normalize_prompt(text),)).fetchone()
+        if row is None or row[1] != 0:
+            return None
+        return json.loads(row[0]) or None
+
+    def search(self, query: str = "", limit: int = 50, window: int = 2000, max_count: int = 2000) -> List[str]:
+        """
+        Demandes distinctes contenant query, les plus récentes d'abord
+        Les demandes qui commencent par query passent avant les autres.
+        """
+        norm = normalize_prompt(query)
+        with self._lock:
+            rarest, count = self._rarest_trigram(norm)
+            results = []
+            if rarest is None or count >= max_count:
+                # Requête courte ou fréquente : les demandes récentes suffisent presque toujours
+                results = [text for (text,) in self.db.execute("""
+                    SELECT text FROM (SELECT text, norm FROM inputs ORDER BY last_used DESC LIMIT ?)
+                    WHERE instr(norm, ?) > 0 LIMIT ?
+                """, (window, norm, limit))]
+            if rarest is not None and len(results) < limit:
+                if results and (limit - len(results)) * window / len(results) < count:
+                    # Demandes trouvées assez denses : poursuivre le parcours par date coûte moins cher
+                    rows = self.db.execute(
+                        "SELECT text FROM inputs INDEXED BY inputs_last_used WHERE instr(norm, ?) > 0 ORDER BY last_used DESC LIMIT ?",
+                        (norm, limit)
+                    )
+                else:
+                    # Seules les demandes qui contiennent le trigramme le plus rare de la requête sont vérifiées
+                    rows = self.db.execute("""
+                        SELECT text FROM input_trigrams JOIN inputs ON inputs.id = input_trigrams.input_id
+                        WHERE tri = ? AND instr(norm, ?) > 0 ORDER BY last_used DESC LIMIT ?
+                    """, (rarest, norm, limit))
+                found = set(results)
+                results += [text for (text,) in rows if text not in found][:limit - len(results)]
+        prefix = query.strip().casefold()
+        return sorted(results, key=lambda text: not text.casefold().startswith(prefix))
+
+    def complete(self, prefix: str, max_candidates: int = 200) -> Optional[str]:
+        """Demande la plus récente qui commence par prefix (saisie semi-automatique)"""
+        if not prefix.strip():
+            return None
+        norm = normalize_prompt(prefix)
+        bounds = (norm, norm + "\U0010ffff")
+        with self._lock:
+            # Préfixe rare : les demandes qui le prolongent sont lues par l'index puis triées par date
+            rows = self.db.execute(
+                "SELECT text, last_used FROM inputs INDEXED BY inputs_norm WHERE norm >= ? AND norm < ? LIMIT ?",
+                (*bounds, max_candidates)
+            ).fetchall()
+            if len(rows) < max_candidates:
+                candidates = [text for text, _ in sorted(rows, key=lambda row: -row[1])]
+            else:
+                # Préfixe fréquent : les demandes récentes en contiennent, le parcours s'arrête à la première
+                candidates = (text for (text,) in self.db.execute(
+                    "SELECT text FROM inputs INDEXED BY inputs_last_used WHERE norm >= ? AND norm < ? ORDER BY last_used DESC",
+                    bounds
+                ))
+            # Le texte normalisé ignore la casse : la complétion doit prolonger la saisie telle quelle
+            for text in candidates:
+                if text.casefold().startswith(prefix.casefold()) and len(text) > len(prefix):
+                    return text
+        return None
+
+    def _rarest_trigram(self, norm: str) -> tuple:
+        # Appelé avec le verrou : trigramme le moins fréquent de la requête et son nombre de demandes
+        query_trigrams = list(trigrams(norm))
+        if not query_trigrams:
+            return None, 0
+        placeholders = ",".join("?" * len(query_trigrams))
+        counts = dict(self.db.execute(f"SELECT tri, n FROM trigram_counts WHERE tri IN ({placeholders})", query_trigrams))
+        rarest = min(query_trigrams, key=lambda tri: counts.get(tri, 0))
+        return rarest, counts.get(rarest, 0)
+
+    def runs(self, query: str = "", limit: int = 20) -> List[dict]:
+        """Dernières exécutions (filtrées par sous-chaîne), les plus récentes d'abord"""
+        sql = """
+            SELECT inputs.text, runs.created_at, runs.commands, runs.source, runs.exit_code, runs.duration, runs.cwd
+            FROM runs JOIN inputs ON inputs.id = runs.input_id
+        """
+        params = ()
+        norm = normalize_prompt(query)
+        if norm:
+            sql += " WHERE instr(inputs.norm, ?) > 0"
+            params = (norm,)
+        with self._lock:
+            rows = self.db.execute(sql + " ORDER BY runs.id DESC LIMIT ?", (*params, limit)).fetchall()
+        return [
+            {
+                "input": text, "created_at": created_at, "commands": json.loads(commands), "source": source,
+                "exit_code": exit_code, "duration": duration, "cwd": cwd
+            }
+            for text, created_at, commands, source, exit_code, duration, cwd in rows
+        ]
+
+    def stats(self) -> dict:
+        with self._lock:
+            runs, failed = self.db.execute("SELECT COUNT(*), SUM(exit_code != 0) FROM runs").fetchone()
+            inputs = self.db.execute("SELECT COUNT(*) FROM inputs").fetchone()[0]
+            sources = dict(self.db.execute("SELECT source, COUNT(*) FROM runs GROUP BY source").fetchall())
+        return {"runs": runs, "inputs": inputs, "failed": failed or 0, "sources": sources}
+
+    def clear(self):
+        with self._lock, self.db:
+            self.db.executescript("DELETE FROM input_trigrams; DELETE FROM trigram_counts; DELETE FROM runs; DELETE FROM inputs;")
+
+    def close(self):
+        self.db.close()
+
+_command_history = None
+_command_history_lock = threading.Lock()
+
+def get_command_history() -> CommandHistory:
+    """Retourne l'historique des demandes partagé (créé au premier appel)"""
+    global _command_history
+    with _command_history_lock:
+        if _command_history is None:
+            _command_history = CommandHistory(
+                path=config("WHIZTERM_HISTORY_FILE", os.path.join(whizterm_home(), "history.sqlite3")) or None,
+                max_entries=int(config("WHIZTERM_HISTORY_SIZE", "100000"))
+            )
+        return _command_history
+
+def history_reuse_enabled() -> bool:
+    """Réutilisation des résolutions de l'historique (WHIZTERM_HISTORY_REUSE, activée par défaut)"""
+    return config("WHIZTERM_HISTORY_REUSE", "1") != "0"
+
+def history_exit_code(results: list) -> Optional[int]:
+    """Code de sortie global d'une exécution (None si aucune commande n'a été exécutée)"""
+    if not results:
+        return None
+    for result in results:
+        if result is None or result is False:
+            return 1
+        if getattr(result, "success", True) is False:
+            return result.returncode or 1
+    return 0
+
+def generate_response(
+    system_prompt: str,
+    user_text: str,
+    model: Optional[str] = None,
+    on_token: Optional[Callable[[str], None]] = None,
+    use_cache: bool = True,
+    label: str = "Commande utilisateur",
+    cancel: Optional[CancelToken] = None,
+    session: Optional[ChatSession] = None
+) -> dict:
+    """
+    Génère la réponse de l'IA pour une requête utilisateur en passant par le cache de réponses
+    Une réponse en cache est renvoyée sans appeler Ollama (cached=True).
+    Avec use_cache=False, le cache est ignoré en lecture mais mis à jour avec la nouvelle réponse.
+    Avec une session, la requête s'inscrit dans la conversation : la réponse dépendant
+    de l'historique, la clé du cache en tient compte.
+    Le cache sémantique (réponses dont les commandes ont réussi) est consulté ensuite, à chaque tour ;
+    semantic contient alors la similarité et la demande d'origine.
+    Sans model, le routeur de modèles choisit le modèle de la demande ; model contient
+    le modèle qui a servi la réponse, hedged indique un repli sur un modèle plus léger.
+    """
+    route = get_model_router().route(user_text, model)
+    model = route.model
+    cache = get_response_cache()
+    history = list(session.history) if session is not None else None
+    key = cache.make_key(model, system_prompt, user_text, history)
+    if use_cache:
+        start = time.perf_counter()
+        with get_metrics().span("cache") as attrs:
+            cached = cache.get(key)
+            attrs["hit"] = cached is not None
+        if cached is not None:
+            if on_token:
+                on_token(cached)
+            if session is not None:
+                session.record(f"{label}: {user_text}", cached)
+            elapsed = time.perf_counter() - start
+            return {
+                "response": cached, "ttft": elapsed, "total": elapsed, "stats": {},
+                "cached": True, "semantic": None, "model": model, "hedged": False
+            }
+
+    # Une demande formulée autrement réutilise la réponse validée la plus proche
+    semantic = get_semantic_cache() if use_cache else None
+    if semantic is not None:
+        start = time.perf_counter()
+        match = semantic.lookup(SemanticCache.namespace(model, system_prompt), user_text)
+        if match is not None:
+            if on_token:
+                on_token(match["response"])
+            if session is not None:
+                session.record(f"{label}: {user_text}", match["response"])
+            elapsed = time.perf_counter() - start
+            return {
+                "response": match["response"], "ttft": elapsed, "total": elapsed, "stats": {},
+                "cached": True, "semantic": match, "model": model, "hedged": False
+            }
+
+    if session is not None:
+        result = session.ask(f"{label}: {user_text}", on_token, cancel, route=route)
+    else:
+        # Prompt système en message séparé : son évaluation est réutilisée d'une requête à l'autre
+        messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": f"{label}: {user_text}"}]
+        result = get_model_router().chat(messages, route, on_token, cancel)
+    result["cached"] = False
+    result["semantic"] = None
+    if result["response"].strip():
+        cache.put(cache.make_key(result["model"], system_prompt, user_text, history), result["response"])
+    return result
+
+# Prompt système de la ligne de commande
+CLI_SYSTEM_PROMPT = """Tu es un assistant terminal AI qui aide à exécuter des commandes et gérer des fichiers.
+        Tu peux aider à :
+        - Rechercher des fichiers
+        - Exécuter des commandes système
+        - Créer ou modifier des fichiers
+        - Installer des applications
+        
+        IMPORTANT : 
+        - Réponds de manière concise et directe
+        - Pour toute commande système à exécuter, place-la entre triple backticks (```)
+        - Ne demande pas de confirmation à l'utilisateur
+        - Exécute directement les commandes nécessaires pour accomplir la tâche demandée
+        - Ne mets pas de texte avant ou après les backticks de la commande
+        - Pour les installations sur macOS, utilise toujours brew
+        - Pour les applications GUI sur macOS, utilise toujours brew --cask
+        - Pour désinstaller une application, utilise toujours la commande appropriée
+        - Si l'installation nécessite des étapes supplémentaires, indique-les clairement"""
+
+def call_ollama_api(prompt: str, model: str = "mistral", on_token: Optional[Callable[[str], None]] = None):
+    """
+    Appelle l'API Ollama
+    Si on_token est fourni, la réponse est lue en streaming et transmise fragment par fragment
+    """
+    requests = lazy_import("requests")
+    try:
+        return get_ollama_client().generate(prompt, model, on_token)["response"]
+    except requests.exceptions.ConnectionError:
+        return OLLAMA_CONNECTION_ERROR
+    except Exception as e:
+        return f"Erreur lors de l'appel à Ollama: {str(e)}"
+
+# Étiquettes de langage ignorées en tête d'un bloc de code (```bash)
+FENCE_LANGUAGE_TAGS = {
+    "bash", "sh", "shell", "zsh", "fish", "ksh", "console", "terminal", "shellscript",
+    "sh-session", "cmd", "powershell", "ps1", "text", "plaintext"
+}
+
+class CommandStreamParser:
+    """
+    Extraction incrémentale des commandes d'une réponse de l'IA
+    Le texte est fourni fragment par fragment (feed) ; chaque bloc ```...``` est renvoyé
+    dès que sa fermeture est reçue, sans l'étiquette de langage éventuelle (```bash).
+    Les commandes entre backticks simples ne servent qu'en l'absence de tout bloc :
+    elles sont renvoyées à la fin du texte (close).
+    """
+    def __init__(self):
+        self.text = ""
+        self.fences = 0
+        self._pos = 0
+        self._block_start = None
+
+    def feed(self, chunk: str) -> List[str]:
+        """Ajoute un fragment et retourne les commandes dont le bloc vient de se fermer"""
+        self.text += chunk
+        commands = []
+        while True:
+            fence = self.text.find("```", self._pos)
+            if fence < 0:
+                # Les deux derniers caractères peuvent être le début d'une clôture
+                self._pos = max(self._pos, len(self.text) - 2)
+                return commands
+            self._pos = fence + 3
+            if self._block_start is None:
+                self._block_start = self._pos
+                continue
+            self.fences += 1
+            command = self.clean(self.text[self._block_start:fence])
+            self._block_start = None
+            if command:
+                commands.append(command)
+
+    def close(self) -> List[str]:
+        """Fin du texte : retourne les commandes en ligne s'il n'y a eu aucun bloc"""
+        if self.fences:
+            return []
+        return [command.strip() for command in re.findall(r'`(.*?)`', self.text) if command.strip()]
+
+    @staticmethod
+    def clean(block: str) -> str:
+        """Nettoie le contenu d'un bloc et retire son étiquette de langage"""
+        first, newline, rest = block.partition("\n")
+        if newline and first.strip().lower() in FENCE_LANGUAGE_TAGS and rest.strip():
+            block = rest
+        return block.strip()
+
+def extract_commands(text: str) -> List[str]:
+    """
+    Extrait les commandes du texte généré par l'IA
+    """
+    with get_metrics().span("extract", chars=len(text)) as attrs:
+        parser = CommandStreamParser()
+        commands = parser.feed(text) + parser.close()
+        attrs["commands"] = len(commands)
+        return commands
+
+def kill_process_tree(process: subprocess.Popen):
+    """Tue un processus lancé dans sa propre session ainsi que tous ses enfants"""
+    try:
+        os.killpg(os.getpgid(process.pid), signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, OSError):
+        process.kill()
+
+# Au-delà de cette longueur, une ligne sans fin est transmise par morceaux
+MAX_LINE_CHARS = 64 * 1024
+
+class OutputCapture:
+    """
+    Capture de la sortie d'une commande en mémoire bornée
+    Tant que la sortie tient dans max_chars caractères, elle est gardée entière. Au-delà,
+    seuls le début et la fin (anneau) restent en mémoire et le flux complet est écrit
+    dans un fichier journal (path), quelle que soit la quantité produite.
+    Configuration : WHIZTERM_CAPTURE_CHARS, WHIZTERM_LOG_DIR, WHIZTERM_LOG_KEEP (journaux conservés)
+    """
+    def __init__(self, name: str = "stdout", max_chars: Optional[int] = None, log_dir: Optional[str] = None):
+        self.name = name
+        self.max_chars = max_chars if max_chars is not None else int(config("WHIZTERM_CAPTURE_CHARS", str(256 * 1024)))
+        self.log_dir = log_dir or config("WHIZTERM_LOG_DIR", os.path.join(whizterm_home(), "logs"))
+        self.total_chars = 0
+        self.path = None
+        self._chunks = []
+        self._head = ""
+        self._tail = deque()
+        self._tail_chars = 0
+        self._file = None
+
+    @property
+    def truncated(self) -> bool:
+        return self.path is not None
+
+    @property
+    def omitted_chars(self) -> int:
+        return self.total_chars - len(self._head) - self._tail_chars if self.truncated else 0
+
+    def write(self, text: str):
+        if not text:
+            return
+        self.total_chars += len(text)
+        if self._file is not None:
+            self._file.write(text)
+            self._append_tail(text)
+        elif self.total_chars <= self.max_chars:
+            self._chunks.append(text)
+        else:
+            self._chunks.append(text)
+            self._spill()
+
+    def _spill(self):
+        # Tout le flux est encore en mémoire : l'écrire dans le journal puis ne garder que début et fin
+        text = "".join(self._chunks)
+        self._chunks = []
+        try:
+            os.makedirs(self.log_dir, exist_ok=True)
+            fd, self.path = tempfile.mkstemp(dir=self.log_dir, prefix=time.strftime("%Y%m%d-%H%M%S-"), suffix=f"-{self.name}.log")
+            self._file = os.fdopen(fd, "w", encoding="utf-8", errors="replace")
+            prune_logs(self.log_dir)
+        except OSError as e:
+            debug(f"Journal de sortie impossible: {str(e)}")
+            self.path = ""
+            self._file = open(os.devnull, "w")
+        self._file.write(text)
+        head_chars = self.max_chars // 2
+        self._head = text[:head_chars]
+        self._append_tail(text[head_chars:])
+
+    def _append_tail(self, text: str):
+        limit = self.max_chars - len(self._head)
+        if len(text) >= limit:
+            self._tail.clear()
+            self._tail.append(text[-limit:])
+            self._tail_chars = limit
+            return
+        self._tail.append(text)
+        self._tail_chars += len(text)
+        while self._tail_chars > limit:
+            excess = self._tail_chars - limit
+            first = self._tail[0]
+            if len(first) <= excess:
+                self._tail.popleft()
+                self._tail_chars -= len(first)
+            else:
+                self._tail[0] = first[excess:]
+                self._tail_chars -= excess
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+    @property
+    def text(self) -> str:
+        """Sortie capturée (début, indication des caractères omis et fin si elle a été tronquée)"""
+        if not self.truncated:
+            return "".join(self._chunks)
+        location = f", sortie complète : {self.path}" if self.path else ""
+        return f"{self._head}\n[... {self.omitted_chars} caractères omis{location} ...]\n{''.join(self._tail)}"
+
+def prune_logs(log_dir: str, keep: Optional[int] = None):
+    """Supprime les journaux de sortie les plus anciens au-delà de keep (WHIZTERM_LOG_KEEP)"""
+    keep = keep if keep is not None else int(config("WHIZTERM_LOG_KEEP", "50"))
+    try:
+        logs = sorted(
+            (entry for entry in os.scandir(log_dir) if entry.name.endswith(".log")),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in logs[:-keep] if keep > 0 else logs:
+            os.remove(entry.path)
+    except OSError as e:
+        debug(f"Nettoyage des journaux impossible: {str(e)}")
+
+class CommandResult:
+    """Résultat structuré de l'exécution d'une commande"""
+    def __init__(
+        self,
+        command: str,
+        returncode: int,
+        duration: float,
+        stdout: str = "",
+        stderr: str = "",
+        stdout_bytes: int = 0,
+        stderr_bytes: int = 0,
+        timed_out: bool = False,
+        stdout_log: Optional[str] = None,
+        stderr_log: Optional[str] = None
+    ):
+        self.command = command
+        self.returncode = returncode
+        self.duration = duration
+        self.stdout = stdout
+        self.stderr = stderr
+        self.stdout_bytes = stdout_bytes
+        self.stderr_bytes = stderr_bytes
+        self.timed_out = timed_out
+        # Journaux de la sortie complète lorsqu'elle dépasse la capture en mémoire
+        self.stdout_log = stdout_log
+        self.stderr_log = stderr_log
+
+    @property
+    def success(self) -> bool:
+        return self.returncode == 0 and not self.timed_out
+
+    @property
+    def logs(self) -> List[str]:
+        return [path for path in (self.stdout_log, self.stderr_log) if path]
+
+    def to_dict(self) -> dict:
+        return {
+            "command": self.command,
+            "returncode": self.returncode,
+            "duration": self.duration,
+            "stdout_bytes": self.stdout_bytes,
+            "stderr_bytes": self.stderr_bytes,
+            "timed_out": self.timed_out,
+            "stdout_log": self.stdout_log,
+            "stderr_log": self.stderr_log
+        }
+
+def get_command_timeout() -> Optional[float]:
+    """Durée maximale d'exécution d'une commande (WHIZTERM_COMMAND_TIMEOUT, 0 pour aucune limite)"""
+    timeout = float(config("WHIZTERM_COMMAND_TIMEOUT", "600"))
+    return timeout if timeout > 0 else None
+
+def run_command(
+    command: str,
+    cwd: Optional[str] = None,
+    on_output: Optional[Callable[[str, str], None]] = None,
+    timeout: Optional[float] = None,
+    cancel: Optional[CancelToken] = None,
+    stdin=subprocess.DEVNULL
+) -> CommandResult:
+    """
+    Exécute une commande shell en transmettant sa sortie ligne par ligne
+    on_output(ligne, flux) est appelé dès qu'une ligne est produite ("stdout" ou "stderr"),
+    dans l'ordre d'arrivée. Au-delà de timeout secondes, le processus et ses enfants sont tués
+    (timed_out=True). Si le jeton cancel est annulé, ils sont tués et OperationCancelled est levée.
+    """
+    with get_metrics().span("command", command=command[:200]) as attrs:
+        result = _run_command(command, cwd, on_output, timeout, cancel, stdin)
+        attrs.update({key: value for key, value in result.to_dict().items() if key != "command"})
+        return result
+
+def _run_command(command, cwd, on_output, timeout, cancel, stdin) -> CommandResult:
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        command,
+        shell=True,
+        # Dans le démon, l'entrée héritée est celle du client
+        stdin=stdin if stdin is not None else getattr(_request_context, "stdin", None),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd or request_cwd(),
+        env=request_env(),
+        start_new_session=True
+    )
+    unregister = cancel.register(lambda: kill_process_tree(process)) if cancel else None
+
+    captured = {"stdout": OutputCapture("stdout"), "stderr": OutputCapture("stderr")}
+    byte_counts = {"stdout": 0, "stderr": 0}
+    partial = {"stdout": "", "stderr": ""}
+    decoders = {name: codecs.getincrementaldecoder("utf-8")(errors="replace") for name in captured}
+
+    def emit(name: str, text: str, final: bool):
+        buffer = partial[name] + text
+        lines = buffer.splitlines(keepends=True)
+        # Garder la dernière ligne incomplète jusqu'au prochain fragment (dans la limite de MAX_LINE_CHARS)
+        if lines and not final and not lines[-1].endswith(("\n", "\r")) and len(lines[-1]) < MAX_LINE_CHARS:
+            partial[name] = lines.pop()
+        else:
+            partial[name] = ""
+        for line in lines:
+            captured[name].write(line)
+            if on_output:
+                on_output(line, name)
+
+    timed_out = False
+    deadline = start + timeout if timeout else None
+    selector = selectors.DefaultSelector()
+    selector.register(process.stdout, selectors.EVENT_READ, "stdout")
+    selector.register(process.stderr, selectors.EVENT_READ, "stderr")
+    try:
+        while selector.get_map():
+            remaining = None if deadline is None else deadline - time.perf_counter()
+            if remaining is not None and remaining <= 0:
+                timed_out = True
+                kill_process_tree(process)
+                break
+            for key, _ in selector.select(timeout=remaining):
+                name = key.data
+                data = os.read(key.fd, 65536)
+                if data:
+                    byte_counts[name] += len(data)
+                    emit(name, decoders[name].decode(data), final=False)
+                else:
+                    selector.unregister(key.fileobj)
+                    emit(name, decoders[name].decode(b"", final=True), final=True)
+    finally:
+        selector.close()
+        process.stdout.close()
+        process.stderr.close()
+        process.wait()
+        for capture in captured.values():
+            capture.close()
+        if unregister:
+            unregister()
+
+    if cancel:
+        cancel.raise_if_cancelled()
+    return CommandResult(
+        command,
+        process.returncode,
+        time.perf_counter() - start,
+        stdout=captured["stdout"].text,
+        stderr=captured["stderr"].text,
+        stdout_bytes=byte_counts["stdout"],
+        stderr_bytes=byte_counts["stderr"],
+        timed_out=timed_out,
+        stdout_log=captured["stdout"].path or None,
+        stderr_log=captured["stderr"].path or None
+    )
+
+class ShellSession:
+    """
+    Shell persistant dont les commandes s'exécutent sur un pseudo-terminal
+    Un seul shell est lancé : répertoire courant, variables exportées, alias et fonctions
+    sont conservés d'une commande à l'autre, sans coût de démarrage. Le shell lit les commandes
+    dans un tube (il reste non interactif : ni invite ni écho) ; chaque commande a le pseudo-terminal
+    pour entrée et sorties, les outils se comportent donc comme dans un terminal.
+    La fin d'une commande est repérée par une sentinelle (jeton aléatoire, code de sortie, répertoire).
+    Au-delà du délai ou à l'annulation, la commande reçoit SIGINT ; si le shell ne rend pas la main,
+    il est tué puis relancé dans le dernier répertoire connu (les variables et alias sont alors perdus).
+    Configuration : WHIZTERM_SHELL (shell à lancer, bash puis /bin/sh par défaut : le protocole
+    de sentinelle suppose un shell POSIX, $SHELL peut être fish ou csh)
+    """
+    # Délai laissé au shell pour rendre la main après SIGINT
+    INTERRUPT_GRACE = 2.0
+
+    def __init__(self, shell: Optional[str] = None, cwd: Optional[str] = None):
+        self.shell = shell or config("WHIZTERM_SHELL") or shutil.which("bash") or "/bin/sh"
+        self.cwd = os.path.abspath(cwd or os.getcwd())
+        self.process = None
+        self.master = None
+        self.tty = None
+        self.commands_fd = None
+        self.restarts = 0
+        self.busy = False
+        self._script_dir = tempfile.mkdtemp(prefix="whizterm-shell-")
+        self._decoder = None
+        self._lock = threading.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """Lance le shell (appelé automatiquement avant la première commande)"""
+        pty, termios = lazy_import("pty"), lazy_import("termios")
+        master, slave = pty.openpty()
+        attrs = termios.tcgetattr(slave)
+        # Pas d'écho des saisies transmises, pas de conversion \n -> \r\n en sortie
+        attrs[3] &= ~termios.ECHO
+        attrs[1] &= ~termios.ONLCR
+        termios.tcsetattr(slave, termios.TCSANOW, attrs)
+        read_fd, write_fd = os.pipe()
+        env = dict(os.environ, TERM="dumb", PAGER="cat", GIT_PAGER="cat")
+        try:
+            self.process = subprocess.Popen(
+                [self.shell],
+                stdin=read_fd,
+                stdout=slave,
+                stderr=slave,
+                cwd=self.cwd if os.path.isdir(self.cwd) else None,
+                env=env,
+                start_new_session=True
+            )
+        finally:
+            os.close(read_fd)
+        self.tty = os.ttyname(slave)
+        os.close(slave)
+        self.master = master
+        self.commands_fd = write_fd
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        # SIGINT abandonne la commande en cours (fin du fichier lu par .) sans arrêter le shell ; alias activés dans bash
+        self._write("trap 'return 130' INT; shopt -s expand_aliases 2>/dev/null; unset HISTFILE\n")
+
+    def _write(self, text: str):
+        os.write(self.commands_fd, text.encode("utf-8"))
+
+    def send_input(self, text: str):
+        """Transmet une saisie à la commande en cours (entrée du pseudo-terminal)"""
+        if self.master is not None:
+            os.write(self.master, text.encode("utf-8"))
+
+    def interrupt(self):
+        """Envoie SIGINT à la commande en cours"""
+        if self.alive:
+            try:
+                os.killpg(self.process.pid, signal.SIGINT)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+    def restart(self):
+        """Tue le shell et ses enfants ; le suivant démarre avec la prochaine commande"""
+        self._stop()
+        self.restarts += 1
+
+    def _stop(self):
+        if self.process is not None:
+            kill_process_tree(self.process)
+            self.process.wait()
+            self.process = None
+        for fd in (self.master, self.commands_fd):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.master = self.commands_fd = None
+
+    def close(self):
+        with self._lock:
+            self._stop()
+        shutil.rmtree(self._script_dir, ignore_errors=True)
+
+    def run(
+        self,
+        command: str,
+        on_output: Optional[Callable[[str, str], None]] = None,
+        timeout: Optional[float] = None,
+        cancel: Optional[CancelToken] = None
+    ) -> CommandResult:
+        """
+        Exécute une commande dans le shell persistant (même interface que run_command)
+        La sortie standard et la sortie d'erreur arrivent mélangées, comme dans un terminal ("stdout").
+        """
+        with self._lock, get_metrics().span("command", command=command[:200], shell=True) as attrs:
+            self.busy = True
+            try:
+                result = self._run(command, on_output, timeout, cancel)
+            finally:
+                self.busy = False
+            attrs.update({key: value for key, value in result.to_dict().items() if key != "command"})
+            attrs["restarts"] = self.restarts
+            return result
+
+    def _run(self, command, on_output, timeout, cancel) -> CommandResult:
+        if not self.alive:
+            if self.process is not None:
+                self.restart()
+            self.start()
+        start = time.perf_counter()
+        token = os.urandom(8).hex()
+        marker = f"__whizterm_{token}__:"
+        # La commande est lue depuis un fichier : pas de limite de longueur de ligne, texte multiligne possible
+        script = os.path.join(self._script_dir, "command.sh")
+        with open(script, "w", encoding="utf-8") as f:
+            f.write(command + "\n")
+        tty = shlex.quote(self.tty)
+        self._write(f". {shlex.quote(script)} <{tty} >{tty} 2>&1; printf '\\n%s%s:%s\\n' {marker} \"$?\" \"$PWD\"\n")
+
+        captured = OutputCapture("shell")
+        byte_count = 0
+        partial = ""
+        held = ""  # ligne vide retenue : peut être le saut de ligne ajouté avant la sentinelle
+        returncode = None
+        timed_out = False
+        interrupted_at = None
+        deadline = start + timeout if timeout else None
+        unregister = cancel.register(self.interrupt) if cancel else None
+
+        def emit(line: str):
+            captured.write(line)
+            if on_output:
+                on_output(line, "stdout")
+
+        try:
+            while returncode is None:
+                now = time.perf_counter()
+                if interrupted_at is None and (cancel is not None and cancel.cancelled or deadline is not None and now >= deadline):
+                    timed_out = not (cancel is not None and cancel.cancelled)
+                    interrupted_at = now
+                    self.interrupt()
+                if interrupted_at is not None and now - interrupted_at >= self.INTERRUPT_GRACE:
+                    # Le shell ne rend pas la main : le relancer
+                    self.restart()
+                    returncode = -signal.SIGINT
+                    break
+                # Attente bornée : délai, annulation et fin du shell sont vérifiés régulièrement
+                ready, _, _ = lazy_import("select").select([self.master], [], [], 0.1)
+                if not ready:
+                    if not self.alive:
+                        break
+                    continue
+                try:
+                    data = os.read(self.master, 65536)
+                except OSError:
+                    data = b""
+                if not data:
+                    # Le shell s'est terminé (exit)
+                    break
+                byte_count += len(data)
+                lines = (partial + self._decoder.decode(data)).splitlines(keepends=True)
+                partial = lines.pop() if lines and not lines[-1].endswith(("\n", "\r")) and len(lines[-1]) < MAX_LINE_CHARS else ""
+                for line in lines:
+                    if line.startswith(marker):
+                        code, _, cwd = line[len(marker):].rstrip("\n").partition(":")
+                        returncode = int(code)
+                        self.cwd = cwd or self.cwd
+                        held = ""
+                        break
+                    if held:
+                        emit(held)
+                        held = ""
+                    if line == "\n":
+                        held = line
+                    else:
+                        emit(line)
+            if held:
+                emit(held)
+            if partial and not partial.startswith(marker):
+                emit(partial)
+            if returncode is None:
+                # Fin du shell pendant la commande : son code de sortie devient celui de la commande
+                returncode = self.process.wait() if self.process is not None else -signal.SIGKILL
+        finally:
+            captured.close()
+            if unregister:
+                unregister()
+
+        if cancel:
+            cancel.raise_if_cancelled()
+        return CommandResult(
+            command,
+            returncode,
+            time.perf_counter() - start,
+            stdout=captured.text,
+            stdout_bytes=byte_count,
+            timed_out=timed_out,
+            stdout_log=captured.path or None
+        )
+
+def prepare_command(command: str) -> str:
+    """Nettoie une commande extraite et ajuste sudo selon le gestionnaire de paquets"""
+    # Nettoyer la commande des backticks
+    command = command.strip('`')
+    
+    # Vérifier si la commande nécessite des droits d'administration
+    if any(cmd in command.lower() for cmd in ['apt install', 'dnf install', 'yum install']):
+        command = f"sudo {command}"
+    # Ne pas utiliser sudo avec brew
+    elif 'brew install' in command.lower():
+        command = command.replace('sudo ', '')
+    return command
+
+def command_status_message(result: CommandResult) -> str:
+    """Bilan d'une commande terminée"""
+    if result.timed_out:
+        return f"Commande interrompue après {result.duration:.1f} s (délai dépassé)"
+    if result.returncode == 0:
+        return f"Commande exécutée avec succès ({result.duration:.2f} s)"
+    return f"Erreur lors de l'exécution de la commande (code: {result.returncode}, {result.duration:.2f} s)"
+
+def execute_command(command: str, timeout: Optional[float] = None, label: str = "") -> Optional[CommandResult]:
+    """
+    Exécute une commande système
+    La sortie est affichée au fur et à mesure de son exécution, précédée de label
+    (numéro de la commande lorsque plusieurs commandes s'exécutent en parallèle).
+    Retourne le résultat, ou None si la commande n'a pas pu être lancée.
+    """
+    prefix = escape(label)
+    try:
+        command = prepare_command(command)
+            
+        print(f"{prefix}[bold yellow]Exécution de la commande:[/bold yellow] {escape(command)}")
+        
+        def show_output(line: str, stream: str):
+            if stream == "stderr":
+                print(f"{prefix}[red]{escape(line.rstrip())}[/red]")
+            else:
+                print(prefix + escape(line.rstrip()))
+
+        # Exécuter la commande en affichant la sortie ligne par ligne
+        # (sans accès au terminal lorsque plusieurs commandes s'exécutent en même temps)
+        result = run_command(
+            command,
+            on_output=show_output,
+            timeout=timeout if timeout is not None else get_command_timeout(),
+            stdin=subprocess.DEVNULL if label else None
+        )
+        print(prefix + command_status_message(result))
+        for path in result.logs:
+            print(f"{prefix}[dim]Sortie complète enregistrée dans {escape(path)}[/dim]")
+        return result
+            
+    except Exception as e:
+        print(f"{prefix}Erreur lors de l'exécution de la commande: {escape(str(e))}")
+        return None
+
+# Commandes qui modifient l'état du shell : tout ce qui suit doit attendre leur fin
+STATEFUL_COMMANDS = {"cd", "pushd", "popd", "export", "unset", "source", ".", "alias", "set", "umask", "ulimit"}
+
+# Commandes dont les arguments sont des fichiers (le répertoire courant s'il n'y en a pas)
+FILE_COMMANDS = {
+    "mkdir", "touch", "rm", "rmdir", "mv", "cp", "ln", "chmod", "chown", "cat", "ls", "find",
+    "du", "tree", "tar", "zip", "unzip", "git", "open", "code", "nano", "vim", "head", "tail"
+}
+
+# Commandes sans autre effet que sur leurs arguments : seules ces commandes peuvent
+# s'exécuter en parallèle. Toute autre commande (gestionnaire de paquets, script,
+# programme installé par une commande précédente...) s'exécute seule.
+PARALLEL_COMMANDS = FILE_COMMANDS | {
+    "echo", "printf", "pwd", "wc", "grep", "stat", "file", "df", "which", "date", "whoami", "uname", "sort", "diff"
+}
+
+
+def command_resources(command: str, cwd: Optional[str] = None) -> Optional[set]:
+    """
+    Ressources utilisées par une commande : chemins ("path", chemin absolu) cités en argument
+    Retourne None si la commande doit s'exécuter seule : changement d'état du shell,
+    commande hors de PARALLEL_COMMANDS (effets inconnus) ou impossible à analyser.
+    """
+    cwd = cwd or request_cwd()
+    try:
+        lexer = shlex.shlex(command, posix=True, punctuation_chars=True)
+        lexer.whitespace_split = True
+        tokens = list(lexer)
+    except ValueError:
+        return None
+    if not tokens or tokens[0] in STATEFUL_COMMANDS:
+        return None
+
+    resources = set()
+    segment_start = True
+    redirect = False
+    program = None
+    for token in tokens:
+        if set(token) <= set(";&|<>()"):
+            # Opérateur : nouvelle commande, ou redirection vers un fichier
+            redirect = "<" in token or ">" in token
+            segment_start = segment_start or not redirect
+            continue
+        if redirect:
+            redirect = False
+            if token.isdigit():
+                continue
+        elif segment_start:
+            if token == "sudo" or "=" in token:
+                continue
+            program = os.path.basename(token)
+            if program not in PARALLEL_COMMANDS:
+                return None
+            segment_start = False
+            continue
+        if token.startswith("-"):
+            continue
+        path = os.path.normpath(os.path.join(cwd, os.path.expanduser(token)))
+        if program in FILE_COMMANDS or looks_like_path(token) or os.path.exists(path):
+            resources.add(("path", path))
+    # Sans argument, une commande de fichiers travaille dans le répertoire courant
+    if program is None:
+        return None
+    if program in FILE_COMMANDS and not any(kind == "path" for kind, _ in resources):
+        resources.add(("path", os.path.normpath(cwd)))
+    return resources
+
+def looks_like_path(token: str) -> bool:
+    """Un argument ressemble à un chemin (séparateur, ~, . initial ou extension de fichier)"""
+    if os.sep in token or token.startswith(("~", ".")):
+        return True
+    return bool(re.search(r"\.[A-Za-z]\w*$", token))
+
+def resources_conflict(first: set, second: set) -> bool:
+    """Deux ensembles de ressources se recouvrent (même verrou, même chemin ou chemin parent)"""
+    for kind, value in first:
+        for other_kind, other in second:
+            if kind != other_kind:
+                continue
+            if value == other:
+                return True
+            if kind == "path" and (other.startswith(value.rstrip(os.sep) + os.sep) or value.startswith(other.rstrip(os.sep) + os.sep)):
+                return True
+    return False
+
+def plan_commands(commands: List[str], cwd: Optional[str] = None) -> List[set]:
+    """
+    Dépendances entre les commandes extraites : pour chaque commande, l'ensemble
+    des commandes précédentes qui doivent être terminées avant son lancement
+    """
+    resources = [command_resources(command, cwd) for command in commands]
+    dependencies = []
+    for index, current in enumerate(resources):
+        dependencies.append({
+            previous for previous in range(index)
+            if current is None or resources[previous] is None or resources_conflict(current, resources[previous])
+        })
+    return dependencies
+
+def get_command_workers() -> int:
+    """Nombre maximal de commandes extraites exécutées en parallèle (WHIZTERM_COMMAND_WORKERS)"""
+    return max(1, int(config("WHIZTERM_COMMAND_WORKERS", "4")))
+
+class CommandPipeline:
+    """
+    Exécution des commandes extraites au fur et à mesure de leur arrivée
+    Chaque commande soumise attend la fin des commandes précédentes dont elle dépend
+    (voir plan_commands) ; les autres sont lancées aussitôt, max_workers au plus en parallèle.
+    run(index, commande) exécute une commande et retourne son résultat ; un résultat None,
+    False ou sans succès compte comme un échec.
+    """
+    def __init__(
+        self,
+        run: Callable[[int, str], object],
+        max_workers: Optional[int] = None,
+        cancel: Optional[CancelToken] = None,
+        cwd: Optional[str] = None
+    ):
+        concurrent_futures = lazy_import("concurrent.futures")
+        self.run = run
+        self.cancel = cancel
+        self.cwd = cwd
+        self.commands = []
+        self.resources = []
+        self.dependencies = []
+        self.results = []
+        self.durations = []
+        self.start = time.perf_counter()
+        self.metrics = get_metrics()
+        self._parent_span = self.metrics.current()
+        # Les commandes s'exécutent dans le répertoire et avec la sortie du client (démon)
+        self._request_context = current_request_context()
+        self._pool = concurrent_futures.ThreadPoolExecutor(
+            max_workers=max_workers or get_command_workers(),
+            thread_name_prefix="whizterm-command"
+        )
+        self._pending = set()
+        self._running = set()
+        self._done = set()
+        self._error = None
+        self._condition = threading.Condition()
+
+    def submit(self, command: str) -> int:
+        """Ajoute une commande ; elle démarre dès que ses dépendances sont terminées"""
+        resources = command_resources(command, self.cwd)
+        with self._condition:
+            index = len(self.commands)
+            self.commands.append(command)
+            self.dependencies.append({
+                previous for previous in range(index)
+                if resources is None or self.resources[previous] is None or resources_conflict(resources, self.resources[previous])
+            })
+            self.resources.append(resources)
+            self.results.append(None)
+            self.durations.append(0.0)
+            self._pending.add(index)
+            self._dispatch()
+        return index
+
+    def _dispatch(self):
+        # Appelé avec le verrou : une erreur arrête le lancement des commandes suivantes
+        if self._error is not None:
+            return
+        for index in sorted(self._pending):
+            if self.dependencies[index] <= self._done:
+                self._pending.discard(index)
+                self._running.add(index)
+                future = self._pool.submit(self._execute, index)
+                future.add_done_callback(lambda future, index=index: self._on_done(index, future))
+
+    def _execute(self, index: int):
+        if self.cancel:
+            self.cancel.raise_if_cancelled()
+        start = time.perf_counter()
+        try:
+            with self.metrics.attach(self._parent_span), attach_request_context(self._request_context):
+                self.results[index] = self.run(index, self.commands[index])
+        finally:
+            self.durations[index] = time.perf_counter() - start
+
+    def _on_done(self, index: int, future):
+        with self._condition:
+            self._running.discard(index)
+            self._done.add(index)
+            if future.exception() is not None and self._error is None:
+                self._error = future.exception()
+            self._dispatch()
+            self._condition.notify_all()
+
+    def finish(self) -> dict:
+        """
+        Attend la fin des commandes et retourne les résultats dans l'ordre de soumission,
+        la durée totale et la durée cumulée ; relance la première erreur (annulation comprise)
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: not self._running and (not self._pending or self._error is not None))
+        self._pool.shutdown(wait=True)
+        if self._error is not None:
+            raise self._error
+        failed = sum(1 for result in self.results if result is None or result is False or getattr(result, "success", True) is False)
+        return {
+            "results": list(self.results),
+            "parallel": any(len(deps) < index for index, deps in enumerate(self.dependencies)),
+            "failed": failed,
+            "duration": time.perf_counter() - self.start,
+            "serial_duration": sum(self.durations)
+        }
+
+def run_command_plan(
+    commands: List[str],
+    run: Callable[[int, str], object],
+    max_workers: Optional[int] = None,
+    cancel: Optional[CancelToken] = None,
+    cwd: Optional[str] = None
+) -> dict:
+    """
+    Exécute une liste de commandes extraites en respectant leurs dépendances (voir CommandPipeline)
+    Les commandes indépendantes sont lancées en parallèle, les commandes dépendantes restent dans l'ordre.
+    """
+    pipeline = CommandPipeline(run, max_workers, cancel, cwd)
+    for command in commands:
+        pipeline.submit(command)
+    return pipeline.finish()
+
+class BrewIndex:
+    """
+    Index local des casks et formules Homebrew
+    Construit à partir du catalogue JSON de Homebrew (fichier WHIZTERM_BREW_CATALOG,
+    cache de l'API Homebrew ou `brew info --json=v2 --eval-all`), enregistré sous forme
+    compacte (JSON gzip) et reconstruit en arrière-plan lorsqu'il est trop ancien.
+    Permet une recherche exacte, par préfixe et approchée sur le nom et la description.
+    """
+    # Délai avant une nouvelle reconstruction quand la précédente a échoué (brew ou catalogue absent)
+    RETRY_DELAY = 600
+
+    def __init__(self, path: Optional[str] = None, max_age: float = 24 * 3600, catalog_path: Optional[str] = None):
+        self.path = path
+        self.max_age = max_age
+        self.catalog_path = catalog_path
+        self.built_at = 0.0
+        self.entries = []  # (type, token, noms, description)
+        self._exact = {}
+        self._words = {}
+        self._sorted_keys = []
+        self._grams = None  # (index exact, trigramme -> noms), construit à la première recherche approchée
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self._retry_at = 0.0
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self.entries)
+
+    def is_stale(self) -> bool:
+        return not self.loaded or time.time() - self.built_at > self.max_age
+
+    def load(self) -> bool:
+        """Charge l'index enregistré sur disque"""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+            self._set_entries(data["entries"], data["built_at"])
+            return True
+        except Exception as e:
+            print(f"Erreur lors du chargement de l'index Homebrew: {str(e)}")
+            return False
+
+    def build(self):
+        """Reconstruit l'index à partir du catalogue Homebrew et l'enregistre"""
+        entries = []
+        for item in self._read_catalog():
+            if "token" in item:
+                names = item.get("name") or []
+                entries.append(["cask", item["token"], names, item.get("desc") or ""])
+            elif "name" in item:
+                names = [item.get("full_name")] + list(item.get("aliases") or [])
+                entries.append(["formula", item["name"], [n for n in names if n], item.get("desc") or ""])
+        if not entries:
+            raise RuntimeError("catalogue Homebrew vide")
+        self._set_entries(entries, time.time())
+        self._save()
+
+    def refresh_in_background(self):
+        """Lance la reconstruction de l'index dans un thread si elle n'est pas déjà en cours"""
+        with self._lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive() or time.time() < self._retry_at:
+                return
+            self._refresh_thread = threading.Thread(target=self._refresh, name="whizterm-brew-index", daemon=True)
+            self._refresh_thread.start()
+
+    def _refresh(self):
+        try:
+            self.build()
+        except Exception as e:
+            debug(f"Mise à jour de l'index Homebrew impossible: {str(e)}")
+            with self._lock:
+                self._retry_at = time.time() + self.RETRY_DELAY
+
+    def search(self, query: str, kind: Optional[str] = None, limit: int = 10) -> List[dict]:
+        """
+        Recherche une application dans l'index
+        Retourne les entrées classées par score décroissant (exact > préfixe > approché > description)
+        """
+        query = query.strip().lower()
+        if not query:
+            return []
+        entries, exact, words, sorted_keys = self.entries, self._exact, self._words, self._sorted_keys
+        scores = {}
+
+        def add(index: int, score: float):
+            if kind and entries[index][0] != kind:
+                return
+            if score > scores.get(index, 0.0):
+                scores[index] = score
+
+        # Correspondance exacte sur le token ou le nom
+        for index in exact.get(query, []):
+            add(index, 1.0 if entries[index][1].lower() == query else 0.95)
+        if len(scores) >= limit:
+            return self._ranked(entries, scores, limit)
+
+        # Correspondance par préfixe (les noms les plus courts d'abord)
+        position = bisect.bisect_left(sorted_keys, (query,))
+        while position < len(sorted_keys) and sorted_keys[position][0].startswith(query):
+            key, index = sorted_keys[position]
+            add(index, 0.6 + 0.2 * len(query) / len(key))
+            position += 1
+
+        # Tous les mots de la requête présents dans le token ou le nom ("chrome" -> google-chrome)
+        query_words = re.split(r'[\s\-_.]+', query)
+        candidates = None
+        for word in query_words:
+            indexes = set(words.get(word, ()))
+            candidates = indexes if candidates is None else candidates & indexes
+        for index in candidates or ():
+            add(index, 0.7)
+
+        # Les correspondances approchées seraient classées après : inutile de les chercher
+        if scores:
+            return self._ranked(entries, scores, limit)
+
+        # Correspondance approchée (fautes de frappe), limitée aux noms qui partagent le plus de trigrammes
+        for key in difflib.get_close_matches(query, self._fuzzy_candidates(query), n=limit, cutoff=0.75):
+            ratio = difflib.SequenceMatcher(None, query, key).ratio()
+            for index in exact[key]:
+                add(index, 0.6 * ratio)
+
+        # Recherche dans les descriptions si rien d'autre n'a été trouvé
+        if not scores:
+            words = query.split()
+            for index, (_, _, _, desc) in enumerate(entries):
+                lowered = desc.lower()
+                if all(word in lowered for word in words):
+                    add(index, 0.3)
+        return self._ranked(entries, scores, limit)
+
+    @staticmethod
+    def _ranked(entries: list, scores: dict, limit: int) -> List[dict]:
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], len(entries[item[0]][1])))[:limit]
+        return [
+            {"type": entries[index][0], "token": entries[index][1], "names": entries[index][2], "desc": entries[index][3], "score": score}
+            for index, score in ranked
+        ]
+
+    def lookup(self, name: str) -> List[dict]:
+        """Entrées dont le token ou un nom est exactement name ("google chrome" -> google-chrome)"""
+        name = name.strip().lower()
+        entries, exact = self.entries, self._exact
+        indexes = exact.get(name) or exact.get(name.replace(" ", "-")) or []
+        return self._ranked(entries, dict.fromkeys(indexes, 1.0), len(indexes))
+
+    def _fuzzy_candidates(self, query: str, limit: int = 200) -> List[str]:
+        """Noms qui partagent le plus de trigrammes avec la requête (pré-filtre de la recherche approchée)"""
+        exact = self._exact
+        if self._grams is None or self._grams[0] is not exact:
+            grams = {}
+            for key in exact:
+                for gram in trigrams(key):
+                    grams.setdefault(gram, []).append(key)
+            self._grams = (exact, grams)
+        grams = self._grams[1]
+        counts = {}
+        for gram in trigrams(query):
+            for key in grams.get(gram, ()):
+                counts[key] = counts.get(key, 0) + 1
+        return sorted(counts, key=counts.get, reverse=True)[:limit]
+
+    def _set_entries(self, entries: list, built_at: float):
+        exact = {}
+        for index, (_, token, names, _) in enumerate(entries):
+            for key in {token.lower(), *(name.lower() for name in names)}:
+                exact.setdefault(key, []).append(index)
+        words = {}
+        for key, indexes in exact.items():
+            for word in re.split(r'[\s\-_.]+', key):
+                words.setdefault(word, set()).update(indexes)
+        sorted_keys = sorted((key, index) for key, indexes in exact.items() for index in indexes)
+        # Remplacement atomique pour les lecteurs concurrents
+        self.entries, self._exact, self._words, self._sorted_keys, self.built_at = entries, exact, words, sorted_keys, built_at
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with gzip.open(os.fdopen(fd, "wb"), "wt", encoding="utf-8") as f:
+                json.dump({"built_at": self.built_at, "entries": self.entries}, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Erreur lors de l'enregistrement de l'index Homebrew: {str(e)}")
+
+    def _read_catalog(self) -> List[dict]:
+        # 1. Fichier(s) de catalogue explicite(s)
+        if self.catalog_path:
+            items = []
+            for path in self.catalog_path.split(os.pathsep):
+                items.extend(self._parse_catalog(path))
+            return items
+
+        # 2. Cache de l'API Homebrew (mis à jour par `brew update`)
+        cache_dir = config("HOMEBREW_CACHE", os.path.join(os.path.expanduser("~"), "Library", "Caches", "Homebrew"))
+        api_files = [os.path.join(cache_dir, "api", name) for name in ("cask.jws.json", "formula.jws.json")]
+        if all(os.path.exists(path) for path in api_files):
+            return [item for path in api_files for item in self._parse_catalog(path)]
+
+        # 3. Export complet via brew
+        brew = shutil.which("brew")
+        if not brew:
+            raise RuntimeError("brew introuvable")
+        result = subprocess.run([brew, "info", "--json=v2", "--eval-all"], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or f"brew info a échoué (code {result.returncode})")
+        return self._parse_catalog_data(json.loads(result.stdout))
+
+    def _parse_catalog(self, path: str) -> List[dict]:
+        with open(path, "r", encoding="utf-8") as f:
+            return self._parse_catalog_data(json.load(f))
+
+    @staticmethod
+    def _parse_catalog_data(data) -> List[dict]:
+        # Format JWS du cache de l'API : le catalogue est dans "payload"
+        if isinstance(data, dict) and isinstance(data.get("payload"), str):
+            data = json.loads(data["payload"])
+        # Format `brew info --json=v2`
+        if isinstance(data, dict):
+            return list(data.get("formulae", [])) + list(data.get("casks", []))
+        return list(data)
+
+_brew_index = None
+_brew_index_lock = threading.Lock()
+
+def get_brew_index() -> BrewIndex:
+    """
+    Retourne l'index Homebrew partagé
+    L'index enregistré est chargé au premier appel ; s'il est absent ou trop ancien,
+    il est reconstruit en arrière-plan (l'ancien reste utilisable en attendant).
+    """
+    global _brew_index
+    with _brew_index_lock:
+        if _brew_index is None:
+            _brew_index = BrewIndex(
+                path=config("WHIZTERM_BREW_INDEX", os.path.join(whizterm_home(), "brew_index.json.gz")),
+                max_age=float(config("WHIZTERM_BREW_INDEX_TTL", str(24 * 3600))),
+                catalog_path=config("WHIZTERM_BREW_CATALOG")
+            )
+            _brew_index.load()
+    if _brew_index.is_stale():
+        _brew_index.refresh_in_background()
+    return _brew_index
+
+def installed_casks() -> List[str]:
+    """Liste les casks installés en lisant directement le Caskroom de Homebrew"""
+    prefixes = [config("HOMEBREW_PREFIX"), "/opt/homebrew", "/usr/local"]
+    casks = set()
+    for prefix in prefixes:
+        if not prefix:
+            continue
+        try:
+            with os.scandir(os.path.join(prefix, "Caskroom")) as it:
+                casks.update(entry.name for entry in it if entry.is_dir() and not entry.name.startswith('.'))
+        except OSError:
+            continue
+    return sorted(casks)
+
+def find_cask_name(app_name: str, is_uninstall: bool = False) -> str:
+    """
+    Trouve le nom exact du cask pour une application
+    La recherche se fait dans l'index Homebrew local ; tant qu'il n'est pas disponible,
+    on se rabat sur `brew search`.
+    """
+    with get_metrics().span("cask_lookup", app=app_name) as attrs:
+        try:
+            # Si c'est une désinstallation on vérifie d'abord si l'application est installée
+            if is_uninstall and any(app_name.lower() in cask.lower() for cask in installed_casks()):
+                attrs["source"] = "installed"
+                return app_name  # Si l'application est installée, utiliser le nom tel quel
+
+            index = get_brew_index()
+            if index.loaded:
+                attrs["source"] = "index"
+                results = index.search(app_name, kind="cask", limit=1)
+                return results[0]["token"] if results else app_name
+
+            attrs["source"] = "brew_search"
+            return find_cask_name_with_brew_search(app_name)
+        except Exception as e:
+            print(f"Erreur lors de la recherche du cask: {str(e)}")
+            return app_name
+
+def find_cask_name_with_brew_search(app_name: str) -> str:
+    """
+    Trouve le nom du cask avec `brew search` (utilisé tant que l'index local n'est pas construit)
+    """
+    # Rechercher dans les casks Homebrew
+    search_cmd = f"brew search {shlex.quote(app_name)}"
+    result = subprocess.run(search_cmd, shell=True, capture_output=True, text=True)
+    
+    if result.returncode == 0:
+        # Analyser la sortie pour trouver le bon cask
+        lines = result.stdout.split('\n')
+        for line in lines:
+            if 'cask' in line.lower():
+                # Extraire le nom du cask
+                cask_name = line.split('/')[-1].strip()
+                return cask_name
+    
+    # Si pas trouvé, essayer une recherche plus large
+    search_cmd = f"brew search --desc {shlex.quote(app_name)}"
+    result = subprocess.run(search_cmd, shell=True, capture_output=True, text=True)
+    
+    if result.returncode == 0:
+        lines = result.stdout.split('\n')
+        for line in lines:
+            if 'cask' in line.lower():
+                cask_name = line.split('/')[-1].strip()
+                return cask_name
+    
+    return app_name  # Retourner le nom original si pas trouvé
+
+class InstalledAppIndex:
+    """
+    Index des applications installées
+    Les répertoires d'applications sont parcourus une seule fois avec os.scandir ;
+    l'index est reconstruit uniquement lorsque la date de modification d'un répertoire change.
+    """
+    def __init__(self, roots: List[str]):
+        self.roots = roots
+        self.apps = []  # (nom, chemin)
+        self._mtimes = None
+        self._lock = threading.Lock()
+
+    def _current_mtimes(self) -> tuple:
+        mtimes = []
+        for root in self.roots:
+            try:
+                mtimes.append(os.stat(root).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def refresh(self, force: bool = False):
+        """Reconstruit l'index si un répertoire a changé depuis le dernier parcours"""
+        mtimes = self._current_mtimes()
+        with self._lock:
+            if not force and mtimes == self._mtimes:
+                return
+            apps = []
+            for root in self.roots:
+                try:
+                    with os.scandir(root) as it:
+                        for entry in it:
+                            if entry.name.startswith('.') or not entry.is_dir():
+                                continue
+                            name = entry.name[:-4] if entry.name.endswith('.app') else entry.name
+                            apps.append((name, entry.path))
+                except OSError:
+                    continue
+            self.apps = apps
+            self._mtimes = mtimes
+
+    def search(self, query: str, limit: int = 5) -> List[dict]:
+        """
+        Recherche une application installée (insensible à la casse, tolérante aux fautes)
+        Retourne les candidats classés par score décroissant
+        """
+        self.refresh()
+        query = query.strip().lower()
+        if not query:
+            return []
+        candidates = []
+        for name, path in self.apps:
+            lowered = name.lower()
+            if lowered == query:
+                score = 1.0
+            elif lowered.startswith(query):
+                score = 0.9
+            elif query in lowered:
+                score = 0.8
+            else:
+                score = 0.7 * difflib.SequenceMatcher(None, query, lowered).ratio()
+                if score < 0.5:
+                    continue
+            candidates.append({"name": name, "path": path, "score": score})
+        candidates.sort(key=lambda c: (-c["score"], len(c["name"])))
+        return candidates[:limit]
+
+    def path_of(self, app_name: str) -> Optional[str]:
+        """Retourne le chemin d'une application installée à partir de son nom exact"""
+        self.refresh()
+        for name, path in self.apps:
+            if name == app_name:
+                return path
+        return None
+
+_app_index = None
+_app_index_lock = threading.Lock()
+
+def get_app_index() -> InstalledAppIndex:
+    """
+    Retourne l'index partagé des applications installées
+    Les répertoires parcourus sont définis par WHIZTERM_APP_DIRS (séparés par ':')
+    """
+    global _app_index
+    with _app_index_lock:
+        if _app_index is None:
+            default_roots = os.pathsep.join(["/Applications", os.path.join(os.path.expanduser("~"), "Applications")])
+            roots = config("WHIZTERM_APP_DIRS", default_roots).split(os.pathsep)
+            _app_index = InstalledAppIndex([root for root in roots if root])
+        return _app_index
+
+def app_name_key(name: str) -> str:
+    """Nom d'application comparable à un token de cask (casse, espaces, tirets et .app ignorés)"""
+    name = name.strip().lower()
+    if name.endswith(".app"):
+        name = name[:-4]
+    return re.sub(r"[\s_-]+", "", name)
+
+def find_installed_app(app_name: str) -> Optional[str]:
+    """
+    Trouve une application installée portant exactement ce nom (à la casse, aux espaces et aux tirets près)
+    Retourne None sinon : la désinstallation ne doit jamais viser une application approchante
+    (voir suggest_installed_apps).
+    """
+    key = app_name_key(app_name)
+    if app_name.lower().endswith(".app"):
+        app_name = app_name[:-4]
+    with get_metrics().span("app_lookup", app=app_name) as attrs:
+        try:
+            # Chercher dans l'index des répertoires d'applications
+            attrs["source"] = "index"
+            for candidate in get_app_index().search(app_name, limit=5):
+                if app_name_key(candidate["name"]) == key:
+                    return candidate["name"]
+
+            # Chercher avec mdfind (Spotlight) pour les applications installées ailleurs
+            if sys.platform == "darwin":
+                attrs["source"] = "mdfind"
+                find_cmd = f"mdfind 'kMDItemKind==Application' | grep -i {shlex.quote(app_name)}"
+                result = subprocess.run(find_cmd, shell=True, capture_output=True, text=True)
+                for app_path in result.stdout.splitlines():
+                    name = os.path.basename(app_path.strip())
+                    if app_name_key(name) == key:
+                        return name[:-4] if name.endswith(".app") else name
+            return None
+        except Exception as e:
+            print(f"Erreur lors de la recherche de l'application: {str(e)}")
+            return None
+
+def suggest_installed_apps(app_name: str, limit: int = 3) -> List[str]:
+    """Applications installées au nom proche (suggestions affichées, jamais désinstallées d'office)"""
+    try:
+        return [candidate["name"] for candidate in get_app_index().search(app_name, limit=limit)]
+    except Exception:
+        return []
+
+# Répertoires ignorés par défaut lors des recherches de fichiers
+DEFAULT_IGNORED_NAMES = {
+    '.git', '.hg', '.svn', 'node_modules', '__pycache__', '.cache', 'Caches',
+    '.venv', 'venv', '.tox', '.mypy_cache', '.pytest_cache', '.ruff_cache', '.Trash', '.DS_Store'
+}
+
+class IgnoreRules:
+    """
+    Règles d'exclusion des recherches de fichiers (.gitignore et répertoires ignorés par défaut)
+    Chaque règle est (répertoire de base, motif, négation, répertoires seulement, ancrée)
+    """
+    def __init__(self, rules: Optional[list] = None):
+        self.rules = rules or []
+
+    def extended(self, directory: str) -> "IgnoreRules":
+        """Retourne les règles complétées par le .gitignore du répertoire"""
+        rules = list(self.rules)
+        try:
+            with open(os.path.join(directory, ".gitignore"), "r", encoding="utf-8", errors="replace") as f:
+                for line in f:
+                    line = line.rstrip("\n").strip()
+                    if not line or line.startswith('#'):
+                        continue
+                    negated = line.startswith('!')
+                    if negated:
+                        line = line[1:]
+                    dir_only = line.endswith('/')
+                    line = line.rstrip('/')
+                    if line.startswith('**/'):
+                        line = line[3:]
+                    anchored = '/' in line
+                    rules.append((directory, line.lstrip('/'), negated, dir_only, anchored))
+        except OSError:
+            return self
+        return IgnoreRules(rules)
+
+    def is_ignored(self, path: str, name: str, is_dir: bool) -> bool:
+        if name in DEFAULT_IGNORED_NAMES:
+            return True
+        ignored = False
+        # La dernière règle correspondante l'emporte
+        for base, pattern, negated, dir_only, anchored in self.rules:
+            if dir_only and not is_dir:
+                continue
+            target = os.path.relpath(path, base) if anchored else name
+            if fnmatch.fnmatch(target, pattern):
+                ignored = not negated
+        return ignored
+
+def walk_directories(
+    root: str,
+    max_depth: Optional[int] = None,
+    workers: int = 8,
+    use_ignore: bool = True,
+    known: Optional[dict] = None
+):
+    """
+    Parcourt une arborescence en parallèle avec os.scandir
+    Produit (répertoire, mtime, [(nom, est_un_répertoire)], profondeur) pour chaque répertoire,
+    au fur et à mesure du parcours. known associe à un répertoire (mtime, entrées) déjà connus :
+    si le mtime n'a pas changé, le contenu enregistré est réutilisé sans relire le répertoire.
+    """
+    tasks = queue.Queue()
+    results = queue.Queue()
+    lock = threading.Lock()
+    stop = threading.Event()
+    pending = [1]
+    done = object()
+
+    def list_directory(path: str):
+        mtime = os.stat(path).st_mtime_ns
+        if known is not None and path in known and known[path][0] == mtime:
+            return mtime, known[path][1]
+        with os.scandir(path) as it:
+            return mtime, [(entry.name, entry.is_dir(follow_symlinks=False)) for entry in it]
+
+    def worker():
+        while True:
+            item = tasks.get()
+            if item is None:
+                return
+            path, depth, rules = item
+            try:
+                if stop.is_set():
+                    continue
+                mtime, entries = list_directory(path)
+                if use_ignore:
+                    if any(name == ".gitignore" for name, _ in entries):
+                        rules = rules.extended(path)
+                    entries = [
+                        (name, is_dir) for name, is_dir in entries
+                        if not rules.is_ignored(os.path.join(path, name), name, is_dir)
+                    ]
+                results.put((path, mtime, entries, depth))
+                if max_depth is None or depth < max_depth:
+                    for name, is_dir in entries:
+                        if is_dir:
+                            with lock:
+                                pending[0] += 1
+                            tasks.put((os.path.join(path, name), depth + 1, rules))
+            except OSError:
+                pass
+            finally:
+                with lock:
+                    pending[0] -= 1
+                    finished = pending[0] == 0
+                if finished:
+                    results.put(done)
+                    for _ in range(workers):
+                        tasks.put(None)
+
+    root = os.path.abspath(os.path.expanduser(root))
+    tasks.put((root, 0, IgnoreRules()))
+    threads = [threading.Thread(target=worker, name="whizterm-walker", daemon=True) for _ in range(max(1, workers))]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            item = results.get()
+            if item is done:
+                break
+            yield item
+    finally:
+        # Si le consommateur s'arrête avant la fin, les workers vident la file sans parcourir
+        stop.set()
+
+def make_name_matcher(query: str, extensions: Optional[List[str]] = None, file_type: Optional[str] = None) -> Callable[[str, bool], bool]:
+    """
+    Construit le filtre des recherches de fichiers
+    query est un motif glob s'il contient des jokers, sinon une sous-chaîne (insensible à la casse)
+    """
+    query = query.lower()
+    is_glob = any(char in query for char in "*?[")
+    suffixes = tuple(f".{ext.lower().lstrip('.')}" for ext in extensions or [])
+
+    def matches(name: str, is_dir: bool) -> bool:
+        if file_type == "f" and is_dir or file_type == "d" and not is_dir:
+            return False
+        lowered = name.lower()
+        if suffixes and not lowered.endswith(suffixes):
+            return False
+        return fnmatch.fnmatch(lowered, query) if is_glob else query in lowered
+
+    return matches
+
+def search_files_iter(
+    query: str,
+    root: str = ".",
+    max_depth: Optional[int] = None,
+    extensions: Optional[List[str]] = None,
+    file_type: Optional[str] = None,
+    workers: int = 8,
+    use_ignore: bool = True
+):
+    """Recherche des fichiers par nom et produit les chemins trouvés au fur et à mesure"""
+    matches = make_name_matcher(query, extensions, file_type)
+    for path, _, entries, _ in walk_directories(root, max_depth, workers, use_ignore):
+        for name, is_dir in entries:
+            if matches(name, is_dir):
+                yield os.path.join(path, name)
+
+def trigrams(text: str) -> set:
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class FileIndex:
+    """
+    Index persistant des noms de fichiers d'une arborescence (SQLite)
+    Les noms sont indexés par trigrammes pour répondre aux recherches par sous-chaîne
+    en quelques millisecondes. La mise à jour est incrémentale : seuls les répertoires
+    dont le mtime a changé sont relus.
+    """
+    def __init__(self, root: str, path: str):
+        self.root = os.path.abspath(os.path.expanduser(root))
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.db = lazy_import("sqlite3").connect(path)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime INTEGER, depth INTEGER);
+            CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, dir TEXT, name TEXT, is_dir INTEGER);
+            CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+            CREATE TABLE IF NOT EXISTS trigrams (tri TEXT, file_id INTEGER);
+            CREATE INDEX IF NOT EXISTS trigrams_tri ON trigrams (tri, file_id);
+            CREATE INDEX IF NOT EXISTS trigrams_file ON trigrams (file_id);
+        """)
+
+    @classmethod
+    def for_root(cls, root: str) -> "FileIndex":
+        root = os.path.abspath(os.path.expanduser(root))
+        digest = hashlib.sha1(root.encode("utf-8")).hexdigest()[:12]
+        return cls(root, os.path.join(whizterm_home(), "file_index", f"{digest}.sqlite3"))
+
+    @property
+    def updated_at(self) -> float:
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'updated_at'").fetchone()
+        return float(row[0]) if row else 0.0
+
+    def refresh(self, workers: int = 8, use_ignore: bool = True) -> dict:
+        """Met à jour l'index ; retourne le nombre de répertoires relus et supprimés"""
+        known = {}
+        for dir_path, mtime in self.db.execute("SELECT path, mtime FROM dirs"):
+            known[dir_path] = [mtime, []]
+        for dir_path, name, is_dir in self.db.execute("SELECT dir, name, is_dir FROM files"):
+            if dir_path in known:
+                known[dir_path][1].append((name, bool(is_dir)))
+        known = {dir_path: tuple(value) for dir_path, value in known.items()}
+
+        seen = set()
+        changed = 0
+        with self.db:
+            for dir_path, mtime, entries, depth in walk_directories(self.root, None, workers, use_ignore, known):
+                seen.add(dir_path)
+                if dir_path in known and known[dir_path][0] == mtime:
+                    continue
+                changed += 1
+                self._remove_dir(dir_path)
+                self.db.execute("INSERT INTO dirs (path, mtime, depth) VALUES (?, ?, ?)", (dir_path, mtime, depth))
+                for name, is_dir in entries:
+                    cursor = self.db.execute("INSERT INTO files (dir, name, is_dir) VALUES (?, ?, ?)", (dir_path, name, int(is_dir)))
+                    self.db.executemany(
+                        "INSERT INTO trigrams (tri, file_id) VALUES (?, ?)",
+                        [(tri, cursor.lastrowid) for tri in trigrams(name)]
+                    )
+            removed = [dir_path for dir_path in known if dir_path not in seen]
+            for dir_path in removed:
+                self._remove_dir(dir_path)
+            self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('updated_at', ?)", (str(time.time()),))
+        return {"changed": changed, "removed": len(removed)}
+
+    def _remove_dir(self, dir_path: str):
+        self.db.execute("DELETE FROM trigrams WHERE file_id IN (SELECT id FROM files WHERE dir = ?)", (dir_path,))
+        self.db.execute("DELETE FROM files WHERE dir = ?", (dir_path,))
+        self.db.execute("DELETE FROM dirs WHERE path = ?", (dir_path,))
+
+    def search(
+        self,
+        query: str,
+        max_depth: Optional[int] = None,
+        extensions: Optional[List[str]] = None,
+        file_type: Optional[str] = None
+    ):
+        """Recherche dans l'index et produit les chemins trouvés"""
+        matches = make_name_matcher(query, extensions, file_type)
+        # Les trigrammes ne s'appliquent qu'aux sous-chaînes d'au moins 3 caractères
+        literal = max(re.split(r'[*?\[\]]', query.lower()), key=len)
+        query_trigrams = sorted(trigrams(literal))
+        if query_trigrams:
+            placeholders = ",".join("?" * len(query_trigrams))
+            rows = self.db.execute(f"""
+                SELECT files.dir, files.name, files.is_dir, dirs.depth FROM files
+                JOIN dirs ON dirs.path = files.dir
+                WHERE files.id IN (
+                    SELECT file_id FROM trigrams WHERE tri IN ({placeholders})
+                    GROUP BY file_id HAVING COUNT(DISTINCT tri) = ?
+                )
+            """, (*query_trigrams, len(query_trigrams)))
+        else:
+            rows = self.db.execute("SELECT files.dir, files.name, files.is_dir, dirs.depth FROM files JOIN dirs ON dirs.path = files.dir")
+        for dir_path, name, is_dir, depth in rows:
+            if max_depth is not None and depth > max_depth:
+                continue
+            if matches(name, bool(is_dir)):
+                yield os.path.join(dir_path, name)
+
+    def close(self):
+        self.db.close()
+
+def uninstall_app(app_name: str) -> str:
+    """
+    Désinstalle une application
+    """
+    try:
+        # Essayer d'abord avec Homebrew
+        brew_cmd = f"brew uninstall --cask {app_name}"
+        result = subprocess.run(brew_cmd, shell=True, capture_output=True, text=True)
+        
+        if result.returncode == 0:
+            return f"Application désinstallée avec Homebrew: {result.stdout}"
+        
+        # Si Homebrew échoue, essayer de supprimer manuellement avec sudo
+        app_path = get_app_index().path_of(app_name) or f"/Applications/{app_name}.app"
+        if os.path.exists(app_path):
+            rm_cmd = f"sudo rm -rf '{app_path}'"
+            result = subprocess.run(rm_cmd, shell=True, capture_output=True, text=True)
+            if result.returncode == 0:
+                return "Application désinstallée manuellement"
+            else:
+                return f"Erreur lors de la désinstallation manuelle: {result.stderr}"
+        
+        return "Application non trouvée"
+    except Exception as e:
+        return f"Erreur lors de la désinstallation: {str(e)}"
+
+class IntentMatch:
+    """Intention reconnue localement et commandes correspondantes"""
+    def __init__(self, intent: str, confidence: float, target: str, commands: List[str]):
+        self.intent = intent
+        self.confidence = confidence
+        self.target = target
+        self.commands = commands
+
+class IntentRouter:
+    """
+    Reconnaît les demandes courantes (français et anglais) sans appeler le modèle
+    Une installation ou une désinstallation ne reçoit une confiance élevée que si l'index Homebrew
+    (paquet et type : cask ou formule) ou les applications installées confirment la cible ;
+    pour les autres intentions, la cible doit tenir en un mot ou désigner un dossier existant.
+    Seules les intentions au-dessus du seuil sont traduites directement en commandes,
+    le reste est envoyé à Ollama.
+    Les compteurs par intention sont enregistrés dans stats_path.
+    """
+    ARTICLES = r"(?:(?:le|la|les|l'|un|une|des|du|de|the|a|an|my|mon|ma|mes)\s*)?"
+    PATTERNS = {
+        "install": [
+            r"^(?:installe[rz]?|install)\s+" + ARTICLES + r"(?:application\s+|app\s+|logiciel\s+)?(?P<target>.+)$",
+        ],
+        "uninstall": [
+            r"^(?:d[ée]sinstalle[rz]?|uninstall)\s+" + ARTICLES + r"(?:application\s+|app\s+|logiciel\s+)?(?P<target>.+)$",
+            r"^supprime[rz]?\s+(?:l'application|l'app|le logiciel)\s+(?P<target>.+)$",
+        ],
+        "list": [
+            r"^(?:liste[rz]?|list|affiche[rz]?|montre[rz]?|show)\s+" + ARTICLES + r"(?:tous les\s+|all\s+)?(?:fichiers|files|dossiers|folders|directories|contenu|contents)(?:\s+(?:de|du|dans|in|of)\s+" + ARTICLES + r"(?:dossier\s+|folder\s+|directory\s+)?(?P<target>.+))?$",
+        ],
+        "search": [
+            r"^(?:cherche[rz]?|recherche[rz]?|trouve[rz]?|search(?:\s+for)?|find|look\s+for)\s+" + ARTICLES + r"(?:tous les\s+|all\s+)?(?:fichiers?|files?)\s+(?:nomm[ée]s?\s+|named\s+|appel[ée]s?\s+)?(?P<target>.+)$",
+        ],
+        "cd": [
+            r"^(?:va|aller|vas|go|navigue[rz]?|navigate)\s+(?:dans|à|au|vers|to|into|in)\s+" + ARTICLES + r"(?:dossier\s+|r[ée]pertoire\s+|folder\s+|directory\s+)?(?P<target>.+)$",
+            r"^(?:change[rz]? de|change)\s+(?:dossier|r[ée]pertoire|directory|dir)\s+(?:pour|vers|to)?\s*(?P<target>.+)$",
+        ],
+    }
+    # Mots qui indiquent une demande composée, laissée au modèle
+    COMPOUND = re.compile(r"\b(?:et|puis|ensuite|and|then|after)\b|[;&|]")
+    FILLERS = re.compile(r"\s*(?:s'il te pla[iî]t|s'il vous pla[iî]t|stp|svp|please|pour moi|for me)\s*$")
+    # Intentions dont la cible doit toujours être confirmée par un index
+    VERIFIED_INTENTS = {"install", "uninstall"}
+
+    def __init__(self, threshold: float = 0.8, stats_path: Optional[str] = None):
+        self.threshold = threshold
+        self.stats_path = stats_path
+        self.patterns = {
+            intent: [re.compile(pattern, re.IGNORECASE) for pattern in patterns]
+            for intent, patterns in self.PATTERNS.items()
+        }
+        self.stats = {"total": 0, "routed": 0, "intents": {}}
+        self._lock = threading.Lock()
+        self._load_stats()
+
+    def match(self, text: str) -> Optional[tuple]:
+        """Retourne (intention, cible) du premier motif reconnu, ou None"""
+        text = self.FILLERS.sub("", text.strip().rstrip(" .!?"))
+        if not text:
+            return None
+        for intent, patterns in self.patterns.items():
+            for pattern in patterns:
+                match = pattern.match(text)
+                if match:
+                    return intent, (match.group("target") or "").strip(" '\"")
+        return None
+
+    def classify(self, text: str) -> Optional[tuple]:
+        """Retourne (intention, confiance, cible) ou None"""
+        matched = self.match(text)
+        if matched is None:
+            return None
+        intent, target = matched
+        if self.COMPOUND.search(target):
+            confidence = 0.5
+        elif self._is_known(intent, target) or intent not in self.VERIFIED_INTENTS and len(target.split()) <= 1:
+            confidence = 0.95
+        else:
+            # "installe la dernière version de node" : formulation libre, laissée au modèle
+            confidence = 0.6
+        return intent, confidence, target
+
+    def _is_known(self, intent: str, target: str) -> bool:
+        """Vérifie que la cible désigne un paquet Homebrew, une application installée ou un dossier existant"""
+        if intent == "install":
+            return self._brew_entry(target) is not None
+        if intent == "uninstall":
+            if self._installed_cask(target):
+                return True
+            key = app_name_key(target)
+            return any(app_name_key(candidate["name"]) == key for candidate in get_app_index().search(target, limit=5))
+        if intent in ("list", "cd"):
+            return os.path.isdir(os.path.join(request_cwd(), os.path.expanduser(target)))
+        return False
+
+    @staticmethod
+    def _brew_entry(target: str) -> Optional[dict]:
+        """Entrée de l'index Homebrew désignée sans ambiguïté par la cible (cask ou formule, pas les deux)"""
+        entries = get_brew_index().lookup(target)
+        return entries[0] if len({entry["type"] for entry in entries}) == 1 else None
+
+    @staticmethod
+    def _installed_cask(target: str) -> Optional[str]:
+        key = app_name_key(target)
+        return next((cask for cask in installed_casks() if app_name_key(cask) == key), None)
+
+    def route(self, text: str) -> Optional[IntentMatch]:
+        """Traduit la demande en commandes si l'intention est reconnue avec assez de confiance"""
+        classified = self.classify(text)
+        match = None
+        if classified and classified[1] >= self.threshold:
+            intent, confidence, target = classified
+            commands = self.commands_for(intent, target)
+            if commands:
+                match = IntentMatch(intent, confidence, target, commands)
+        self._record(match)
+        return match
+
+    def commands_for(self, intent: str, target: str) -> List[str]:
+        if intent == "install" and target:
+            entry = self._brew_entry(target)
+            if entry is None:
+                return []
+            option = " --cask" if entry["type"] == "cask" else ""
+            return [f"brew install{option} {shlex.quote(entry['token'])}"]
+        if intent == "uninstall" and target:
+            token = self._installed_cask(target) or find_cask_name(target, is_uninstall=True)
+            return [f"brew uninstall --cask {shlex.quote(token.replace(' ', '-'))}"]
+        if intent == "list":
+            return [f"ls -la {shlex.quote(os.path.expanduser(target))}" if target else "ls -la"]
+        if intent == "search" and target:
+            return [f"find . -iname {shlex.quote(f'*{target}*')}"]
+        if intent == "cd" and target:
+            return [f"cd {shlex.quote(os.path.expanduser(target))}"]
+        return []
+
+    def _record(self, match: Optional[IntentMatch]):
+        with self._lock:
+            self.stats["total"] += 1
+            if match:
+                self.stats["routed"] += 1
+                self.stats["intents"][match.intent] = self.stats["intents"].get(match.intent, 0) + 1
+            self._save_stats()
+
+    def _load_stats(self):
+        if not self.stats_path or not os.path.exists(self.stats_path):
+            return
+        try:
+            with open(self.stats_path, "r", encoding="utf-8") as f:
+                self.stats.update(json.load(f))
+        except Exception:
+            pass
+
+    def _save_stats(self):
+        if not self.stats_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.stats_path) or ".", exist_ok=True)
+            with open(self.stats_path, "w", encoding="utf-8") as f:
+                json.dump(self.stats, f)
+        except Exception as e:
+            print(f"Erreur lors de l'enregistrement des statistiques d'intentions: {str(e)}")
+
+_intent_router = None
+_intent_router_lock = threading.Lock()
+
+def get_intent_router() -> IntentRouter:
+    """Retourne le routeur d'intentions partagé (seuil : WHIZTERM_INTENT_THRESHOLD)"""
+    global _intent_router
+    with _intent_router_lock:
+        if _intent_router is None:
+            _intent_router = IntentRouter(
+                threshold=float(config("WHIZTERM_INTENT_THRESHOLD", "0.8")),
+                stats_path=os.path.join(whizterm_home(), "intent_stats.json")
+            )
+        return _intent_router
+
+def resolve_request(
+    text: str,
+    model: Optional[str] = None,
+    use_cache: bool = True,
+    use_intent: bool = True,
+    on_token: Optional[Callable[[str], None]] = None
+) -> dict:
+    """
+    Traduit une demande en langage naturel en commandes, sans rien afficher
+    Passe par le routeur d'intentions, puis par les caches de réponses et Ollama.
+    Retourne la source ("intent", "cache", "semantic" ou "llm"), le modèle qui a répondu,
+    la réponse, les commandes et les durées.
+    """
+    start = time.perf_counter()
+    intent = get_intent_router().route(text) if use_intent else None
+    if intent:
+        return {
+            "source": "intent",
+            "intent": intent.intent,
+            "model": None,
+            "response": None,
+            # cd dans un sous-processus serait sans effet : rien à exécuter
+            "commands": [] if intent.intent == "cd" else intent.commands,
+            "ttft": None,
+            "resolve_time": time.perf_counter() - start
+        }
+    result = generate_response(CLI_SYSTEM_PROMPT, text, model, on_token=on_token, use_cache=use_cache)
+    return {
+        "source": "semantic" if result["semantic"] else "cache" if result["cached"] else "llm",
+        "intent": None,
+        "model": result["model"],
+        "response": result["response"],
+        "commands": extract_commands(result["response"]),
+        "ttft": result["ttft"],
+        "resolve_time": time.perf_counter() - start
+    }
+
+@app.command()
+def process_command(
+    command: str, 
+    model: Optional[str] = typer.Option(None, "--model", "-m", help="Modèle Ollama à utiliser (choisi parmi WHIZTERM_MODELS par défaut)"),
+    auto_execute: bool = typer.Option(True, "--execute", "-e", help="Exécuter automatiquement les commandes suggérées"),
+    stream: bool = typer.Option(True, "--stream/--no-stream", help="Afficher la réponse de l'IA au fur et à mesure de sa génération"),
+    timeout: Optional[float] = typer.Option(None, "--timeout", "-t", help="Durée maximale d'exécution de chaque commande, en secondes"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Ignorer le cache de réponses et l'historique, et interroger le modèle"),
+    no_intent: bool = typer.Option(False, "--no-intent", help="Toujours interroger le modèle, sans reconnaissance locale des intentions"),
+    jobs: Optional[int] = typer.Option(None, "--jobs", "-j", help="Nombre maximal de commandes indépendantes exécutées en parallèle"),
+    session_name: Optional[str] = typer.Option(None, "--session", "-s", help="Conversation à poursuivre (WHIZTERM_SESSION par défaut)"),
+    confirm: bool = typer.Option(False, "--confirm", help="Demander confirmation avant chaque commande (exécution après la fin de la réponse)"),
+    no_history: bool = typer.Option(False, "--no-history", help="Interroger le modèle même si la demande a déjà été résolue avec succès")
+):
+    """
+    Traite les commandes utilisateur avec l'IA Ollama
+    """
+    requests = lazy_import("requests")
+    with get_metrics().span("request", interface="cli") as request_attrs:
+        try:
+            start = time.perf_counter()
+            workers = jobs or get_command_workers()
+
+            def run_extracted(index: int, cmd: str):
+                label = f"[{index + 1}] " if workers > 1 else ""
+                # Si c'est une commande de désinstallation, trouver l'application
+                if 'uninstall' in cmd.lower():
+                    app_name = cmd.split()[-1]
+                    installed_app = find_installed_app(app_name)
+                    if installed_app:
+                        print(f"{escape(label)}[bold yellow]Application trouvée:[/bold yellow] {escape(installed_app)}")
+                        message = uninstall_app(installed_app)
+                        print(escape(label) + message)
+                        return not message.startswith("Erreur")
+                    print(f"{escape(label)}[bold red]Application non trouvée:[/bold red] {escape(app_name)}")
+                    # Un nom approchant n'est qu'une suggestion : désinstaller une autre application serait irréversible
+                    suggestions = suggest_installed_apps(app_name)
+                    if suggestions:
+                        print(f"{escape(label)}Applications au nom proche : {escape(', '.join(suggestions))} (relancez avec le nom exact)")
+                    return False
+                print(f"{escape(label)}[bold blue]Exécution de:[/bold blue] {escape(cmd)}")
+                return execute_command(cmd, timeout, label)
+
+            # Les commandes démarrent dès la fermeture de leur bloc, pendant la fin de la génération
+            pipeline = CommandPipeline(run_extracted, workers)
+            early = stream and not confirm and config("WHIZTERM_EARLY_EXECUTION", "1") != "0"
+            try:
+                # Les demandes courantes sont traduites localement, sans appel au modèle
+                intent = None if no_intent else get_intent_router().route(command)
+                # Une demande déjà résolue avec succès réutilise les mêmes commandes (sauf --no-history ou --no-cache)
+                reused = None if intent or no_history or no_cache or not history_reuse_enabled() else get_command_history().resolve(command)
+                request_attrs["source"] = "intent" if intent else "history" if reused else "llm"
+                if intent and intent.intent == "cd":
+                    # Un sous-processus ne peut pas changer le répertoire du terminal appelant
+                    print(
+                        "[bold yellow]Intention:[/bold yellow] changer de dossier est impossible depuis whizterm, "
+                        f"qui s'exécute dans un processus séparé. Tapez vous-même : {escape(intent.commands[0])}"
+                    )
+                    return
+                if intent:
+                    print(f"[bold green]Intention:[/bold green] {intent.intent} ({intent.confidence:.0%}) — modèle non sollicité")
+                    commands = intent.commands
+                elif reused:
+                    print("[bold green]Historique:[/bold green] commandes déjà exécutées avec succès — modèle non sollicité")
+                    commands = reused
+                else:
+                    # Le modèle ne se charge que si la demande lui est transmise, pendant la consultation du cache
+                    get_ollama_client().warm_up_in_background(get_model_router().route(command, model).model)
+                    # Appel à l'API Ollama (ou au cache de réponses)
+                    print("[bold green]AI:[/bold green] ", end="")
+                    parser = CommandStreamParser()
+                    partial_line = []
+
+                    def show_token(token: str):
+                        commands = parser.feed(token) if early else []
+                        if pipeline.commands or commands:
+                            # Des commandes affichent leur sortie : n'afficher que des lignes complètes
+                            text = "".join(partial_line) + token
+                            complete, newline, rest = text.rpartition("\n")
+                            partial_line[:] = [rest]
+                            if newline:
+                                print(escape(complete))
+                        else:
+                            print(escape(token), end="")
+                        for cmd in commands:
+                            pipeline.submit(cmd)
+
+                    try:
+                        session_name = session_name or config("WHIZTERM_SESSION")
+                        session = get_chat_session(session_name, CLI_SYSTEM_PROMPT, model or get_model_router().default_model) if session_name else None
+                        on_token = show_token if stream else None
+                        result = generate_response(CLI_SYSTEM_PROMPT, command, model, on_token=on_token, use_cache=not no_cache, session=session)
+                        ai_response = result["response"]
+                        served_model = request_attrs["model"] = result["model"]
+                        if stream:
+                            print(escape("".join(partial_line)))
+                        else:
+                            print(escape(ai_response))
+                        if result["semantic"]:
+                            request_attrs["source"] = "semantic"
+                            print(f"[dim]Réponse validée pour « {escape(result['semantic']['text'])} » (similarité {result['semantic']['similarity']:.0%}, {result['total'] * 1000:.0f} ms)[/dim]")
+                        elif result["cached"]:
+                            print(f"[dim]Réponse en cache ({result['total'] * 1e6:.0f} µs)[/dim]")
+                        else:
+                            timing = f"Premier token: {result['ttft'] * 1000:.0f} ms — " if stream and result["ttft"] is not None else ""
+                            fallback = " (repli sollicité)" if result["hedged"] else ""
+                            print(f"[dim]{timing}total: {result['total']:.2f} s — modèle {escape(served_model)}{fallback}[/dim]")
+                    except requests.exceptions.ConnectionError:
+                        ai_response = OLLAMA_CONNECTION_ERROR
+                        print(ai_response)
+                    except ModelNotFoundError:
+                        print()
+                        raise
+
+                    # Extraire les commandes de la réponse
+                    commands = extract_commands(ai_response)
+
+                # Exécuter les commandes qui n'ont pas déjà démarré
+                remaining = commands[len(pipeline.commands):]
+                if remaining and not pipeline.commands:
+                    print("\n[bold yellow]Commandes extraites:[/bold yellow]")
+                for cmd in remaining:
+                    if confirm and not typer.confirm(f"Exécuter « {cmd} » ?", default=True):
+                        continue
+                    pipeline.submit(cmd)
+            finally:
+                plan = pipeline.finish()
+            exit_code = history_exit_code(plan["results"])
+            get_command_history().record(
+                command,
+                pipeline.commands or commands,
+                request_attrs["source"],
+                exit_code,
+                time.perf_counter() - start,
+                request_cwd()
+            )
+            # Une réponse dont les commandes ont réussi sert aux demandes formulées autrement
+            if request_attrs["source"] == "llm" and exit_code == 0:
+                remember_validated_response(CLI_SYSTEM_PROMPT, served_model, command, ai_response)
+
+            if not commands:
+                print("\n[bold yellow]Aucune commande trouvée dans la réponse.[/bold yellow]")
+            elif len(pipeline.commands) > 1:
+                print(
+                    f"[dim]{len(pipeline.commands)} commande(s) en {plan['duration']:.2f} s "
+                    f"(cumulé: {plan['serial_duration']:.2f} s), {plan['failed']} échec(s)[/dim]"
+                )
+        
+        except Exception as e:
+            print(f"[bold red]Erreur:[/bold red] {str(e)}")
+            # Code de sortie non nul, y compris pour le client du démon
+            raise typer.Exit(1)
+
+@app.command()
+def batch(
+    input_file: str = typer.Argument("-", help="Fichier de demandes (une par ligne), - pour l'entrée standard"),
+    output: str = typer.Option("-", "--output", "-o", help="Fichier de résultats JSONL, - pour la sortie standard"),
+    model: Optional[str] = typer.Option(None, "--model", "-m", help="Modèle Ollama à utiliser (choisi parmi WHIZTERM_MODELS par défaut)"),
+    concurrency: int = typer.Option(4, "--concurrency", "-c", help="Nombre maximal de requêtes simultanées vers Ollama"),
+    ordered: bool = typer.Option(True, "--ordered/--as-completed", help="Conserver l'ordre des demandes ou écrire les résultats dès qu'ils sont prêts"),
+    execute: bool = typer.Option(True, "--execute/--dry-run", help="Exécuter les commandes extraites"),
+    timeout: Optional[float] = typer.Option(None, "--timeout", "-t", help="Durée maximale d'exécution de chaque commande, en secondes"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Ignorer le cache de réponses et interroger le modèle"),
+    no_intent: bool = typer.Option(False, "--no-intent", help="Toujours interroger le modèle, sans reconnaissance locale des intentions")
+):
+    """
+    Traite un lot de demandes avec des requêtes simultanées vers Ollama (résultats en JSONL)
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    source = sys.stdin if input_file == "-" else open(input_file, "r", encoding="utf-8")
+    with source:
+        lines = [line.strip() for line in source if line.strip() and not line.lstrip().startswith('#')]
+    sink = sys.stdout if output == "-" else open(output, "w", encoding="utf-8")
+
+    # Les commandes s'exécutent une à une pour éviter les conflits (verrous des gestionnaires de paquets)
+    execution_lock = threading.Lock()
+    command_timeout = timeout if timeout is not None else get_command_timeout()
+
+    def process(index: int, text: str) -> dict:
+        start = time.perf_counter()
+        record = {"index": index, "input": text, "model": model}
+        with get_metrics().span("request", interface="batch") as request_attrs:
+            try:
+                record.update(resolve_request(text, model, use_cache=not no_cache, use_intent=not no_intent))
+                request_attrs.update(source=record["source"], model=record["model"])
+                record["executions"] = []
+                if execute:
+                    for cmd in record["commands"]:
+                        with execution_lock:
+                            result = run_command(prepare_command(cmd), timeout=command_timeout)
+                        record["executions"].append(result.to_dict())
+                    if record["source"] == "llm" and record["executions"] and all(item["returncode"] == 0 and not item["timed_out"] for item in record["executions"]):
+                        remember_validated_response(CLI_SYSTEM_PROMPT, record["model"], text, record["response"])
+                record["error"] = None
+            except Exception as e:
+                record["error"] = str(e)
+        record["total_time"] = time.perf_counter() - start
+        return record
+
+    def write(record: dict):
+        sink.write(json.dumps(record, ensure_ascii=False) + "\n")
+        sink.flush()
+
+    start = time.perf_counter()
+    errors = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="whizterm-batch") as pool:
+            futures = [pool.submit(process, index, text) for index, text in enumerate(lines)]
+            if ordered:
+                records = (future.result() for future in futures)
+            else:
+                records = (future.result() for future in as_completed(futures))
+            for record in records:
+                errors += record["error"] is not None
+                write(record)
+    finally:
+        if sink is not sys.stdout:
+            sink.close()
+    sys.stderr.write(f"{len(lines)} demande(s) traitée(s) en {time.perf_counter() - start:.2f} s ({errors} erreur(s))\n")
+
+@app.command()
+def search_files(
+    query: str,
+    path: str = typer.Option(".", "--path", "-p", help="Répertoire de départ de la recherche"),
+    max_depth: Optional[int] = typer.Option(None, "--max-depth", "-d", help="Profondeur maximale de la recherche"),
+    ext: List[str] = typer.Option([], "--ext", "-x", help="Extensions recherchées (ex: -x pdf -x txt)"),
+    file_type: Optional[str] = typer.Option(None, "--type", help="f pour les fichiers, d pour les dossiers"),
+    workers: int = typer.Option(8, "--workers", "-w", help="Nombre de threads de parcours"),
+    no_ignore: bool = typer.Option(False, "--no-ignore", help="Ne pas appliquer .gitignore ni les exclusions par défaut"),
+    use_index: bool = typer.Option(False, "--index", help="Utiliser l'index persistant des noms de fichiers"),
+    refresh: bool = typer.Option(False, "--refresh", help="Forcer la mise à jour de l'index avant la recherche"),
+    limit: Optional[int] = typer.Option(None, "--limit", "-n", help="Nombre maximal de résultats")
+):
+    """
+    Recherche des fichiers dans le système
+    """
+    try:
+        start = time.perf_counter()
+        path = os.path.join(request_cwd(), os.path.expanduser(path))
+        if use_index:
+            index = FileIndex.for_root(path)
+            max_age = float(config("WHIZTERM_FILE_INDEX_TTL", "300"))
+            if refresh or time.time() - index.updated_at > max_age:
+                print("[dim]Mise à jour de l'index des fichiers...[/dim]")
+                index.refresh(workers, not no_ignore)
+            results = index.search(query, max_depth, ext, file_type)
+        else:
+            results = search_files_iter(query, path, max_depth, ext, file_type, workers, not no_ignore)
+
+        count = 0
+        for result in results:
+            print(f"[blue]{escape(result)}[/blue]")
+            count += 1
+            if limit is not None and count >= limit:
+                break
+        print(f"[dim]{count} résultat(s) en {time.perf_counter() - start:.2f} s[/dim]")
+    except Exception as e:
+        print(f"[bold red]Erreur:[/bold red] {str(e)}")
+
+@app.command()
+def list_models(refresh: bool = typer.Option(False, "--refresh", help="Interroger Ollama sans utiliser la liste en cache")):
+    """
+    Liste les modèles Ollama disponibles
+    """
+    requests = lazy_import("requests")
+    try:
+        models = get_ollama_client().list_models(max_age=0 if refresh else None)
+        print("[bold green]Modèles disponibles:[/bold green]")
+        for model in models:
+            print(f"- {model['name']}")
+        stats = get_model_router().stats()
+        budget = f"budget de latence {stats['budget']:.1f} s" if stats["budget"] > 0 else "sans budget de latence"
+        print(f"[bold green]Routage:[/bold green] {escape(' → '.join(stats['tiers']))} ({budget}, {stats['hedged']} repli(s))")
+        for name, entry in stats["models"].items():
+            if entry["p95"] is None:
+                latency = "aucune mesure récente"
+            else:
+                latency = f"premier token p50 {entry['p50'] * 1000:.0f} ms, p95 {entry['p95'] * 1000:.0f} ms"
+            print(f"- {escape(name)}: {latency}, {entry['served']} requête(s) servie(s)")
+    except requests.exceptions.ConnectionError:
+        print("[bold red]Erreur: Impossible de se connecter à Ollama. Assurez-vous qu'Ollama est en cours d'exécution.[/bold red]")
+    except Exception as e:
+        print(f"[bold red]Erreur:[/bold red] {str(e)}")
+
+@app.command()
+def brew_index(
+    query: Optional[str] = typer.Argument(None, help="Application à rechercher dans l'index"),
+    rebuild: bool = typer.Option(False, "--rebuild", help="Reconstruire l'index à partir du catalogue Homebrew")
+):
+    """
+    Recherche dans l'index local des casks et formules Homebrew
+    """
+    index = get_brew_index()
+    if rebuild or not index.loaded:
+        print("[bold yellow]Construction de l'index Homebrew...[/bold yellow]")
+        try:
+            index.build()
+        except Exception as e:
+            print(f"[bold red]Erreur:[/bold red] {str(e)}")
+            return
+    print(f"[bold green]Index Homebrew:[/bold green] {len(index.entries)} entrées")
+    if query:
+        for result in index.search(query):
+            names = ", ".join(result["names"])
+            print(f"- [blue]{result['token']}[/blue] ({result['type']}) {escape(names)} — {escape(result['desc'])} [dim]{result['score']:.2f}[/dim]")
+
+@app.command()
+def intent_stats(reset: bool = typer.Option(False, "--reset", help="Remettre les compteurs à zéro")):
+    """
+    Affiche la part des demandes traitées sans appel au modèle
+    """
+    router = get_intent_router()
+    if reset:
+        router.stats = {"total": 0, "routed": 0, "intents": {}}
+        router._save_stats()
+    stats = router.stats
+    total = stats["total"]
+    print("[bold green]Intentions reconnues localement:[/bold green]")
+    print(f"- Demandes: {total}, traitées sans le modèle: {stats['routed']} ({stats['routed'] / total if total else 0:.0%})")
+    for intent, count in sorted(stats["intents"].items(), key=lambda item: -item[1]):
+        print(f"- {intent}: {count} ({count / total if total else 0:.0%})")
+
+@app.command()
+def cache_stats(clear: bool = typer.Option(False, "--clear", help="Vider le cache de réponses")):
+    """
+    Affiche les statistiques du cache de réponses et du cache sémantique
+    """
+    cache = get_response_cache()
+    if clear:
+        cache.clear()
+        if get_semantic_cache() is not None:
+            get_semantic_cache().clear()
+        print("[bold green]Cache vidé.[/bold green]")
+    stats = cache.stats()
+    print("[bold green]Cache de réponses:[/bold green]")
+    print(f"- Entrées: {stats['entries']} ({stats['bytes']} octets)")
+    print(f"- Succès: {stats['hits']} / Échecs: {stats['misses']} (taux: {stats['hit_rate']:.0%})")
+    print(f"- Évictions: {stats['evictions']}")
+    print(f"- Fichier: {cache.path or 'désactivé'}")
+    semantic = get_semantic_cache()
+    if semantic is None:
+        print("[bold green]Cache sémantique:[/bold green] désactivé")
+        return
+    stats = semantic.stats()
+    print(f"[bold green]Cache sémantique:[/bold green] ({semantic.model}, seuil {semantic.threshold:.2f}, calcul {stats['backend']})")
+    print(f"- Réponses validées: {stats['entries']} / {semantic.max_entries}")
+    print(f"- Succès: {stats['hits']} / Échecs: {stats['misses']} (taux: {stats['hit_rate']:.0%})")
+    print(f"- Évictions: {stats['evictions']}, erreurs d'embeddings: {stats['errors']}")
+    print(f"- Fichier: {semantic.path or 'désactivé'}")
+
+@app.command()
+def session(
+    name: str = typer.Argument(..., help="Nom de la conversation"),
+    clear: bool = typer.Option(False, "--clear", help="Effacer l'historique de la conversation")
+):
+    """
+    Affiche ou efface l'historique d'une conversation (process-command --session)
+    """
+    chat_session = get_chat_session(name, CLI_SYSTEM_PROMPT)
+    if clear:
+        chat_session.clear()
+        print(f"[bold green]Conversation {escape(name)} effacée.[/bold green]")
+        return
+    print(f"[bold green]Conversation {escape(name)}[/bold green] ({len(chat_session.history) // 2} échange(s), ~{chat_session.history_tokens()} / {chat_session.max_tokens} tokens):")
+    for message in chat_session.history:
+        role = "Vous" if message["role"] == "user" else "AI"
+        print(f"[bold]{role}:[/bold] {escape(message['content'])}")
+
+@app.command()
+def history(
+    query: Optional[str] = typer.Argument(None, help="Texte recherché dans les demandes"),
+    limit: int = typer.Option(20, "--limit", "-n", help="Nombre maximal d'exécutions affichées"),
+    clear: bool = typer.Option(False, "--clear", help="Effacer l'historique")
+):
+    """
+    Affiche l'historique des demandes et des commandes exécutées
+    """
+    command_history = get_command_history()
+    if clear:
+        command_history.clear()
+        print("[bold green]Historique effacé.[/bold green]")
+        return
+    start = time.perf_counter()
+    runs = command_history.runs(query or "", limit)
+    elapsed = time.perf_counter() - start
+    for run in reversed(runs):
+        date = time.strftime("%Y-%m-%d %H:%M", time.localtime(run["created_at"]))
+        if run["exit_code"] is None:
+            status = "[dim]non exécutée[/dim]"
+        elif run["exit_code"] == 0:
+            status = "[green]succès[/green]"
+        else:
+            status = f"[red]code {run['exit_code']}[/red]"
+        print(f"[dim]{date}[/dim] [bold]{escape(run['input'])}[/bold] ({run['source']}, {run['duration']:.2f} s, {status})")
+        for cmd in run["commands"]:
+            print(f"    [blue]{escape(cmd)}[/blue]")
+    stats = command_history.stats()
+    print(f"[dim]{len(runs)} exécution(s) affichée(s) sur {stats['runs']} ({stats['inputs']} demandes distinctes, {elapsed * 1000:.2f} ms)[/dim]")
+
+@app.command()
+def metrics(
+    output_format: str = typer.Option("summary", "--format", "-f", help="summary ou prometheus"),
+    trace_file: Optional[str] = typer.Option(None, "--traces", help="Fichier de traces JSONL (WHIZTERM_TRACE_FILE par défaut)"),
+    output: Optional[str] = typer.Option(None, "--output", "-o", help="Écrire l'instantané dans un fichier")
+):
+    """
+    Affiche la durée de chaque étape (IA, extraction, Homebrew, commandes) à partir des traces
+    """
+    trace_file = trace_file or get_metrics().trace_path
+    collector = Metrics()
+    count = collector.load_traces(trace_file) if trace_file else 0
+    if output_format == "prometheus":
+        text = collector.prometheus_text()
+        if output:
+            with open(output, "w", encoding="utf-8") as f:
+                f.write(text)
+        else:
+            sys.stdout.write(text)
+        return
+    if output_format != "summary":
+        print(f"[bold red]Erreur:[/bold red] format inconnu: {output_format}")
+        raise typer.Exit(1)
+
+    summary = collector.summary()
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        return
+    print(f"[bold green]Métriques[/bold green] ({count} spans, {trace_file or 'traces désactivées'}):")
+    for name, stage in sorted(summary["stages"].items(), key=lambda item: -item[1]["count"] * item[1]["mean"]):
+        errors = f", {stage['errors']} erreur(s)" if stage["errors"] else ""
+        print(f"- {name:<12} {stage['count']:>6} × moyenne {stage['mean'] * 1000:9.1f} ms, max {stage['max'] * 1000:9.1f} ms{errors}")
+    if summary["tokens_per_second"]:
+        print(f"- Tokens générés: {summary['tokens']['eval']} ({summary['tokens_per_second']:.1f} tokens/s), tokens du prompt: {summary['tokens']['prompt']}")
+
+# def interactive_mode():
+#     print("[bold cyan]Bienvenue dans le mode interactif de WhizTerm.[/bold cyan]")
+#     print("Entrez 'quitter' pour sortir.")
+#     while True:
+#         command_input = input("> ")
+#         if command_input.lower() == 'quitter':
+#             break
+#         try:
+#             if command_input.strip():
+#                 parts = command_input.split(maxsplit=1)
+#                 cmd_name = parts[0]
+#                 args = parts[1] if len(parts) > 1 else ""
+#                 typer_command = None
+#                 for command_info in app.registered_commands:
+#                     if command_info.name == cmd_name:
+#                         typer_command = command_info.callback
+#                         break
+                
+#                 if typer_command:
+#                     if cmd_name == 'process-command':
+#                         process_command(command=args, model="mistral") 
+#                     elif cmd_name == 'search-files':
+#                         search_files(query=args)
+#                     elif cmd_name == 'list-models':
+#                         list_models()
+#                     else:
+#                         print(f"[bold red]Commande Typer non gérée en mode interactif: {cmd_name}[/bold red]")
+#                 else:
+#                     process_command(command=command_input, model="mistral")
+            
+#         except Exception as e:
+#             print(f"[bold red]Erreur en mode interactif:[/bold red] {str(e)}")
+
+class ThreadLocalStream(io.TextIOBase):
+    """
+    Flux de sortie redirigé thread par thread
+    Chaque client du démon reçoit la sortie des commandes exécutées dans son thread.
+    """
+    def __init__(self, default):
+        self.default = default
+        self.local = threading.local()
+
+    @property
+    def target(self):
+        return getattr(self.local, "stream", None) or self.default
+
+    def write(self, data):
+        return self.target.write(data)
+
+    def flush(self):
+        self.target.flush()
+
+    def isatty(self):
+        return False
+
+class SocketStream(io.TextIOBase):
+    """Flux qui transmet la sortie au client sous forme de messages JSON"""
+    def __init__(self, connection: socket.socket, kind: str, lock: threading.Lock):
+        self.connection = connection
+        self.kind = kind
+        self.lock = lock
+
+    def write(self, data):
+        if isinstance(data, (bytes, bytearray)):
+            data = bytes(data).decode("utf-8", errors="replace")
+        if data:
+            message = json.dumps({"type": self.kind, "data": data}).encode("utf-8") + b"\n"
+            with self.lock:
+                self.connection.sendall(message)
+        return len(data)
+
+    def isatty(self):
+        return False
+
+class WhizTermDaemon:
+    """
+    Démon résident : garde le client Ollama, les caches, les index et le modèle chargés
+    Les clients se connectent sur un socket Unix, envoient leur ligne de commande
+    et reçoivent la sortie au fil de l'exécution. Chaque client est servi dans son propre thread.
+    """
+    def __init__(self, socket_path: str, max_clients: int = 16):
+        self.socket_path = socket_path
+        self.slots = threading.BoundedSemaphore(max_clients)
+        self.server = None
+
+    def warm_up(self, model: Optional[str] = None):
+        """Prépare l'état partagé : configuration, client, caches, index et modèles"""
+        get_ollama_client()
+        get_response_cache()
+        get_intent_router()
+        get_app_index().refresh()
+        get_brew_index()
+        for name in [model] if model else get_model_router().tiers:
+            try:
+                get_ollama_client().warm_up(name)
+            except Exception as e:
+                print(f"[bold yellow]Préchargement du modèle {escape(name)} impossible:[/bold yellow] {str(e)}")
+
+    def serve_forever(self):
+        socketserver = lazy_import("socketserver")
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                with daemon.slots:
+                    daemon.handle_client(self.connection, self.rfile)
+
+        os.makedirs(os.path.dirname(self.socket_path) or ".", mode=0o700, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        # Socket créé directement en 0600 : aucun autre utilisateur ne peut s'y connecter entre bind et chmod
+        umask = os.umask(0o177)
+        try:
+            self.server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        finally:
+            os.umask(umask)
+        self.server.daemon_threads = True
+
+        # Sortie des commandes redirigée vers le client du thread courant
+        sys.stdout = ThreadLocalStream(sys.stdout)
+        sys.stderr = ThreadLocalStream(sys.stderr)
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            sys.stdout = sys.stdout.default
+            sys.stderr = sys.stderr.default
+
+    def shutdown(self):
+        if self.server:
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+    @staticmethod
+    def _relay_stdin(rfile, writer: int):
+        # Fin du relais à la fin de l'entrée du client ou de la requête (tube fermé)
+        try:
+            for line in rfile:
+                message = json.loads(line)
+                data = base64.b64decode(message["data"]) if message.get("type") == "stdin" else b""
+                if not data:
+                    break
+                os.write(writer, data)
+        except (OSError, ValueError, KeyError):
+            pass
+        finally:
+            os.close(writer)
+
+    def handle_client(self, connection: socket.socket, rfile):
+        lock = threading.Lock()
+        line = rfile.readline()
+        if not line:
+            # Simple test de présence (voir `whizterm serve`)
+            return
+        try:
+            request = json.loads(line)
+            argv = request["argv"]
+            if not argv or argv[0] not in DAEMON_COMMANDS:
+                raise ValueError(f"commande non prise en charge par le démon: {argv[:1]}")
+        except Exception as e:
+            try:
+                SocketStream(connection, "stderr", lock).write(f"Requête invalide: {str(e)}\n")
+                connection.sendall(json.dumps({"type": "exit", "code": 2}).encode("utf-8") + b"\n")
+            except OSError:
+                pass
+            return
+
+        sys.stdout.local.stream = SocketStream(connection, "stdout", lock)
+        sys.stderr.local.stream = SocketStream(connection, "stderr", lock)
+        _request_context.cwd = request.get("cwd")
+        _request_context.env = request.get("env")
+        stdin = None
+        if request.get("stdin"):
+            # Entrée du client relayée dans un tube, hérité par les commandes exécutées
+            stdin, writer = os.pipe()
+            threading.Thread(target=self._relay_stdin, args=(rfile, writer), daemon=True).start()
+        _request_context.stdin = stdin
+        code = 0
+        try:
+            command = typer.main.get_command(app)
+            # Hors mode autonome, typer.Exit(code) est retourné au lieu de quitter
+            result = command.main(args=argv, prog_name="whizterm", standalone_mode=False)
+            code = result if isinstance(result, int) else 0
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 1
+        except (BrokenPipeError, ConnectionResetError):
+            return
+        except Exception as e:
+            if hasattr(e, "show"):
+                e.show()
+                code = getattr(e, "exit_code", 1)
+            else:
+                sys.stderr.write(f"Erreur: {str(e)}\n")
+                code = 1
+        finally:
+            sys.stdout.local.stream = None
+            sys.stderr.local.stream = None
+            _request_context.cwd = _request_context.env = _request_context.stdin = None
+            if stdin is not None:
+                os.close(stdin)
+        try:
+            with lock:
+                connection.sendall(json.dumps({"type": "exit", "code": code}).encode("utf-8") + b"\n")
+        except OSError:
+            pass
+
+@app.command()
+def serve(
+    socket_path: Optional[str] = typer.Option(None, "--socket", help="Chemin du socket Unix (WHIZTERM_SOCKET par défaut)"),
+    model: Optional[str] = typer.Option(None, "--model", "-m", help="Modèle à précharger (tous ceux de WHIZTERM_MODELS par défaut)"),
+    max_clients: int = typer.Option(16, "--max-clients", help="Nombre maximal de clients servis simultanément"),
+    warm_up: bool = typer.Option(True, "--warm-up/--no-warm-up", help="Précharger le modèle et les index au démarrage")
+):
+    """
+    Démarre le démon WhizTerm (les commandes process-command, search-files et list-models lui sont transmises)
+    """
+    socket_path = socket_path or daemon_socket_path()
+    if os.path.exists(socket_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+            print(f"[bold red]Erreur:[/bold red] un démon écoute déjà sur {socket_path}")
+            raise typer.Exit(1)
+        except OSError:
+            pass
+        finally:
+            probe.close()
+
+    daemon = WhizTermDaemon(socket_path, max_clients)
+    if warm_up:
+        print("[dim]Préchargement du modèle et des index...[/dim]")
+        daemon.warm_up(model)
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.shutdown())
+    print(f"[bold green]WhizTerm à l'écoute sur[/bold green] {socket_path}")
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print("[bold yellow]Démon arrêté.[/bold yellow]")
+
+@app.callback()
+def main(
+    ctx: typer.Context,
+    debug_mode: bool = typer.Option(False, "--debug", help="Afficher les messages de débogage"),
+    startup_profile: bool = typer.Option(False, "--startup-profile", help="Afficher la répartition du temps de démarrage")
+):
+    """
+    WhizTerm : assistant terminal en langage naturel
+    """
+    if debug_mode:
+        os.environ["WHIZTERM_DEBUG"] = "1"
+    if startup_profile:
+        ctx.call_on_close(print_startup_profile)
+
+def print_startup_profile():
+    """Affiche le temps passé dans chaque import et dans le chargement de la configuration"""
+    sys.stderr.write("Profil de démarrage :\n")
+    for name, duration in _startup_timings.items():
+        sys.stderr.write(f"  {name:<24} {duration * 1000:8.1f} ms\n")
+    sys.stderr.write(f"  {'total (CPU du processus)':<24} {time.process_time() * 1000:8.1f} ms\n")
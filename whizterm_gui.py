@@ -0,0 +1,1000 @@
+"""
+Interface graphique de WhizTerm
+Chargée uniquement au lancement sans argument, pour que la ligne de commande
+n'ait pas à importer Tk et customtkinter.
+"""
+import io
+import os
+import re
+import shlex
+import subprocess
+import sys
+import threading
+import time
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+import customtkinter
+import requests
+from rich import print
+from rich.markup import escape
+
+from whizterm_core import (
+    CancelToken,
+    ChatSession,
+    CommandPipeline,
+    CommandResult,
+    CommandStreamParser,
+    OperationCancelled,
+    ShellSession,
+    config,
+    extract_commands,
+    generate_response,
+    get_command_history,
+    get_command_timeout,
+    get_command_workers,
+    get_intent_router,
+    get_metrics,
+    get_model_router,
+    get_ollama_client,
+    history_exit_code,
+    history_reuse_enabled,
+    normalize_prompt,
+    remember_validated_response,
+    run_command,
+)
+
+# Chemin d'un journal de sortie complète, rendu cliquable dans la zone de texte
+LOG_LINK_PATTERN = re.compile(r"Sortie complète : (.+\.log)$", re.M)
+
+class OutputRedirector(io.StringIO):
+    """
+    Redirige stdout/stderr vers la zone de texte de l'interface
+    Les écritures (depuis n'importe quel thread) sont regroupées dans un tampon
+    vidé dans le widget une fois par trame, et l'historique est limité à max_lines lignes.
+    Les chemins de journaux de sortie sont cliquables (on_link(path)).
+    """
+    def __init__(self, text_widget, max_lines: int = 10000, frame_ms: int = 16, max_pending_bytes: int = 1024 * 1024,
+                 on_link: Optional[Callable[[str], None]] = None):
+        super().__init__()
+        self.text_widget = text_widget
+        self.on_link = on_link
+        if on_link:
+            self.text_widget.tag_config("log_link", foreground="deep sky blue", underline=True)
+            self.text_widget.tag_bind("log_link", "<Button-1>", self._open_link)
+        self.max_lines = max_lines
+        self.frame_ms = frame_ms
+        self.max_pending_bytes = max_pending_bytes
+        self._pending = []
+        self._pending_bytes = 0
+        self._lock = threading.Lock()
+        self._line_count = 1
+        # Compteurs de débit
+        self.total_writes = 0
+        self.total_chars = 0
+        self.flushes = 0
+        self.dropped_chars = 0
+        self._started = time.perf_counter()
+        self.text_widget.after(self.frame_ms, self._flush_frame)
+
+    def write(self, string):
+        if not string:
+            return 0
+        with self._lock:
+            self._pending.append(string)
+            self._pending_bytes += len(string)
+            self.total_writes += 1
+            self.total_chars += len(string)
+            # Ne garder en attente que ce qui peut encore être affiché
+            if self._pending_bytes > self.max_pending_bytes:
+                self._compact_pending()
+        return len(string)
+
+    def _compact_pending(self):
+        text = "".join(self._pending)
+        tail = self._tail_lines(text, self.max_lines)
+        tail = tail[-self.max_pending_bytes:]
+        self.dropped_chars += len(text) - len(tail)
+        self._pending = [tail]
+        self._pending_bytes = len(tail)
+
+    @staticmethod
+    def _tail_lines(text: str, max_lines: int) -> str:
+        """Retourne les max_lines dernières lignes du texte"""
+        if text.count("\n") < max_lines:
+            return text
+        index = len(text)
+        for _ in range(max_lines):
+            index = text.rfind("\n", 0, index)
+            if index < 0:
+                return text
+        return text[index + 1:]
+
+    def _flush_frame(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = []
+            self._pending_bytes = 0
+        if pending:
+            self._write_to_widget(self._tail_lines("".join(pending), self.max_lines))
+            self.flushes += 1
+        self.text_widget.after(self.frame_ms, self._flush_frame)
+
+    def _write_to_widget(self, string):
+        self.text_widget.configure(state="normal")
+        start = self.text_widget.index("end-1c")
+        self.text_widget.insert("end", string)
+        if self.on_link:
+            for match in LOG_LINK_PATTERN.finditer(string):
+                self.text_widget.tag_add("log_link", f"{start}+{match.start(1)}c", f"{start}+{match.end(1)}c")
+        # Limiter l'historique affiché
+        self._line_count += string.count("\n")
+        excess = self._line_count - self.max_lines
+        if excess > 0:
+            self.text_widget.delete("1.0", f"{excess + 1}.0")
+            self._line_count -= excess
+        self.text_widget.see("end")
+        self.text_widget.configure(state="disabled")
+
+    def _open_link(self, event):
+        index = self.text_widget.index(f"@{event.x},{event.y}+1c")
+        link = self.text_widget.tag_prevrange("log_link", index)
+        if link:
+            self.on_link(self.text_widget.get(*link))
+
+    def stats(self) -> dict:
+        """Statistiques de débit de la sortie"""
+        elapsed = time.perf_counter() - self._started
+        return {
+            "writes": self.total_writes,
+            "chars": self.total_chars,
+            "flushes": self.flushes,
+            "dropped_chars": self.dropped_chars,
+            "chars_per_second": self.total_chars / elapsed if elapsed > 0 else 0.0
+        }
+
+    def flush(self):
+        pass
+
+class CommandOutputView:
+    """
+    Affichage borné de la sortie d'une commande
+    Les premières lignes sont affichées au fil de l'exécution, les dernières sont
+    conservées dans un anneau et affichées à la fin ; le reste est résumé en une ligne.
+    """
+    def __init__(self, label: str = "", max_lines: int = 300):
+        self.label = label
+        self.head_lines = max(1, max_lines * 4 // 5)
+        self.tail = deque(maxlen=max(1, max_lines - self.head_lines))
+        self.shown = 0
+        self.hidden = 0
+
+    def write(self, line: str, stream: str = "stdout"):
+        line = line.rstrip("\r\n")
+        if self.shown < self.head_lines:
+            self.shown += 1
+            print(escape(self.label + line))
+            return
+        if len(self.tail) == self.tail.maxlen:
+            self.hidden += 1
+        self.tail.append(line)
+
+    def finish(self, result: Optional[CommandResult] = None):
+        """Affiche les dernières lignes et les chemins des journaux de sortie complète"""
+        if self.hidden:
+            print(escape(f"{self.label}[... {self.hidden} lignes masquées ...]"))
+        for line in self.tail:
+            print(escape(self.label + line))
+        self.tail.clear()
+        self.hidden = 0
+        if result is not None:
+            for path in result.logs:
+                # Écrit tel quel : rich ne doit pas couper le chemin
+                sys.stdout.write(f"{self.label}Sortie complète : {path}\n")
+
+class BackgroundJob:
+    """Tâche de l'interface graphique exécutée en arrière-plan"""
+    def __init__(self, description: str):
+        self.description = description
+        self.cancel = CancelToken()
+        self.started = False
+        self.superseded = False
+
+class BackgroundExecutor:
+    """
+    Exécute les commandes de l'interface graphique hors du thread Tk
+    Les tâches passent par un pool de threads borné (et sa file d'attente) ;
+    les résultats et mises à jour de l'interface sont renvoyés au thread Tk
+    via une file lue périodiquement avec after().
+    """
+    def __init__(self, widget, max_workers: int = 1, max_pending: int = 8, poll_interval_ms: int = 16):
+        self.widget = widget
+        self.max_pending = max_pending
+        self.poll_interval_ms = poll_interval_ms
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="whizterm-worker")
+        self.jobs = []
+        self._main_thread_calls = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self.widget.after(self.poll_interval_ms, self._poll)
+
+    def submit(self, description: str, fn: Callable, on_done: Optional[Callable] = None) -> Optional[BackgroundJob]:
+        """
+        Planifie fn(cancel) dans le pool ; on_done(job, result, error) est appelé dans le thread Tk
+        Retourne None si la file d'attente est pleine
+        """
+        with self._lock:
+            if len(self.jobs) >= self.max_pending:
+                return None
+            job = BackgroundJob(description)
+            self.jobs.append(job)
+        self.pool.submit(self._run, job, fn, on_done)
+        return job
+
+    def call_in_main(self, fn: Callable, *args):
+        """Demande l'exécution de fn dans le thread Tk"""
+        self._main_thread_calls.put((fn, args))
+
+    def running_job(self) -> Optional[BackgroundJob]:
+        with self._lock:
+            for job in self.jobs:
+                if job.started and not job.cancel.cancelled:
+                    return job
+            return None
+
+    def cancel_all(self):
+        with self._lock:
+            jobs = list(self.jobs)
+        for job in jobs:
+            job.cancel.cancel()
+
+    def shutdown(self):
+        self.cancel_all()
+        self.pool.shutdown(wait=False)
+
+    def _run(self, job: BackgroundJob, fn: Callable, on_done: Optional[Callable]):
+        job.started = True
+        result, error = None, None
+        try:
+            job.cancel.raise_if_cancelled()
+            result = fn(job.cancel)
+        except BaseException as e:
+            error = e
+        with self._lock:
+            self.jobs.remove(job)
+        if on_done:
+            self.call_in_main(on_done, job, result, error)
+
+    def _poll(self):
+        while True:
+            try:
+                fn, args = self._main_thread_calls.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"Erreur: {str(e)}")
+        self.widget.after(self.poll_interval_ms, self._poll)
+
+class RequestManager:
+    """
+    Demandes de l'interface graphique adressées au modèle, en attente ou en cours
+    - une demande identique à une demande en cours est ignorée : une double validation
+      n'appelle pas Ollama une seconde fois et n'exécute pas ses commandes deux fois ;
+    - une nouvelle demande annule les précédentes tant que leurs commandes n'ont pas démarré
+      (en file d'attente, en attente d'une place ou pendant la réponse du modèle) ;
+    - au plus max_concurrent appels au modèle sont en cours en même temps.
+    """
+    def __init__(self, max_concurrent: int = 2, supersede: bool = True):
+        self.max_concurrent = max(1, max_concurrent)
+        self.supersede = supersede
+        self._jobs = {}  # demande normalisée -> tâche
+        self._started = set()  # jetons des tâches dont les commandes ont démarré
+        self._holders = set()  # jetons des tâches qui occupent une place
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._lock = threading.Lock()
+        self.coalesced = 0
+        self.superseded = 0
+        self.throttled = 0
+
+    def find(self, prompt: str) -> Optional[BackgroundJob]:
+        """Tâche en attente ou en cours pour la même demande"""
+        with self._lock:
+            job = self._jobs.get(normalize_prompt(prompt))
+            if job is not None and not job.cancel.cancelled:
+                return job
+            return None
+
+    def add(self, prompt: str, job: BackgroundJob) -> List[BackgroundJob]:
+        """Enregistre la tâche d'une nouvelle demande et annule celles qu'elle remplace"""
+        with self._lock:
+            replaced = []
+            if self.supersede:
+                replaced = [
+                    other for other in self._jobs.values()
+                    if not other.cancel.cancelled and other.cancel not in self._started
+                ]
+            self._jobs[normalize_prompt(prompt)] = job
+            self.superseded += len(replaced)
+        for other in replaced:
+            other.superseded = True
+            other.cancel.cancel()
+        return replaced
+
+    def coalesce(self, prompt: str) -> bool:
+        """Vrai si une demande identique est déjà en attente ou en cours (la nouvelle est alors ignorée)"""
+        if self.find(prompt) is None:
+            return False
+        with self._lock:
+            self.coalesced += 1
+        return True
+
+    def remove(self, prompt: str, job: BackgroundJob):
+        with self._lock:
+            key = normalize_prompt(prompt)
+            if self._jobs.get(key) is job:
+                del self._jobs[key]
+            self._started.discard(job.cancel)
+        # Tâche terminée : libérer sa place
+        self.release(job.cancel)
+
+    def acquire(self, cancel: CancelToken, on_wait: Optional[Callable[[], None]] = None):
+        """Réserve une place pour un appel au modèle (attend qu'un appel en cours se termine si besoin)"""
+        if not self._slots.acquire(blocking=False):
+            self.throttled += 1
+            if on_wait is not None:
+                on_wait()
+            while not self._slots.acquire(timeout=0.05):
+                cancel.raise_if_cancelled()
+        with self._lock:
+            self._holders.add(cancel)
+
+    def release(self, cancel: CancelToken):
+        """Libère la place réservée par acquire (sans effet si la tâche n'en occupe pas)"""
+        with self._lock:
+            if cancel not in self._holders:
+                return
+            self._holders.discard(cancel)
+        self._slots.release()
+
+    def mark_started(self, cancel: CancelToken):
+        """Les commandes de la demande démarrent : elle ne peut plus être remplacée"""
+        with self._lock:
+            self._started.add(cancel)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": len(self._jobs),
+                "running": len(self._holders),
+                "coalesced": self.coalesced,
+                "superseded": self.superseded,
+                "throttled": self.throttled
+            }
+
+# Prompt système de l'interface graphique
+GUI_SYSTEM_PROMPT = """Tu es un assistant concis pour macOS.
+            - Réponds en une seule phrase courte
+            - Pour installer des applications sur macOS, utilise uniquement 'brew install --cask'
+            - Pour désinstaller des applications sur macOS, utilise uniquement 'brew uninstall --cask'
+            - N'utilise jamais apt, apt-get ou d'autres gestionnaires Linux
+            - Mets les commandes entre ```
+            - Pas d'explications, juste la commande
+            -Pas d'explications supplémentaires ni de texte qui n'est pas demande 
+            - Si c'est une salutation, réponds simplement le plus court possible
+            - Si c'est une question, donne une réponse directe rien de plus
+            - Si c'est une demande de commande, donne uniquement la commande entre ```
+            - Pas de traduction ou d'explications linguistiques repond le plus petit possible"""
+
+# Libellés des étapes dans la barre d'état
+STAGE_LABELS = {
+    "cache": "cache",
+    "semantic": "sémantique",
+    "llm": "IA",
+    "extract": "extraction",
+    "cask_lookup": "brew",
+    "app_lookup": "apps",
+    "command": "commandes"
+}
+
+def format_duration(seconds: float) -> str:
+    return f"{seconds * 1000:.0f} ms" if seconds < 1 else f"{seconds:.2f} s"
+
+def format_trace(trace: dict) -> str:
+    """Résumé compact d'une trace : durée par étape, débit de tokens et durée totale"""
+    totals = {}
+    llm = None
+    for span in trace.get("children", []):
+        totals[span["name"]] = totals.get(span["name"], 0.0) + span["duration"]
+        if span["name"] == "llm":
+            llm = span["attrs"]
+    parts = []
+    for name, label in STAGE_LABELS.items():
+        if name not in totals:
+            continue
+        text = f"{label} {format_duration(totals[name])}"
+        if name == "llm" and llm:
+            details = []
+            if llm.get("ttft") is not None:
+                details.append(f"1er token {format_duration(llm['ttft'])}")
+            if llm.get("tokens_per_second"):
+                details.append(f"{llm['tokens_per_second']:.0f} tok/s")
+            if details:
+                text += f" ({', '.join(details)})"
+        parts.append(text)
+    parts.append(f"total {format_duration(trace['duration'])}")
+    return " · ".join(parts)
+
+class App(customtkinter.CTk):
+    def __init__(self):
+        super().__init__()
+
+        self.title("WhizTerm")
+        self.geometry("800x600")
+        
+        # thème sombre
+        customtkinter.set_appearance_mode("dark")
+        customtkinter.set_default_color_theme("blue")
+        
+        # couleur de fond en noir
+        self.configure(fg_color="black")
+
+        self.current_directory = os.getcwd()
+
+        # Ajouter le chemin de Homebrew au PATH
+        homebrew_path = "/opt/homebrew/bin"
+        if os.path.exists(homebrew_path):
+            os.environ["PATH"] = f"{homebrew_path}:{os.environ['PATH']}"
+
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1) 
+
+        # Frame pour la zone de saisie en haut
+        self.input_frame = customtkinter.CTkFrame(self, fg_color="black", corner_radius=0)
+        self.input_frame.grid(row=0, column=0, sticky="ew", padx=10, pady=(10, 0))
+        self.input_frame.grid_columnconfigure(1, weight=1)
+
+        # Prompt du terminal 
+        self.prompt_label = customtkinter.CTkLabel(
+            self.input_frame,
+            text="$ ",
+            text_color="lime green",
+            font=("Courier", 14)
+        )
+        self.prompt_label.grid(row=0, column=0, padx=(5, 0))
+
+        # Champ de saisie pour les commandes (en haut)
+        self.input_entry = customtkinter.CTkEntry(
+            self.input_frame,
+            placeholder_text="run commands...",
+            border_width=0,
+            fg_color="black",
+            text_color="white",
+            font=("Courier", 14)
+        )
+        self.input_entry.grid(row=0, column=1, sticky="ew", padx=5)
+        self.input_entry.bind("<Return>", self.process_gui_command)
+        self.input_entry.bind("<Up>", self.history_previous)
+        self.input_entry.bind("<Down>", self.history_next)
+        self.input_entry.bind("<Tab>", self.accept_suggestion)
+        self.input_entry.bind("<Right>", self.accept_suggestion)
+        self.input_entry.bind("<KeyRelease>", self.update_suggestion)
+
+        # Suggestion tirée de l'historique (Tab ou → pour l'accepter)
+        self.suggestion_label = customtkinter.CTkLabel(
+            self.input_frame,
+            text="",
+            text_color="gray40",
+            font=("Courier", 12),
+            anchor="w"
+        )
+        self.suggestion_label.grid(row=1, column=1, sticky="ew", padx=5)
+        self.suggestion = None
+        # Navigation dans l'historique : demandes contenant le texte saisi avant la première flèche
+        self.history_query = ""
+        self.history_matches = []
+        self.history_index = -1
+
+        # Indicateur d'exécution en cours (Échap pour annuler)
+        self.status_label = customtkinter.CTkLabel(
+            self.input_frame,
+            text="",
+            text_color="orange",
+            font=("Courier", 12)
+        )
+        self.status_label.grid(row=0, column=2, padx=(0, 5))
+        self.bind("<Escape>", self.cancel_current_job)
+        self.spinner_index = 0
+
+        # Zone de texte pour la sortie 
+        self.output_textbox = customtkinter.CTkTextbox(
+            self,
+            state="disabled",
+            wrap="word",
+            fg_color="black",
+            text_color="white",
+            font=("Courier", 12)
+        )
+        self.output_textbox.grid(row=1, column=0, padx=10, pady=10, sticky="nsew")
+
+        # Barre d'état : durée des étapes de la dernière requête
+        self.metrics_label = customtkinter.CTkLabel(
+            self,
+            text="",
+            text_color="gray60",
+            font=("Courier", 11),
+            anchor="w"
+        )
+        self.metrics_label.grid(row=2, column=0, padx=10, pady=(0, 5), sticky="ew")
+
+        # Redirection stdout/stderr
+        self.redirector = OutputRedirector(
+            self.output_textbox,
+            max_lines=int(config("WHIZTERM_SCROLLBACK_LINES", "10000")),
+            on_link=self.open_log
+        )
+        sys.stdout = self.redirector
+        sys.stderr = self.redirector
+
+        # Chargement du modèle pendant que l'utilisateur saisit sa première demande
+        get_ollama_client().warm_up_in_background(get_model_router().default_model)
+
+        # Shell persistant : répertoire courant, variables et alias conservés d'une commande à l'autre
+        self.shell = ShellSession(cwd=self.current_directory) if config("WHIZTERM_PERSISTENT_SHELL", "1") != "0" else None
+
+        # Conversation avec le modèle (WHIZTERM_GUI_SESSION=1) : les demandes suivantes tiennent compte
+        # des précédentes, mais une réponse en cache ne sert alors qu'à un historique identique
+        self.chat_session = ChatSession(
+            GUI_SYSTEM_PROMPT, get_model_router().default_model, max_tokens=int(config("WHIZTERM_HISTORY_TOKENS", "2048"))
+        ) if config("WHIZTERM_GUI_SESSION", "0") == "1" else None
+
+        # Exécution des commandes en arrière-plan pour garder l'interface fluide
+        workers = int(config("WHIZTERM_GUI_WORKERS", "1"))
+        self.executor = BackgroundExecutor(self, max_workers=workers)
+        # Demandes au modèle : doublons ignorés, remplacement des demandes obsolètes, appels simultanés limités
+        # (au plus un par worker : un plafond supérieur serait sans effet)
+        self.llm_requests = RequestManager(
+            max_concurrent=min(workers, int(config("WHIZTERM_LLM_MAX_REQUESTS", str(workers)))),
+            supersede=config("WHIZTERM_SUPERSEDE", "1") != "0"
+        )
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.update_status()
+        get_metrics().listeners.append(lambda trace: self.executor.call_in_main(self.show_metrics, trace))
+        
+        # Message de bienvenue
+        # print("[bold cyan]Bienvenue dans WhizTerm.[/bold cyan]")
+
+    def update_prompt(self):
+        """Met à jour le prompt avec le répertoire courant"""
+        current_dir = os.path.basename(self.current_directory) or '/'
+        self.prompt_label.configure(text=f"{current_dir} $ ")
+
+    def update_status(self):
+        """Anime l'indicateur d'exécution tant qu'une tâche est en cours"""
+        if self.executor.jobs:
+            frames = "⠋⠙⠹⠸⠼⠴⠦⠧⠇⠏"
+            self.spinner_index = (self.spinner_index + 1) % len(frames)
+            self.status_label.configure(text=f"{frames[self.spinner_index]} en cours (Échap pour annuler)")
+        else:
+            self.status_label.configure(text="")
+        self.after(100, self.update_status)
+
+    def cancel_current_job(self, event=None):
+        """Annule la requête ou la commande en cours d'exécution"""
+        job = self.executor.running_job()
+        if job is not None:
+            job.cancel.cancel()
+
+    def show_metrics(self, trace: dict):
+        """Affiche dans la barre d'état la durée des étapes de la dernière requête"""
+        self.metrics_label.configure(text=format_trace(trace))
+
+    def on_close(self):
+        self.executor.shutdown()
+        if self.shell is not None:
+            self.shell.close()
+        self.destroy()
+
+    def execute_shell_command(self, command: str, cancel: Optional[CancelToken] = None):
+        """
+        Exécute une commande shell en tenant compte du répertoire courant
+        Retourne le résultat de la commande (un booléen pour cd, None en cas d'erreur)
+        """
+        if self.shell is not None:
+            try:
+                return self.execute_in_shell(command, cancel)
+            except OSError as e:
+                # Pseudo-terminal indisponible : revenir à un shell par commande
+                print(f"Shell persistant indisponible ({str(e)}), exécution commande par commande")
+                self.shell = None
+        try:
+            if command.startswith('cd'):
+                # Le chemin peut être entre guillemets (commandes produites par le routeur d'intentions)
+                new_dir = os.path.expanduser(" ".join(shlex.split(command[2:])))
+                if not new_dir:
+                    new_dir = os.path.expanduser('~')
+                
+                # Gérer les chemins relatifs et absolus
+                if not os.path.isabs(new_dir):
+                    new_dir = os.path.join(self.current_directory, new_dir)
+                
+                # Vérifier si le répertoire existe
+                if os.path.isdir(new_dir):
+                    self.current_directory = os.path.abspath(new_dir)
+                    os.chdir(self.current_directory)
+                    self.executor.call_in_main(self.update_prompt)  # Mettre à jour le prompt
+                    print(f"Répertoire courant : {self.current_directory}")
+                    return True
+                print(f"Erreur : Le répertoire {new_dir} n'existe pas")
+                return False
+
+            # Pour les autres commandes, la sortie est affichée au fil de l'exécution
+            view = self.command_output_view()
+            try:
+                result = run_command(
+                    command,
+                    cwd=self.current_directory,
+                    on_output=view.write,
+                    timeout=get_command_timeout(),
+                    cancel=cancel
+                )
+            finally:
+                view.finish()
+            self.show_command_status(result, view=view)
+            return result
+
+        except OperationCancelled:
+            raise
+        except Exception as e:
+            print(f"Erreur lors de l'exécution de la commande : {str(e)}")
+
+    def execute_in_shell(self, command: str, cancel: Optional[CancelToken] = None, label: str = "") -> CommandResult:
+        """Exécute une commande dans le shell persistant et suit son répertoire courant"""
+        view = self.command_output_view(label)
+        try:
+            result = self.shell.run(command, on_output=view.write, timeout=get_command_timeout(), cancel=cancel)
+        finally:
+            view.finish()
+        self.show_command_status(result, label, view)
+        if self.shell.cwd != self.current_directory and os.path.isdir(self.shell.cwd):
+            self.current_directory = self.shell.cwd
+            os.chdir(self.current_directory)
+            self.executor.call_in_main(self.update_prompt)
+        return result
+
+    def set_input(self, text: str):
+        self.input_entry.delete(0, "end")
+        self.input_entry.insert(0, text)
+        self.input_entry.icursor("end")
+
+    def history_previous(self, event=None):
+        """Rappelle la demande précédente de l'historique (filtrée par le texte saisi)"""
+        if self.history_index == -1:
+            self.history_query = self.input_entry.get()
+            self.history_matches = get_command_history().search(self.history_query, limit=200)
+        if self.history_index + 1 < len(self.history_matches):
+            self.history_index += 1
+            self.set_input(self.history_matches[self.history_index])
+        self.show_suggestion(None)
+        return "break"
+
+    def history_next(self, event=None):
+        """Revient vers les demandes plus récentes, puis au texte saisi"""
+        if self.history_index >= 0:
+            self.history_index -= 1
+            self.set_input(self.history_matches[self.history_index] if self.history_index >= 0 else self.history_query)
+        return "break"
+
+    def update_suggestion(self, event=None):
+        """Cherche dans l'historique une demande qui prolonge la saisie"""
+        if event is not None and event.keysym in ("Up", "Down", "Tab", "Right", "Return", "Escape"):
+            return
+        self.history_index = -1
+        text = self.input_entry.get()
+        self.show_suggestion(get_command_history().complete(text) if text.strip() else None)
+
+    def show_suggestion(self, suggestion: Optional[str]):
+        self.suggestion = suggestion
+        self.suggestion_label.configure(text=f"↹ {suggestion}" if suggestion else "")
+
+    def accept_suggestion(self, event=None):
+        """Complète la saisie avec la suggestion (→ ne complète qu'en fin de saisie)"""
+        if not self.suggestion:
+            return "break" if event is None or event.keysym == "Tab" else None
+        if event is not None and event.keysym == "Right" and self.input_entry.index("insert") < len(self.input_entry.get()):
+            return None
+        self.set_input(self.suggestion)
+        self.show_suggestion(None)
+        return "break"
+
+    def process_gui_command(self, event=None):
+        """Traite la commande entrée dans l'interface graphique"""
+        command = self.input_entry.get().strip()
+        if not command:
+            return
+
+        # Effacer le champ de saisie
+        self.input_entry.delete(0, "end")
+        self.show_suggestion(None)
+        self.history_index = -1
+
+        # Une commande du shell attend une saisie : la lui transmettre
+        if self.shell is not None and self.shell.busy:
+            print(escape(f"< {command}"))
+            self.shell.send_input(command + "\n")
+            return
+
+        # Afficher la commande entrée
+        print(f"> {command}")
+
+        # Vérifier si c'est une salutation
+        if self.is_greeting(command):
+            print(f"AI: {self.get_greeting_response(command)}")
+            return
+
+        # Une demande identique déjà en cours (double validation) n'est ni renvoyée au modèle ni réexécutée
+        shell = self.is_shell_command(command)
+        if not shell and self.llm_requests.coalesce(command):
+            print("(demande identique déjà en cours)")
+            return
+
+        # Le reste (IA, commandes shell) s'exécute en arrière-plan
+        job = self.executor.submit(command, lambda cancel: self.run_gui_command(command, cancel), self.on_job_done)
+        if job is None:
+            print("Erreur: trop de commandes en attente")
+        elif not shell:
+            # Les demandes précédentes encore sans réponse sont devenues obsolètes
+            self.llm_requests.add(command, job)
+
+    def run_gui_command(self, command: str, cancel: CancelToken):
+        """
+        Exécute une commande de l'interface graphique (appelé hors du thread Tk)
+        """
+        start = time.perf_counter()
+        with get_metrics().span("request", interface="gui") as attrs:
+            # Vérifier si c'est une commande shell directe
+            if self.is_shell_command(command):
+                attrs["source"] = "shell"
+                result = self.execute_shell_command(command, cancel)
+                get_command_history().record(
+                    command, [command], "shell", history_exit_code([result]), time.perf_counter() - start, self.current_directory
+                )
+                return
+
+            # Les demandes courantes sont traduites localement, sans appel au modèle
+            intent = get_intent_router().route(command)
+            if intent and intent.intent == "cd":
+                # Le répertoire de l'interface ne change qu'en passant par le shell de l'interface
+                self.llm_requests.mark_started(cancel)
+                attrs["source"] = "intent"
+                print(f"AI: {intent.commands[0]}")
+                result = self.execute_shell_command(intent.commands[0], cancel)
+                get_command_history().record(
+                    command, intent.commands, "intent", history_exit_code([result]), time.perf_counter() - start, self.current_directory
+                )
+                return
+
+            # Les commandes démarrent dès la fermeture de leur bloc, pendant la fin de la réponse
+            # (l'une après l'autre dans le shell persistant, qui n'en exécute qu'une à la fois)
+            workers = 1 if self.shell is not None else get_command_workers()
+            pipeline = CommandPipeline(
+                lambda index, cmd: self.execute_command(cmd, cancel, f"[{index + 1}] " if workers > 1 else ""),
+                workers,
+                cancel=cancel,
+                cwd=self.current_directory
+            )
+            failed = False
+            try:
+                # Une demande déjà résolue avec succès réutilise les mêmes commandes
+                reused = None if intent or not history_reuse_enabled() else get_command_history().resolve(command)
+                if intent or reused:
+                    self.llm_requests.mark_started(cancel)
+                if intent:
+                    attrs["source"] = "intent"
+                    commands = intent.commands
+                    print(f"AI: {' ; '.join(commands)}")
+                elif reused:
+                    attrs["source"] = "history"
+                    commands = reused
+                    print(f"AI (historique): {' ; '.join(commands)}")
+                else:
+                    # Sinon, traiter comme une requête à l'IA (réponse affichée au fil de l'eau)
+                    attrs["source"] = "llm"
+                    info = {}
+                    print("AI: ", end="")
+                    parser = CommandStreamParser()
+                    early = config("WHIZTERM_EARLY_EXECUTION", "1") != "0"
+                    partial_line = []
+
+                    def on_token(token: str):
+                        commands = parser.feed(token) if early else []
+                        if pipeline.commands or commands:
+                            # Des commandes affichent leur sortie : n'afficher que des lignes complètes
+                            text = "".join(partial_line) + token
+                            complete, newline, rest = text.rpartition("\n")
+                            partial_line[:] = [rest]
+                            if newline:
+                                self.stream_to_output(complete + "\n")
+                        else:
+                            self.stream_to_output(token)
+                        if commands:
+                            # Les commandes démarrent : la demande ne peut plus être remplacée
+                            self.llm_requests.mark_started(cancel)
+                        for cmd in commands:
+                            pipeline.submit(cmd)
+
+                    self.llm_requests.acquire(cancel, lambda: print("(trop de requêtes en cours, attente d'une place) ", end=""))
+                    try:
+                        response = self.ask_ai(command, on_token=on_token, cancel=cancel, info=info)
+                    finally:
+                        self.llm_requests.release(cancel)
+                    print(escape("".join(partial_line)))
+                    failed = response is None
+                    commands = [] if failed else extract_commands(response)
+
+                # Exécuter les commandes qui n'ont pas déjà démarré (les indépendantes en parallèle)
+                for cmd in commands[len(pipeline.commands):]:
+                    pipeline.submit(cmd)
+            finally:
+                plan = pipeline.finish()
+            if failed:
+                # Requête au modèle en échec : rien à enregistrer dans l'historique
+                return
+            exit_code = history_exit_code(plan["results"])
+            get_command_history().record(
+                command, commands, attrs["source"], exit_code, time.perf_counter() - start, self.current_directory
+            )
+            # Une réponse dont les commandes ont réussi sert aux demandes formulées autrement
+            if attrs["source"] == "llm" and exit_code == 0 and not failed and "model" in info:
+                remember_validated_response(GUI_SYSTEM_PROMPT, info["model"], command, response)
+            if len(commands) > 1:
+                print(f"{len(commands)} commandes en {plan['duration']:.2f} s (cumulé : {plan['serial_duration']:.2f} s), {plan['failed']} échec(s)")
+
+    def on_job_done(self, job: BackgroundJob, result, error: Optional[BaseException]):
+        """Appelé dans le thread Tk à la fin d'une tâche"""
+        self.llm_requests.remove(job.description, job)
+        if job.superseded:
+            print(f"\nRemplacée par une demande plus récente : {escape(job.description)}")
+        elif isinstance(error, OperationCancelled) or (error is not None and job.cancel.cancelled):
+            print(f"\nAnnulé : {job.description}")
+        elif error is not None:
+            print(f"Erreur: {str(error)}")
+
+    def stream_to_output(self, token: str):
+        """Affiche un fragment de la réponse de l'IA dès sa réception"""
+        print(escape(token), end="")
+
+    def command_output_view(self, label: str = "") -> CommandOutputView:
+        """Affichage de la sortie d'une commande, limité à WHIZTERM_OUTPUT_LINES lignes"""
+        return CommandOutputView(label, max_lines=int(config("WHIZTERM_OUTPUT_LINES", "300")))
+
+    def open_log(self, path: str):
+        """Ouvre un journal de sortie complète avec l'application par défaut"""
+        try:
+            subprocess.Popen(["open" if sys.platform == "darwin" else "xdg-open", path],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError as e:
+            print(f"Erreur : impossible d'ouvrir {escape(path)} ({escape(str(e))})")
+
+    def show_command_status(self, result: CommandResult, label: str = "", view: Optional[CommandOutputView] = None):
+        """Affiche le bilan d'une commande terminée (et les journaux de sortie complète)"""
+        if view is not None:
+            view.finish(result)
+        label = escape(label)
+        if result.timed_out:
+            print(f"{label}Erreur : délai dépassé, commande interrompue après {result.duration:.1f} s")
+        elif result.returncode != 0:
+            print(f"{label}Erreur : code {result.returncode} ({result.duration:.2f} s)")
+        elif label or (not result.stdout_bytes and not result.stderr_bytes):
+            print(f"{label}Succès")
+
+    def execute_command(self, command: str, cancel: Optional[CancelToken] = None, label: str = "") -> Optional[CommandResult]:
+        """Exécute une commande et affiche le résultat (chaque ligne précédée de label)"""
+        try:
+            # Nettoyer la commande des backticks
+            command = command.strip('`')
+            
+            # Vérifier si la commande nécessite des droits administrateur
+            if any(cmd in command.lower() for cmd in ['sudo', 'brew']):
+                command = command.replace('sudo ', '')
+            
+            # Exécuter la commande en affichant la sortie au fil de l'exécution
+            if label:
+                print(escape(f"{label}{command}"))
+            if self.shell is not None:
+                # Variables exportées, alias et cd du shell persistant valent aussi pour les commandes de l'IA
+                try:
+                    return self.execute_in_shell(command, cancel, label)
+                except OSError as e:
+                    print(f"Shell persistant indisponible ({str(e)}), exécution commande par commande")
+                    self.shell = None
+            view = self.command_output_view(label)
+            try:
+                result = run_command(
+                    command,
+                    cwd=self.current_directory,
+                    on_output=view.write,
+                    timeout=get_command_timeout(),
+                    cancel=cancel
+                )
+            finally:
+                view.finish()
+            self.show_command_status(result, label, view)
+            return result
+
+        except OperationCancelled:
+            raise
+        except Exception as e:
+            print(f"{escape(label)}Erreur: {str(e)}")
+            return None
+
+    def is_shell_command(self, command: str) -> bool:
+        """
+        Vérifie si la commande est une commande shell directe
+        """
+        shell_commands = {
+            'ls', 'cd', 'pwd', 'mkdir', 'rm', 'cp', 'mv', 'cat', 'echo', 'grep',
+            'export', 'unset', 'alias', 'source'
+        }
+        first_word = command.strip().split()[0]
+        return first_word in shell_commands or '/' in command or '.' in command
+
+    def ask_ai(
+        self,
+        prompt: str,
+        on_token: Optional[Callable[[str], None]] = None,
+        cancel: Optional[CancelToken] = None,
+        info: Optional[dict] = None
+    ) -> Optional[str]:
+        """
+        Envoie une requête à l'API Ollama et retourne la réponse
+        Si on_token est fourni, chaque fragment est transmis dès sa réception
+        Le modèle qui a répondu est ajouté à info (model)
+        En cas d'échec, l'erreur est affichée et None est retourné : aucune commande
+        ne doit être tirée d'un message d'erreur
+        """
+        try:
+            result = generate_response(
+                GUI_SYSTEM_PROMPT, prompt, None, on_token,
+                label="Utilisateur", cancel=cancel, session=self.chat_session
+            )
+            if info is not None:
+                info["model"] = result["model"]
+            if result["semantic"]:
+                print(f"\n(réponse validée pour « {escape(result['semantic']['text'])} », similarité {result['semantic']['similarity']:.0%})", end="")
+            elif on_token is not None and not result["cached"] and result["ttft"] is not None:
+                fallback = ", repli sollicité" if result["hedged"] else ""
+                print(f"\n(premier token : {result['ttft'] * 1000:.0f} ms, {escape(result['model'])}{fallback})", end="")
+            return result["response"]
+        except OperationCancelled:
+            raise
+        except requests.exceptions.ConnectionError:
+            error = "Erreur: Ollama n'est pas en cours d'exécution"
+        except Exception as e:
+            error = f"Erreur: {str(e)}"
+
+        # Affichée directement : transmise à on_token, elle passerait par l'extraction des commandes
+        print(escape(error))
+        return None
+
+    def is_greeting(self, text: str) -> bool:
+        """Vérifie si le texte est une salutation simple"""
+        greetings = {
+            'salut', 'bonjour', 'hello', 'hi', 'hey', 'coucou',
+            'bonsoir', 'yo', 'hola', 'ola'
+        }
+        return text.lower().strip() in greetings
+
+    def get_greeting_response(self, text: str) -> str:
+        """Retourne une réponse simple pour les salutations"""
+        return "Salut ! Comment puis-je vous aider ?"
+
+def run_gui():
+    """Lance l'interface graphique"""
+    gui_app = App()
+    gui_app.mainloop()
+
+if __name__ == "__main__":
+    run_gui()
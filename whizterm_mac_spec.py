@@ -7,7 +7,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('.env', '.')],
-    hiddenimports=['typer', 'rich', 'requests', 'dotenv', 'python-dotenv'],
+    hiddenimports=['typer', 'rich', 'requests', 'dotenv', 'python-dotenv', 'whizterm_client', 'whizterm_core', 'whizterm_gui'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],